@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from feature_store import load_features
+from indicators import IndicatorEngine, BatchIndicatorEngine
+from forecaster import model_name, learner_for
+from model_registry import ModelRegistry
+from paginated_reader import read_frame, OHLCV_FIELDS
+from train_scheduler import run_training
+from predict_master import (supabase, bucket_name, interval_to_table, targets, model_mode, adjust_predictions,
+                            forecast_rows, model_cache)
+
+###----------------------------------------------------------------------------------
+# Backtest walk-forward vectorisé des prédictions pred_*
+# Rejoue la logique de predict_batch (rollout récursif, translation adjust_predictions,
+# KPI de la bougie simulée via append()) depuis chaque bougie historique de la
+# fenêtre, mais en lot : au pas h, les N origines passent en un seul appel de modèle
+# et un seul BatchIndicatorEngine.append(). Timeframes en parallèle (threads).
+# Hors échantillon : les modèles évalués sont entraînés sur des bougies antérieures à
+# la fenêtre (version de l'historique du registre, ou modèle de backtest ad hoc).
+# Sorties par horizon : MAE / MAPE du close, taux de bonne direction (close prédit vs
+# close de l'origine). Option "stored" : score des lignes déjà écrites dans pred_*.
+###----------------------------------------------------------------------------------
+
+WINDOW_DAYS = int(os.environ.get("P3_BACKTEST_DAYS", "365"))
+# Lignes par appel de modèle (borne la mémoire des prédictions intermédiaires)
+CHUNK_ROWS = 20_000
+# Historique minimal d'une origine (predict_master lit les 200 dernières lignes)
+MIN_HISTORY = 200
+# Lignes d'entraînement des modèles de backtest (comme train_all_models)
+MAX_TRAIN_ROWS = 500_000
+
+###----------------------------------------------------------------------------------
+# Modèles : versions courantes du registre, sous forme native (sklearn)
+# Sur des lots de dizaines de milliers de lignes, le parcours Cython de sklearn est
+# plusieurs fois plus rapide que CompiledForest (optimisé pour une seule ligne) ;
+# les prédictions sont identiques.
+###----------------------------------------------------------------------------------
+registry = ModelRegistry(supabase, bucket_name)
+_models = {}
+# Verrou des entraînements ad hoc (un seul pool de processus à la fois)
+_fit_lock = threading.Lock()
+
+
+def served_learner(table):
+    return learner_for(table, published=model_cache.learners())
+
+
+def load_model(table, target=None):
+    name = model_name(table, target, served_learner(table))
+    if name not in _models:
+        _models[name] = registry.load(name)
+    return _models[name]
+
+
+def _utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _model_targets():
+    return [None] if model_mode == "multi" else list(targets)
+
+
+###----------------------------------------------------------------------------------
+# Modèles hors échantillon : tous entraînés sur des bougies antérieures à la fenêtre
+# 1. version promue de l'historique du registre dont training_window.end précède `start`
+# 2. sinon (registre plus jeune que la fenêtre) : modèle ad hoc, mêmes apprenant et
+#    paramètres, entraîné sur les lignes antérieures à `start` (non publié)
+###----------------------------------------------------------------------------------
+def registry_models(table, start):
+    """{cible: modèle} des dernières versions promues entraînées avant `start`, ou None."""
+    learner = served_learner(table)
+    index = registry.index()
+    models, ends = {}, []
+    for target in _model_targets():
+        name = model_name(table, target, learner)
+        for version in reversed((index.get(name) or {}).get("history", [])):
+            end = _utc(registry.manifest(name, version)["training_window"]["end"])
+            if end < start:
+                models[target] = registry.load(name, version)
+                ends.append(end)
+                break
+        else:
+            return None
+    return models, max(ends)
+
+
+def fit_models(table, df, start):
+    """{cible: modèle} entraînés comme train_all_models, sur les seules lignes antérieures à `start`."""
+    data = df[df["date"] < start].dropna().copy()
+    for col in OHLCV_FIELDS:
+        data[f"shifted_{col}"] = data[col].shift(-1)
+    data = data.dropna().tail(MAX_TRAIN_ROWS)
+    features = data.drop(columns=["date"] + targets).replace([np.inf, -np.inf], np.nan).dropna().astype(np.float32)
+    if len(features) < MIN_HISTORY:
+        raise ValueError(f"⛔ {table} : {len(features)} ligne(s) avant le {start:%Y-%m-%d %H:%M}, "
+                         f"trop peu pour entraîner un modèle de backtest")
+    learner = served_learner(table)
+    with _fit_lock:
+        results = run_training({table: (features, data[targets].loc[features.index])}, targets,
+                               multi=model_mode == "multi", learners=lambda _: learner)
+    return {r["target"]: r["model"] for r in results}, _utc(data["date"].loc[features.index].max())
+
+
+def backtest_models(table, df, start):
+    """Retourne ({cible: modèle}, fin d'entraînement, provenance)."""
+    found = registry_models(table, start)
+    if found is not None:
+        return (*found, "du registre")
+    print(f"ℹ️ {table} : aucune version du registre antérieure au {start:%Y-%m-%d %H:%M}, "
+          f"entraînement d'un modèle de backtest")
+    return (*fit_models(table, df, start), "de backtest")
+
+
+def predict_arrays(table, X, models=None):
+    """Prédictions de toutes les cibles pour les lignes de X : {cible: tableau (n,)}."""
+    model_for = (lambda target=None: load_model(table, target)) if models is None else models.get
+    X = X.replace([np.inf, -np.inf], np.nan).fillna(0)
+    if model_mode == "multi":
+        model = model_for(None)
+        out = np.vstack([np.atleast_2d(model.predict(X.iloc[i:i + CHUNK_ROWS])) for i in range(0, len(X), CHUNK_ROWS)])
+        return {target: out[:, j] for j, target in enumerate(model.targets)}
+    return {target: np.concatenate([np.asarray(model_for(target).predict(X.iloc[i:i + CHUNK_ROWS])).reshape(-1)
+                                    for i in range(0, len(X), CHUNK_ROWS)])
+            for target in targets}
+
+
+def rollout(table, df, origins, steps, timings=None, models=None):
+    """
+    Rollout de `steps` bougies depuis chaque position de `origins` (df : date + OHLCV + features,
+    bougies clôturées). models : {cible: modèle} (défaut : versions courantes du registre).
+    Retourne {champ: tableau (steps, N)} des bougies prédites.
+    """
+    timings = timings if timings is not None else {"features": 0.0, "inference": 0.0}
+    columns = [c for c in df.columns if c != "date"]
+    t0 = time.perf_counter()
+    engine = BatchIndicatorEngine.from_history(df[OHLCV_FIELDS], origins)
+    X = df[columns].iloc[origins].reset_index(drop=True)
+    last_real = {"close": df["close"].to_numpy()[origins]}
+    timings["features"] += time.perf_counter() - t0
+
+    predicted = {field: np.empty((steps, len(origins))) for field in OHLCV_FIELDS}
+    for h in range(steps):
+        t0 = time.perf_counter()
+        pred_values = predict_arrays(table, X, models)
+        timings["inference"] += time.perf_counter() - t0
+
+        # adjust_predictions est purement arithmétique : appliquée telle quelle aux tableaux
+        corrected = adjust_predictions(pred_values, last_real)
+        for field in OHLCV_FIELDS:
+            predicted[field][h] = corrected[field]
+        last_real = corrected
+
+        t0 = time.perf_counter()
+        X = pd.DataFrame(engine.append(corrected))[columns]
+        timings["features"] += time.perf_counter() - t0
+    return predicted
+
+
+def horizon_metrics(df, origins, predicted, delta_time):
+    """Erreurs par horizon contre les bougies réelles (alignées sur la date)."""
+    dates = pd.DatetimeIndex(df["date"])
+    close = df["close"].to_numpy()
+    base = close[origins]
+    rows = []
+    for h in range(predicted["close"].shape[0]):
+        idx = dates.get_indexer(dates[origins] + (h + 1) * delta_time)
+        valid = idx >= 0
+        pred, actual, ref = predicted["close"][h][valid], close[idx[valid]], base[valid]
+        moved = actual != ref
+        rows.append({
+            "horizon": h + 1,
+            "n": int(valid.sum()),
+            "mae": float(np.mean(np.abs(pred - actual))),
+            "mape": float(np.mean(np.abs(pred - actual) / np.abs(actual))),
+            "hit_rate": float(np.mean(np.sign(pred[moved] - ref[moved]) == np.sign(actual[moved] - ref[moved]))),
+        })
+    return pd.DataFrame(rows).set_index("horizon")
+
+
+def prepare_backtest(table, days=WINDOW_DAYS):
+    """Features de la table, début de la fenêtre et modèles entraînés avant elle."""
+    t0 = time.perf_counter()
+    df, _ = load_features(supabase, table)
+    df = df.reset_index(drop=True)
+    fetch_s = time.perf_counter() - t0
+
+    start = _utc(df["date"].iloc[-1] - pd.Timedelta(days=days))
+    t0 = time.perf_counter()
+    models, trained_until, source = backtest_models(table, df, start)
+    return {"df": df, "start": start, "models": models, "trained_until": trained_until, "source": source,
+            "timings": {"fetch": fetch_s, "models": time.perf_counter() - t0}}
+
+
+def backtest(table, days=WINDOW_DAYS, stride=1, prepared=None):
+    """Backtest d'une table sur les `days` derniers jours ; retourne (métriques par horizon, durées)."""
+    pred_table, delta_time, steps = interval_to_table[table]
+    prepared = prepared or prepare_backtest(table, days)
+    df, trained_until = prepared["df"], prepared["trained_until"]
+    timings = {**prepared["timings"], "features": 0.0, "inference": 0.0, "metrics": 0.0}
+
+    # Hors échantillon : toute origine est postérieure à la dernière bougie d'entraînement
+    dates = df["date"].dt.tz_convert("UTC") if df["date"].dt.tz is not None else df["date"].dt.tz_localize("UTC")
+    origins = np.flatnonzero(((dates >= prepared["start"]) & (dates > trained_until)).to_numpy())[::stride]
+    # Dernière origine : au moins une bougie réelle après elle
+    origins = origins[(origins >= MIN_HISTORY - 1) & (origins < len(df) - 1)]
+    if not len(origins):
+        raise ValueError(f"⛔ {table} : aucune origine hors échantillon (modèles entraînés jusqu'au "
+                         f"{trained_until.isoformat()}, dernière bougie {df['date'].iloc[-1]})")
+
+    predicted = rollout(table, df, origins, steps, timings, prepared["models"])
+
+    t0 = time.perf_counter()
+    metrics = horizon_metrics(df, origins, predicted, delta_time)
+    timings["metrics"] = time.perf_counter() - t0
+    timings["origins"] = len(origins)
+    timings["trained_until"] = trained_until
+    timings["source"] = prepared["source"]
+    return metrics, timings
+
+
+###----------------------------------------------------------------------------------
+# Score des prédictions déjà écrites dans pred_*
+###----------------------------------------------------------------------------------
+def score_stored(table, days=WINDOW_DAYS):
+    """
+    Compare les lignes de pred_* aux bougies réelles de même date. Chaque date ne garde
+    que la dernière prédiction écrite (upsert) : l'horizon d'origine n'est pas connu.
+    """
+    pred_table, delta_time, _ = interval_to_table[table]
+    df, _ = load_features(supabase, table)
+    start = df["date"].iloc[-1] - pd.Timedelta(days=days)
+    stored = read_frame(supabase, pred_table, start=start.isoformat(), fields=OHLCV_FIELDS)
+    if stored.empty:
+        return {"n": 0}
+    stored["date"] = pd.to_datetime(stored["date"]).dt.tz_localize("UTC")
+
+    actual = df.set_index("date")["close"]
+    joined = stored.join(actual.rename("actual"), on="date").join(
+        actual.rename("previous"), on=stored["date"] - delta_time).dropna(subset=["actual", "previous"])
+    if joined.empty:
+        return {"n": 0}
+    error = (joined["close"] - joined["actual"]).abs()
+    moved = joined["actual"] != joined["previous"]
+    return {
+        "n": len(joined),
+        "mae": float(error.mean()),
+        "mape": float((error / joined["actual"].abs()).mean()),
+        "hit_rate": float((np.sign(joined["close"] - joined["previous"])[moved]
+                           == np.sign(joined["actual"] - joined["previous"])[moved]).mean()),
+    }
+
+
+###----------------------------------------------------------------------------------
+# Vérification : rollout vectorisé == forecast_rows de predict_master, origine par origine
+###----------------------------------------------------------------------------------
+def verify(table, n_origins=5):
+    pred_table, delta_time, steps = interval_to_table[table]
+    candles, _ = load_features(supabase, table)
+    history = candles[["date"] + OHLCV_FIELDS].reset_index(drop=True)
+    df = IndicatorEngine().compute(history.copy())
+    origins = np.linspace(MIN_HISTORY - 1, len(df) - 1, n_origins).astype(int)
+    predicted = rollout(table, df, origins, steps)
+
+    for i, origin in enumerate(origins):
+        engine = IndicatorEngine()
+        block = engine.compute(history.iloc[:origin + 1].copy()).tail(MIN_HISTORY).reset_index(drop=True)
+        rows = forecast_rows(table, block, engine, delta_time, steps)
+        for field in OHLCV_FIELDS:
+            np.testing.assert_allclose(predicted[field][:, i], [row[field] for row in rows], rtol=1e-9,
+                                       err_msg=f"{table} {field} (origine {origin})")
+    print(f"✅ {table} : rollout vectorisé identique à forecast_rows ({n_origins} origines × {steps} pas)")
+
+
+def print_report(table, metrics, timings):
+    print(f"\n📈 Backtest {table} : {timings['origins']} origines | modèles {timings['source']} entraînés jusqu'au "
+          f"{timings['trained_until']:%Y-%m-%d %H:%M} | chargement {timings['fetch']:.2f}s | "
+          f"modèles {timings['models']:.2f}s | features {timings['features']:.2f}s | "
+          f"inférence {timings['inference']:.2f}s")
+    print(f"   {'horizon':>7}{'n':>8}{'MAE':>12}{'MAPE':>10}{'direction':>11}")
+    for h, row in metrics.iterrows():
+        print(f"   {h:>7}{int(row['n']):>8}{row['mae']:>12.2f}{row['mape']:>10.3%}{row['hit_rate']:>11.1%}")
+
+
+if __name__ == "__main__":
+    # python backtester.py [jours] | stored [jours] | verify
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else "run"
+    args = [a for a in sys.argv[1:] if a.isdigit()]
+    days = int(args[0]) if args else WINDOW_DAYS
+
+    if command == "verify":
+        for table in interval_to_table:
+            verify(table)
+        sys.exit(0)
+
+    if command == "stored":
+        for table, (pred_table, _, _) in interval_to_table.items():
+            score = score_stored(table, days)
+            if not score["n"]:
+                print(f"⚠️ {pred_table} : aucune prédiction stockée comparable")
+                continue
+            print(f"📋 {pred_table} : {score['n']} ligne(s) | MAE {score['mae']:.2f} | MAPE {score['mape']:.3%} | "
+                  f"direction {score['hit_rate']:.1%}")
+        sys.exit(0)
+
+    t_cycle = time.perf_counter()
+    # Modèles résolus d'abord, table par table (entraînements ad hoc : pool de processus),
+    # puis rollouts des timeframes en parallèle
+    prepared = {}
+    for table in interval_to_table:
+        try:
+            prepared[table] = prepare_backtest(table, days)
+        except ValueError as e:
+            print(f"\n{e}")
+    with ThreadPoolExecutor(max_workers=max(1, len(prepared))) as pool:
+        futures = {table: pool.submit(backtest, table, days, 1, setup) for table, setup in prepared.items()}
+        for table, future in futures.items():
+            try:
+                print_report(table, *future.result())
+            except ValueError as e:
+                print(f"\n{e}")
+    print(f"\n⏱️ Backtest complet : {time.perf_counter() - t_cycle:.2f}s")
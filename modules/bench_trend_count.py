@@ -0,0 +1,100 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from trend_supabase import compute_trend_count
+
+###----------------------------------------------------------------------------------
+# Équivalence + benchmark de compute_trend_count (vectorisée) vs boucle historique
+# Usage : python bench_trend_count.py [taille1 taille2 ...]   (défaut : 1M et 10M)
+###----------------------------------------------------------------------------------
+
+# Au-delà, la boucle historique est extrapolée linéairement (plusieurs minutes sinon)
+LEGACY_MAX_ROWS = 1_000_000
+
+
+def compute_trend_count_loop(df, start_id=0):
+    """Implémentation historique (référence pour l'équivalence)."""
+    trend_ids = [start_id]
+    trend_count = [0]
+    current_id = start_id
+    current_count = 0
+    last_direction = None
+
+    for i in range(1, len(df)):
+        prev_close = df["close"].iloc[i - 1]
+        curr_close = df["close"].iloc[i]
+
+        if curr_close > prev_close:
+            direction = 1
+        elif curr_close < prev_close:
+            direction = -1
+        else:
+            direction = last_direction if last_direction is not None else 0
+
+        if direction != last_direction and last_direction is not None:
+            current_id += 1
+            current_count = 0
+
+        if direction == last_direction:
+            current_count += 1
+        else:
+            current_count = 0
+
+        trend_ids.append(current_id)
+        trend_count.append(current_count)
+        last_direction = direction
+
+    df["trend_id"] = trend_ids
+    df["trend_count"] = trend_count
+    return df
+
+
+def make_closes(n, seed=42):
+    """Marche aléatoire arrondie avec paliers plats (variations nulles fréquentes)."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 5, n)
+    steps[rng.random(n) < 0.2] = 0.0
+    return np.round(60_000 + np.cumsum(steps), 1)
+
+
+def check_equivalence():
+    cases = {
+        "une bougie": [100.0],
+        "deux bougies": [100.0, 101.0],
+        "plat initial": [100.0, 100.0, 100.0, 101.0, 101.0, 99.0],
+        "tout plat": [5.0] * 6,
+        "alternance": [1.0, 2.0, 1.0, 2.0, 1.0],
+        "marche aléatoire": list(make_closes(5_000, seed=7)),
+    }
+    for name, closes in cases.items():
+        for start_id in (0, 1, 42):
+            expected = compute_trend_count_loop(pd.DataFrame({"close": closes}), start_id)
+            got = compute_trend_count(pd.DataFrame({"close": closes}), start_id)
+            assert expected["trend_id"].tolist() == got["trend_id"].tolist(), (name, start_id)
+            assert expected["trend_count"].tolist() == got["trend_count"].tolist(), (name, start_id)
+    print(f"✅ Équivalence vérifiée sur {len(cases)} jeux de données × 3 start_id")
+
+
+def bench(n):
+    df = pd.DataFrame({"close": make_closes(n)})
+
+    t0 = time.perf_counter()
+    compute_trend_count(df.copy(), start_id=1)
+    vectorised = time.perf_counter() - t0
+
+    legacy_rows = min(n, LEGACY_MAX_ROWS)
+    t0 = time.perf_counter()
+    compute_trend_count_loop(df.head(legacy_rows).copy(), start_id=1)
+    legacy = (time.perf_counter() - t0) * n / legacy_rows
+    estimated = " (extrapolé)" if legacy_rows < n else ""
+
+    print(f"📊 {n:>12,} lignes | boucle : {legacy:9.2f}s{estimated} | "
+          f"vectorisé : {vectorised:7.3f}s | gain ×{legacy / vectorised:,.0f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000, 10_000_000]
+    check_equivalence()
+    for n in sizes:
+        bench(n)
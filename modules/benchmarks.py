@@ -0,0 +1,241 @@
+import copy
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from synthetic_data import load_dataset
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Suite de benchmarks des chemins critiques du pipeline
+# Jeux figés (synthetic_data, seed fixe, mis en cache) ; pour chaque cas et chaque
+# taille : WARMUP exécutions ignorées, REPEATS exécutions chronométrées (min / médiane /
+# moyenne / écart-type), puis une exécution sous tracemalloc pour le pic mémoire
+# (allocations Python + NumPy). La préparation (copies, état initial) n'est pas mesurée.
+# Résultats JSON (commit, versions, machine) comparables entre commits :
+#   python benchmarks.py run [taille ...]          → {BENCH_DIR}/{commit}.json
+#   python benchmarks.py compare ancien.json nouveau.json
+# compare sort en erreur si une médiane (ou un pic mémoire) dépasse la référence de
+# plus de P3_BENCH_THRESHOLD (défaut 10 %).
+###----------------------------------------------------------------------------------
+
+BENCH_DIR = os.environ.get("P3_BENCH_DIR", os.path.join(STATE_DIR, "bench"))
+SIZES = [100_000, 1_000_000]
+WARMUP = 1
+REPEATS = int(os.environ.get("P3_BENCH_REPEATS", "5"))
+THRESHOLD = float(os.environ.get("P3_BENCH_THRESHOLD", "0.10"))
+# Les écarts sous ce seuil (s) relèvent du bruit de mesure
+MIN_SIGNIFICANT_S = 0.001
+PREDICT_TRAIN_ROWS = 100_000
+
+# Backend SQLite embarqué, fixé avant tout import de supabase_client (imports des cas
+# différés) : aucun benchmark ne touche Supabase
+os.environ["P3_BACKEND"] = "sqlite"
+os.environ.setdefault("P3_SQLITE_PATH", os.path.join(BENCH_DIR, "bench.sqlite"))
+
+
+###----------------------------------------------------------------------------------
+# Cas : setup(df) → arguments (non mesuré), run(*arguments) (mesuré)
+###----------------------------------------------------------------------------------
+def _trend_count():
+    from trend_supabase import compute_trend_count
+    return (lambda df: (df[["close"]].copy(),),
+            lambda frame: compute_trend_count(frame, start_id=1))
+
+
+def _trend_stats():
+    from trend_supabase import compute_trend_count, extract_trend_stats
+
+    def setup(df):
+        frame = compute_trend_count(df.copy(), start_id=1)
+        frame.attrs["interval"] = 1
+        return (frame,)
+    return setup, extract_trend_stats
+
+
+def _indicators():
+    # Cœur de add_primary_kpis (la fonction elle-même lit la base) : calcul vectorisé complet
+    from indicators import IndicatorEngine
+    return (lambda df: (df.copy(),),
+            lambda frame: IndicatorEngine().compute(frame))
+
+
+def _rollup(freq):
+    # Agrégation commune des update_btc_* (scripts non importables) via le moteur rollup
+    from rollup import aggregate, _floor
+    return (lambda df: (df,),
+            lambda frame: aggregate(frame, _floor(freq)))
+
+
+CASES = {
+    "trend_count": _trend_count,
+    "extract_trend_stats": _trend_stats,
+    "indicators": _indicators,
+    "rollup_15min": lambda: _rollup("15min"),
+    "rollup_1h": lambda: _rollup("1h"),
+    "rollup_1d": lambda: _rollup("1D"),
+}
+
+
+###----------------------------------------------------------------------------------
+# predict_batch : rollout de 10 bougies sur un bloc de 200 lignes (taille fixe)
+# Modèle multi-sorties entraîné une fois sur les bougies 15 min synthétiques et
+# compilé, comme le sert ModelCache. Seule l'écriture (upsert) n'est pas mesurée.
+###----------------------------------------------------------------------------------
+def _predict_case(minutes):
+    from datetime import timedelta
+    from compiled_forest import CompiledForest
+    from forecaster import MultiOutputForecaster, TARGETS, FOREST_PARAMS
+    from indicators import IndicatorEngine
+    from predict_master import forecast_rows
+    from rollup import aggregate, _floor
+
+    candles = aggregate(minutes, _floor("15min"))
+    engine = IndicatorEngine()
+    df = engine.compute(candles.copy())
+    features = df.drop(columns=["date"]).replace([np.inf, -np.inf], np.nan).fillna(0)
+    Y = pd.DataFrame({t: df[t.removeprefix("shifted_")].shift(-1) for t in TARGETS}).iloc[:-1]
+    model = MultiOutputForecaster(TARGETS, **FOREST_PARAMS).fit(features.iloc[:-1], Y)
+    compiled = CompiledForest.from_model(model)
+    block = df.tail(200).reset_index(drop=True)
+
+    def setup(_):
+        return (block.copy(), copy.deepcopy(engine))
+
+    def run(frame, state):
+        return forecast_rows("btc_t15", frame, state, timedelta(minutes=15), 10,
+                             predict=lambda table, X_last: compiled.predict_dict(X_last))
+    return setup, run
+
+
+###----------------------------------------------------------------------------------
+# Mesure
+###----------------------------------------------------------------------------------
+def measure(setup, run, df, warmup=WARMUP, repeats=REPEATS):
+    for _ in range(warmup):
+        run(*setup(df))
+    times = []
+    for _ in range(repeats):
+        args = setup(df)
+        t0 = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - t0)
+
+    args = setup(df)
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "repeats": repeats,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.mean(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def _commit():
+    try:
+        root = os.path.dirname(os.path.abspath(__file__))
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(sizes=SIZES, cases=None, out_path=None):
+    """Exécute la suite ; retourne et écrit les résultats JSON."""
+    commit = _commit()
+    results = {}
+    cases = cases or list(CASES) + ["predict_batch"]
+    print(f"🏁 Benchmarks @ {commit} | tailles {sizes} | {WARMUP} échauffement(s), {REPEATS} répétitions")
+    for n in sizes:
+        df = load_dataset(n).to_pandas()
+        for name in cases:
+            if name == "predict_batch":
+                continue
+            setup, run = CASES[name]()
+            r = measure(setup, run, df)
+            r["rows"] = n
+            r["rows_per_s"] = n / r["median_s"]
+            results[f"{name}@{n}"] = r
+            print(f"   {name:<22}{n:>12,}  médiane {r['median_s'] * 1000:>10.1f} ms  ± {r['stdev_s'] * 1000:>7.1f}  "
+                  f"pic {r['peak_mb']:>8.1f} Mo  {r['rows_per_s'] / 1e6:>7.2f} M lignes/s")
+
+    if "predict_batch" in cases:
+        # Jeu fixe de 100k minutes (~6.6k bougies 15 min) pour l'entraînement du modèle
+        setup, run = _predict_case(load_dataset(PREDICT_TRAIN_ROWS).to_pandas())
+        r = measure(setup, run, None)
+        r["rows"] = 10
+        results["predict_batch@10"] = r
+        print(f"   {'predict_batch':<22}{'10 pas':>12}  médiane {r['median_s'] * 1000:>10.1f} ms  ± "
+              f"{r['stdev_s'] * 1000:>7.1f}  pic {r['peak_mb']:>8.1f} Mo")
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeats": REPEATS,
+            "warmup": WARMUP,
+        },
+        "results": results,
+    }
+    out_path = out_path or os.path.join(BENCH_DIR, f"{commit}.json")
+    write_json(out_path, report, indent=2)
+    print(f"💾 Résultats : {out_path}")
+    return report
+
+
+def compare(base, new, threshold=THRESHOLD):
+    """Compare deux rapports ; retourne la liste des régressions (temps médian ou pic mémoire)."""
+    regressions = []
+    print(f"\n📊 {base['meta']['commit']} → {new['meta']['commit']} (seuil {threshold:.0%})")
+    print(f"   {'cas':<34}{'référence':>12}{'nouveau':>12}{'écart':>9}{'mémoire':>10}")
+    for key in sorted(set(base["results"]) & set(new["results"])):
+        old, cur = base["results"][key], new["results"][key]
+        ratio = cur["median_s"] / old["median_s"]
+        memory = cur["peak_mb"] / old["peak_mb"] if old["peak_mb"] else 1.0
+        slower = ratio > 1 + threshold and cur["median_s"] - old["median_s"] > MIN_SIGNIFICANT_S
+        heavier = memory > 1 + threshold
+        flag = "⛔" if slower or heavier else ("🚀" if ratio < 1 - threshold else "  ")
+        print(f"{flag} {key:<34}{old['median_s'] * 1000:>10.1f}ms{cur['median_s'] * 1000:>10.1f}ms"
+              f"{ratio - 1:>+9.0%}{memory - 1:>+10.0%}")
+        if slower or heavier:
+            regressions.append(key)
+    for key in sorted(set(base["results"]) ^ set(new["results"])):
+        print(f"   {key:<34} (présent dans un seul rapport)")
+    print(f"{'⛔' if regressions else '✅'} {len(regressions)} régression(s)")
+    return regressions
+
+
+if __name__ == "__main__":
+    # python benchmarks.py run [taille ...] | compare ancien.json nouveau.json [seuil]
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if command == "run":
+        run_suite([int(arg) for arg in sys.argv[2:]] or SIZES)
+    elif command == "compare":
+        with open(sys.argv[2], "r") as f:
+            base = json.load(f)
+        with open(sys.argv[3], "r") as f:
+            new = json.load(f)
+        threshold = float(sys.argv[4]) if len(sys.argv) > 4 else THRESHOLD
+        sys.exit(1 if compare(base, new, threshold) else 0)
+    else:
+        raise SystemExit(f"Commande inconnue : {command}")
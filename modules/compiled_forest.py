@@ -0,0 +1,194 @@
+import json
+import os
+import time
+import joblib
+import numpy as np
+
+###----------------------------------------------------------------------------------
+# Forêts compilées : inférence à plat sur tableaux NumPy
+# Tous les arbres d'une forêt sont concaténés en tableaux de nœuds (feature, seuil,
+# enfants, valeur, sens des valeurs manquantes). Le parcours est vectorisé sur
+# (lignes × arbres), une itération par niveau de profondeur : pas de validation
+# sklearn ni de dispatch joblib, ce qui domine le coût d'une prédiction d'une ligne.
+# Sorties identiques bit à bit à sklearn : X en float32 comparé aux seuils float64,
+# somme des arbres dans l'ordre (cumsum) puis division par le nombre d'arbres.
+# Les tableaux sont sauvés en .npy et relus en memory-map (copie partagée entre processus).
+###----------------------------------------------------------------------------------
+
+ARRAYS = ["feature", "threshold", "left", "right", "missing_left", "value", "roots"]
+
+
+class CompiledForest:
+    def __init__(self, arrays, meta):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.n_trees = meta["n_trees"]
+        self.n_outputs = meta["n_outputs"]
+        self.max_depth = meta["max_depth"]
+        self.feature_names = meta.get("feature_names")
+        self.targets = meta.get("targets")
+        # Standardisation des cibles (MultiOutputForecaster)
+        self.mean_ = np.asarray(meta["mean"]) if meta.get("mean") is not None else None
+        self.scale_ = np.asarray(meta["scale"]) if meta.get("scale") is not None else None
+
+    ###------------------------------------------------------------------------------
+    # Compilation
+    ###------------------------------------------------------------------------------
+    @classmethod
+    def from_model(cls, model):
+        """RandomForestRegressor (une ou plusieurs sorties) ou MultiOutputForecaster."""
+        forest = getattr(model, "forest", model)
+        feature, threshold, left, right, missing_left, value, roots = [], [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            nodes = tree.__getstate__()["nodes"]
+            n = len(nodes)
+            is_leaf = nodes["left_child"] == -1
+            idx = np.arange(offset, offset + n, dtype=np.int32)
+            # Feuilles : bouclent sur elles-mêmes, le parcours peut faire max_depth itérations sans test
+            left.append(np.where(is_leaf, idx, nodes["left_child"] + offset).astype(np.int32))
+            right.append(np.where(is_leaf, idx, nodes["right_child"] + offset).astype(np.int32))
+            feature.append(np.where(is_leaf, 0, nodes["feature"]).astype(np.int32))
+            threshold.append(nodes["threshold"].astype(np.float64))
+            missing_left.append(nodes["missing_go_to_left"].astype(bool) if "missing_go_to_left" in nodes.dtype.names
+                                else np.zeros(n, dtype=bool))
+            value.append(tree.value[:, :, 0].astype(np.float64))
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        arrays = {
+            "feature": np.concatenate(feature),
+            "threshold": np.concatenate(threshold),
+            "left": np.concatenate(left),
+            "right": np.concatenate(right),
+            "missing_left": np.concatenate(missing_left),
+            "value": np.concatenate(value),
+            "roots": np.asarray(roots, dtype=np.int32),
+        }
+        names = getattr(forest, "feature_names_in_", None)
+        meta = {
+            "n_trees": len(roots),
+            "n_outputs": int(forest.n_outputs_),
+            "max_depth": int(max_depth),
+            "feature_names": [str(c) for c in names] if names is not None else None,
+            "targets": getattr(model, "targets", None),
+            "mean": model.mean_.tolist() if getattr(model, "mean_", None) is not None else None,
+            "scale": model.scale_.tolist() if getattr(model, "scale_", None) is not None else None,
+        }
+        return cls(arrays, meta)
+
+    ###------------------------------------------------------------------------------
+    # Inférence
+    ###------------------------------------------------------------------------------
+    def _as_array(self, X):
+        columns = getattr(X, "columns", None)
+        if columns is not None and self.feature_names is not None and list(columns) != self.feature_names:
+            X = X[self.feature_names]
+        return np.asarray(X, dtype=np.float32)
+
+    def apply(self, X):
+        """Index global de la feuille atteinte : tableau (n_lignes, n_arbres)."""
+        X = self._as_array(X)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict(self, X):
+        # Somme séquentielle des arbres (même ordre d'accumulation que sklearn)
+        out = np.cumsum(self.value[self.apply(X)], axis=1)[:, -1] / self.n_trees
+        if self.mean_ is not None:
+            out = out * self.scale_ + self.mean_
+        return out[:, 0] if self.n_outputs == 1 else out
+
+    def predict_dict(self, X_last):
+        return dict(zip(self.targets, map(float, self.predict(X_last)[0])))
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    ###------------------------------------------------------------------------------
+    # Persistance (memory-mappable)
+    ###------------------------------------------------------------------------------
+    def save(self, path):
+        tmp = path + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+            os.rmdir(path)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(arrays, meta)
+
+
+def compile_model(model_path, out_path=None):
+    """Compile un .pkl joblib en répertoire de tableaux .npy (par défaut {model_path}.compiled)."""
+    out_path = out_path or model_path + ".compiled"
+    CompiledForest.from_model(joblib.load(model_path)).save(out_path)
+    return out_path
+
+
+###----------------------------------------------------------------------------------
+# Vérification d'exactitude + benchmark de latence
+###----------------------------------------------------------------------------------
+def benchmark(model, X, repeats=200):
+    """Compare sklearn et la forêt compilée : égalité exacte sur X, latence par ligne."""
+    compiled = CompiledForest.from_model(model)
+    expected, got = model.predict(X), compiled.predict(X)
+    if not np.array_equal(expected, got):
+        raise AssertionError(f"⛔ Écart sklearn / compilé : {np.max(np.abs(expected - got))}")
+
+    row = X.iloc[-1:] if hasattr(X, "iloc") else X[-1:]
+    timings = {}
+    for label, predict in [("sklearn", model.predict), ("compilé", compiled.predict)]:
+        predict(row)
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            predict(row)
+        timings[label] = (time.perf_counter() - t0) / repeats
+    print(f"✅ {len(X)} lignes identiques | 1 ligne : sklearn {timings['sklearn'] * 1e3:.2f} ms, "
+          f"compilé {timings['compilé'] * 1e3:.3f} ms (x{timings['sklearn'] / timings['compilé']:.0f}) | "
+          f"{compiled.nbytes / 1024 / 1024:.1f} Mo de nœuds")
+    return timings
+
+
+if __name__ == "__main__":
+    # python compiled_forest.py               → benchmark sur données synthétiques
+    # python compiled_forest.py modele.pkl …  → compilation de modèles existants
+    import sys
+    if sys.argv[1:]:
+        for path in sys.argv[1:]:
+            print(f"🛠️ {path} → {compile_model(path)}")
+        sys.exit(0)
+
+    from sklearn.ensemble import RandomForestRegressor
+    from indicators import make_candles, add_indicators
+    from forecaster import MultiOutputForecaster, TARGETS, FOREST_PARAMS
+
+    df, _ = add_indicators(make_candles(5_000))
+    for col in ["open", "high", "low", "close", "volume"]:
+        df[f"shifted_{col}"] = df[col].shift(-1)
+    df = df.replace([np.inf, -np.inf], np.nan).dropna()
+    X = df.drop(columns=TARGETS).astype(np.float32)
+
+    print("🌲 Forêt par cible (shifted_close)")
+    benchmark(RandomForestRegressor(**FOREST_PARAMS).fit(X, df["shifted_close"]), X)
+    print("🌲 Forêt multi-sorties")
+    benchmark(MultiOutputForecaster().fit(X, df[TARGETS]), X)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import indicators
+from indicators import IndicatorEngine, FEATURE_COLUMNS
+from paginated_reader import OHLCV_FIELDS
+from price_mirror import PriceMirror, sync_and_read
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Feature store matérialisé (Arrow IPC) partagé par l'entraînement et la prédiction
+# Par table : un répertoire versionné par le hash de la définition des features
+# (indicators.FEATURE_VERSION + paramètres + schéma),
+# contenant des segments Arrow (un par rafraîchissement) et un meta.json :
+# dernière date, nombre de lignes, segments et état du moteur d'indicateurs.
+# - refresh() : calcule uniquement les bougies clôturées postérieures à last_date
+# - read() : lecture memory-map sans copie (les deux scripts lisent les mêmes octets)
+###----------------------------------------------------------------------------------
+
+FEATURE_DIR = os.environ.get("P3_FEATURE_DIR", os.path.join(STATE_DIR, "features"))
+
+COLUMNS = ["date"] + OHLCV_FIELDS + FEATURE_COLUMNS
+SCHEMA = pa.schema([pa.field("date", pa.timestamp("ns", tz="UTC"))]
+                   + [pa.field(col, pa.float64()) for col in COLUMNS[1:]])
+
+# Paramètres des indicateurs inclus dans l'empreinte (FEATURE_COLUMNS via le schéma)
+INDICATOR_PARAMS = ["EMA_WINDOWS", "MACD_FAST", "MACD_SLOW", "MACD_SIGN", "RSI_WINDOW", "BOLL_WINDOW", "BOLL_DEV",
+                    "VOLUME_WINDOW", "PCT_COLUMNS"]
+
+# Au-delà, les segments sont fusionnés en un seul fichier
+MAX_SEGMENTS = 50
+
+
+def feature_hash():
+    """Empreinte de la définition des features : version des formules, paramètres des indicateurs, schéma stocké."""
+    h = hashlib.sha256()
+    h.update(str(indicators.FEATURE_VERSION).encode())
+    h.update(json.dumps({name: getattr(indicators, name) for name in INDICATOR_PARAMS}).encode())
+    h.update(SCHEMA.to_string().encode())
+    return h.hexdigest()[:16]
+
+
+class FeatureStore:
+    def __init__(self, table, root=FEATURE_DIR):
+        self.table = table
+        self.version = feature_hash()
+        self.dir = os.path.join(root, table, self.version)
+        self.meta_path = os.path.join(self.dir, "meta.json")
+
+    ###------------------------------------------------------------------------------
+    # Métadonnées
+    ###------------------------------------------------------------------------------
+    def load_meta(self):
+        try:
+            with open(self.meta_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_meta(self, meta):
+        write_json(self.meta_path, meta)
+
+    def engine(self):
+        """Moteur d'indicateurs positionné sur la dernière bougie stockée."""
+        meta = self.load_meta()
+        if meta is None:
+            raise ValueError(f"⛔ Feature store vide pour {self.table}")
+        return IndicatorEngine.from_dict(meta["engine"])
+
+    ###------------------------------------------------------------------------------
+    # Lecture (zero-copy)
+    ###------------------------------------------------------------------------------
+    def read(self, tail=None) -> pa.Table:
+        meta = self.load_meta()
+        if meta is None or not meta["segments"]:
+            return SCHEMA.empty_table()
+        tables = []
+        for name in meta["segments"]:
+            source = pa.memory_map(os.path.join(self.dir, name), "r")
+            tables.append(ipc.open_file(source).read_all())
+        table = pa.concat_tables(tables)
+        if tail is not None and len(table) > tail:
+            table = table.slice(len(table) - tail)
+        return table
+
+    def frame(self, tail=None) -> pd.DataFrame:
+        return self.read(tail).to_pandas()
+
+    ###------------------------------------------------------------------------------
+    # Écriture
+    ###------------------------------------------------------------------------------
+    def _write_segment(self, meta, df):
+        name = f"seg_{meta['next_segment']:06d}.arrow"
+        table = pa.Table.from_pandas(df.reindex(columns=COLUMNS), schema=SCHEMA, preserve_index=False)
+        with pa.OSFile(os.path.join(self.dir, name + ".tmp"), "wb") as sink:
+            with ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(os.path.join(self.dir, name + ".tmp"), os.path.join(self.dir, name))
+        meta["segments"].append(name)
+        meta["next_segment"] += 1
+
+    def _compact(self, meta):
+        old = list(meta["segments"])
+        table = self.read()
+        meta["segments"] = []
+        self._write_segment(meta, table.to_pandas())
+        self._save_meta(meta)
+        for name in old:
+            os.remove(os.path.join(self.dir, name))
+        print(f"🗜️ Feature store {self.table} : {len(old)} segments fusionnés")
+
+    def refresh(self, supabase, sync=True):
+        """
+        Ajoute au store les bougies clôturées postérieures à last_date (la dernière
+        bougie de la table, en cours, est ignorée). Premier passage : historique complet
+        calculé en un bloc vectorisé. sync=False : miroir de prix déjà synchronisé par
+        l'appelant, aucune requête réseau. Retourne le nombre de lignes ajoutées.
+        """
+        meta = self.load_meta()
+        start = meta["last_date"] if meta else None
+
+        if sync:
+            df = sync_and_read(supabase, self.table, start=start)
+        else:
+            df = PriceMirror(self.table).frame(start=start)
+        if meta:
+            df = df[df["date"] > pd.Timestamp(meta["last_date"])]
+        df = df.iloc[:-1].reset_index(drop=True)
+        if df.empty:
+            return 0
+
+        if meta is None:
+            os.makedirs(self.dir, exist_ok=True)
+            meta = {"table": self.table, "version": self.version, "rows": 0,
+                    "segments": [], "next_segment": 1}
+            engine = IndicatorEngine()
+            features = engine.compute(df)
+        else:
+            engine = IndicatorEngine.from_dict(meta["engine"])
+            features = pd.DataFrame([engine.append(row) for row in df.to_dict(orient="records")])
+
+        self._write_segment(meta, features)
+        meta["rows"] += len(features)
+        meta["last_date"] = features["date"].iloc[-1].isoformat()
+        meta["engine"] = engine.to_dict()
+        self._save_meta(meta)
+
+        if len(meta["segments"]) > MAX_SEGMENTS:
+            self._compact(meta)
+
+        print(f"🧱 Feature store {self.table} : +{len(features)} ligne(s), {meta['rows']} au total")
+        return len(features)
+
+
+def load_features(supabase, table, tail=None, sync=True):
+    """Rafraîchit puis lit le store : (DataFrame des features, moteur prêt pour append())."""
+    store = FeatureStore(table)
+    store.refresh(supabase, sync=sync)
+    meta = store.load_meta()
+    engine = IndicatorEngine.from_dict(meta["engine"]) if meta else None
+    return store.frame(tail), engine
+
+
+if __name__ == "__main__":
+    # Pré-calcul des stores : python feature_store.py [table ...]
+    import sys
+    from supabase_client import get_client
+
+    supabase = get_client()
+    for table in sys.argv[1:] or ["btc_t15", "btc_h", "btc_d"]:
+        FeatureStore(table).refresh(supabase)
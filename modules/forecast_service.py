@@ -0,0 +1,216 @@
+import bisect
+import copy
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+# predict_master : authentification, cache de modèles et simulation multi-step (une seule fois par processus)
+from predict_master import supabase, model_cache, interval_to_table, targets, model_mode, forecast_rows
+from forecaster import model_name, learner_for
+from feature_store import load_features
+
+###----------------------------------------------------------------------------------
+# Service de prévision longue durée (HTTP localhost)
+# - Garde en mémoire, par table : fenêtre des 200 dernières bougies, moteur
+#   d'indicateurs et prévisions déjà calculées.
+# - Un thread de fond rafraîchit le feature store toutes les POLL_S secondes et
+#   ne recalcule les prévisions que si une bougie a clôturé ou si un modèle a changé.
+# - GET /forecast?table=btc_h&steps=5 répond depuis la mémoire (aucun I/O).
+# - GET /metrics : histogrammes de latence et percentiles p50/p95/p99 par route.
+###----------------------------------------------------------------------------------
+
+HOST = os.environ.get("P3_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.environ.get("P3_SERVICE_PORT", "8765"))
+POLL_S = float(os.environ.get("P3_SERVICE_POLL", "15"))
+
+# Bornes des buckets de l'histogramme (ms)
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+class LatencyHistogram:
+    """Histogramme cumulatif à buckets fixes + fenêtre des dernières mesures pour les percentiles."""
+
+    def __init__(self, window=10_000):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.samples = deque(maxlen=window)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            self.samples.append(ms)
+            self.total += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = np.fromiter(self.samples, dtype=np.float64)
+            counts = list(self.counts)
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if len(samples) else (None, None, None)
+        bounds = [f"le_{b}" for b in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.total,
+            "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+            "buckets": dict(zip(bounds, np.cumsum(counts).tolist())),
+        }
+
+
+class ForecastService:
+    def __init__(self, tables=interval_to_table):
+        self.tables = tables
+        self.state = {}
+        self.metrics = {}
+        self._lock = threading.Lock()
+        # Un verrou par table : le thread de fond et les requêtes /refresh sérialisent
+        # lecture du store → simulation → remplacement de l'état
+        self._refresh_locks = {table: threading.Lock() for table in tables}
+        self._stop = threading.Event()
+
+    ###------------------------------------------------------------------------------
+    # État par table
+    ###------------------------------------------------------------------------------
+    def _model_versions(self, table):
+        learner = learner_for(table, published=model_cache.learners())
+        names = [model_name(table, None, learner)] if model_mode == "multi" else [model_name(table, t, learner) for t in targets]
+        versions = model_cache.refresh_versions()
+        return tuple(versions.get(name) for name in names)
+
+    def refresh(self, table, force=False):
+        """Rafraîchit le store ; recalcule les prévisions si nouvelle bougie ou nouveau modèle. Retourne True si recalcul."""
+        _, delta_time, steps = self.tables[table]
+        with self._refresh_locks[table]:
+            df, engine = load_features(supabase, table, tail=200)
+            if df.empty:
+                return False
+            key = (df["date"].iloc[-1], self._model_versions(table))
+            current = self.state.get(table)
+            if not force and current is not None and current["key"] == key:
+                return False
+
+            t0 = time.perf_counter()
+            rows = forecast_rows(table, df, copy.deepcopy(engine), delta_time, steps)
+            state = {"key": key, "df": df, "engine": engine, "rows": rows,
+                     "last_date": df["date"].iloc[-1].isoformat(), "computed_at": time.time()}
+            with self._lock:
+                self.state[table] = state
+        print(f"🔄 {table} : prévisions recalculées depuis {state['last_date']} en {(time.perf_counter() - t0) * 1000:.1f} ms")
+        return True
+
+    def refresh_all(self, force=False):
+        for table in self.tables:
+            try:
+                self.refresh(table, force)
+            except Exception as e:
+                print(f"⚠️ Rafraîchissement {table} impossible : {e}")
+
+    def _poll(self):
+        while not self._stop.wait(POLL_S):
+            self.refresh_all()
+
+    ###------------------------------------------------------------------------------
+    # Requêtes
+    ###------------------------------------------------------------------------------
+    def forecast(self, table, steps=None):
+        if table not in self.tables:
+            raise KeyError(f"Table inconnue : {table}")
+        with self._lock:
+            state = self.state.get(table)
+        if state is None:
+            raise LookupError(f"Aucune prévision disponible pour {table}")
+        if steps is not None and steps < 1:
+            raise ValueError(f"steps doit être ≥ 1 (reçu : {steps})")
+        steps = steps or len(state["rows"])
+        if steps > len(state["rows"]):
+            # Horizon plus long que celui pré-calculé : simulation à la demande, puis mise en cache
+            rows = forecast_rows(table, state["df"], copy.deepcopy(state["engine"]), self.tables[table][1], steps)
+            with self._lock:
+                if self.state.get(table) is state:
+                    state["rows"] = rows
+        return {"table": table, "last_date": state["last_date"], "rows": state["rows"][:steps]}
+
+    def observe(self, route, seconds):
+        if route not in self.metrics:
+            with self._lock:
+                self.metrics.setdefault(route, LatencyHistogram())
+        self.metrics[route].observe(seconds)
+
+    def snapshot_metrics(self):
+        with self._lock:
+            states = dict(self.state)
+            metrics = dict(self.metrics)
+        return {
+            "routes": {route: hist.snapshot() for route, hist in metrics.items()},
+            "tables": {table: {"last_date": s["last_date"], "computed_at": s["computed_at"], "steps": len(s["rows"])}
+                       for table, s in states.items()},
+            "models": model_cache.snapshot_stats(),
+        }
+
+    ###------------------------------------------------------------------------------
+    # Serveur HTTP
+    ###------------------------------------------------------------------------------
+    def serve(self, host=HOST, port=PORT):
+        self.refresh_all(force=True)
+        threading.Thread(target=self._poll, daemon=True).start()
+        server = ThreadingHTTPServer((host, port), _handler(self))
+        print(f"🚀 Service de prévision sur http://{host}:{port} (rafraîchissement toutes les {POLL_S:.0f}s)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            server.server_close()
+
+
+def _handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            t0 = time.perf_counter()
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                if url.path == "/forecast":
+                    steps = int(query["steps"][0]) if "steps" in query else None
+                    self._send(200, service.forecast(query.get("table", [""])[0], steps))
+                elif url.path == "/refresh":
+                    tables = query.get("table") or list(service.tables)
+                    self._send(200, {table: service.refresh(table, force=True) for table in tables})
+                elif url.path == "/metrics":
+                    self._send(200, service.snapshot_metrics())
+                elif url.path == "/health":
+                    self._send(200, {"status": "ok", "tables": sorted(service.state)})
+                else:
+                    self._send(404, {"error": f"Route inconnue : {url.path}"})
+            except KeyError as e:
+                self._send(404, {"error": e.args[0]})
+            except (LookupError, ValueError) as e:
+                self._send(503 if isinstance(e, LookupError) else 400, {"error": str(e)})
+            except Exception as e:
+                # Erreur réseau / stockage (load_features, /refresh) : réponse 500, latence mesurée
+                print(f"⚠️ {url.path} : {e}")
+                self._send(500, {"error": str(e)})
+            service.observe(url.path, time.perf_counter() - t0)
+
+        def log_message(self, format, *args):
+            # Pas de log par requête (le service répond en quelques ms)
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    ForecastService().serve()
@@ -0,0 +1,340 @@
+import io
+import json
+import os
+import time
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import mean_squared_error, mean_absolute_percentage_error
+from local_state import STATE_DIR
+
+###----------------------------------------------------------------------------------
+# Mode de modèle : une forêt par cible (historique) ou une forêt multi-sorties
+# P3_MODEL_MODE = "per_target" (défaut) | "multi" | "compare" | "compare_learners" | "search"
+# (les trois derniers : entraînement seulement)
+# Le mode multi-sorties entraîne une seule forêt sur les cinq cibles shifted_* :
+# un seul parcours d'arbres par pas de prédiction et un seul artefact par table.
+###----------------------------------------------------------------------------------
+
+MODEL_MODE = os.environ.get("P3_MODEL_MODE", "per_target")
+TARGETS = ["shifted_open", "shifted_high", "shifted_low", "shifted_close", "shifted_volume"]
+FOREST_PARAMS = {"n_estimators": 100, "max_depth": 10, "random_state": 42}
+
+###----------------------------------------------------------------------------------
+# Apprenant : "rf" (RandomForestRegressor) ou "hgb" (HistGradientBoostingRegressor)
+# P3_LEARNER = "rf" | "hgb" | choix par table : "btc_t15=hgb,btc_h=rf" (défaut rf)
+# Pour hgb, les features sont discrétisées une fois par table (FeatureBinner) et la
+# matrice uint8 est réutilisée par les cinq cibles ; le binner est stocké avec le modèle.
+# P3_LEARNER = "auto" : apprenant retenu par la recherche (model_search) pour chaque table ;
+# l'entraînement le publie dans l'index du registre, d'où la prédiction le relit.
+# Les paramètres retenus par la recherche (TUNED_PARAMS_PATH) remplacent ceux par défaut.
+###----------------------------------------------------------------------------------
+LEARNER = os.environ.get("P3_LEARNER", "rf")
+LEARNERS = ["rf", "hgb"]
+HGB_PARAMS = {"max_iter": 200, "learning_rate": 0.1, "max_leaf_nodes": 31, "early_stopping": False,
+              "random_state": 42}
+LEARNER_PARAMS = {"rf": FOREST_PARAMS, "hgb": HGB_PARAMS}
+MAX_BINS = 255
+TUNED_PARAMS_PATH = os.environ.get("P3_TUNED_PARAMS", os.path.join(STATE_DIR, "search", "best_params.json"))
+
+
+_tuned = None
+
+
+def tuned_params(refresh=False):
+    """Configurations de la recherche (TUNED_PARAMS_PATH), lues une seule fois par processus."""
+    global _tuned
+    if _tuned is None or refresh:
+        try:
+            with open(TUNED_PARAMS_PATH, "r") as f:
+                _tuned = json.load(f)
+        except FileNotFoundError:
+            _tuned = {}
+    return _tuned
+
+
+def tuned_config(table):
+    """Configuration retenue par la recherche pour cette table ({} si aucune)."""
+    return tuned_params().get(table, {})
+
+
+def learner_for(table, spec=LEARNER, published=None):
+    """
+    Apprenant de la table. En "auto", `published` ({table: apprenant} publié dans le registre)
+    fait foi côté prédiction ; sans lui (entraînement), résultat local de la recherche.
+    """
+    if spec == "auto":
+        if published is not None:
+            return published.get(table, "rf")
+        return tuned_config(table).get("best", "rf")
+    if "=" not in spec:
+        return spec
+    choices = dict(item.split("=", 1) for item in spec.split(",") if item)
+    return choices.get(table, "rf")
+
+
+def learner_params(table, learner):
+    """Paramètres de l'apprenant : défauts, surchargés par la configuration de la recherche."""
+    tuned = tuned_config(table).get(learner, {}).get("params", {})
+    return {**LEARNER_PARAMS[learner], **tuned}
+
+
+def model_name(table, target=None, learner="rf"):
+    """Nom du modèle dans le registre : {learner}_model_{table}_{target} (par cible) ou {learner}_multi_{table}."""
+    return f"{learner}_model_{table}_{target}" if target else f"{learner}_multi_{table}"
+
+
+class FeatureBinner:
+    """Discrétisation par quantiles (max_bins classes, NaN → classe max_bins), apprise sur un sous-échantillon."""
+
+    def __init__(self, max_bins=MAX_BINS, subsample=200_000, random_state=42):
+        self.max_bins = max_bins
+        self.subsample = subsample
+        self.random_state = random_state
+        self.thresholds_ = None
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) > self.subsample:
+            rows = np.random.default_rng(self.random_state).choice(len(X), self.subsample, replace=False)
+            X = X[np.sort(rows)]
+        self.thresholds_ = []
+        for j in range(X.shape[1]):
+            col = X[:, j][~np.isnan(X[:, j])]
+            distinct = np.unique(col)
+            if len(distinct) <= self.max_bins:
+                thresholds = (distinct[:-1] + distinct[1:]) / 2
+            else:
+                thresholds = np.unique(np.percentile(col, np.linspace(0, 100, self.max_bins + 1)[1:-1]))
+            self.thresholds_.append(thresholds.astype(np.float32))
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty(X.shape, dtype=np.uint8)
+        for j, thresholds in enumerate(self.thresholds_):
+            out[:, j] = np.searchsorted(thresholds, X[:, j], side="left")
+            out[np.isnan(X[:, j]), j] = self.max_bins
+        return out
+
+
+class BinnedRegressor:
+    """Un HistGradientBoostingRegressor par cible sur features pré-binnées (binner partagé)."""
+
+    def __init__(self, binner, estimators, targets, feature_names=None):
+        self.binner = binner
+        self.estimators = estimators
+        self.targets = list(targets)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+
+    def predict(self, X):
+        columns = getattr(X, "columns", None)
+        if columns is not None and self.feature_names is not None and list(columns) != self.feature_names:
+            X = X[self.feature_names]
+        X_binned = self.binner.transform(X)
+        out = np.column_stack([est.predict(X_binned) for est in self.estimators])
+        return out[:, 0] if len(self.estimators) == 1 else out
+
+    def predict_dict(self, X_last):
+        return dict(zip(self.targets, map(float, np.atleast_2d(self.predict(X_last))[0])))
+
+
+class MultiOutputForecaster:
+    """
+    Forêt multi-sorties sur cibles standardisées : sans cela le critère MSE commun
+    serait dominé par les cibles de prix et le volume serait sacrifié.
+    """
+
+    def __init__(self, targets=TARGETS, **forest_params):
+        self.targets = list(targets)
+        self.forest = RandomForestRegressor(**{**FOREST_PARAMS, **forest_params})
+        self.mean_ = None
+        self.scale_ = None
+
+    def fit(self, X, Y):
+        Y = np.asarray(Y, dtype=np.float64)
+        self.mean_ = Y.mean(axis=0)
+        self.scale_ = Y.std(axis=0)
+        self.scale_[self.scale_ == 0] = 1.0
+        self.forest.fit(X, (Y - self.mean_) / self.scale_)
+        return self
+
+    def predict(self, X):
+        """Tableau (n, len(targets)) dans l'échelle d'origine."""
+        return self.forest.predict(X) * self.scale_ + self.mean_
+
+    def predict_dict(self, X_last):
+        return dict(zip(self.targets, map(float, self.predict(X_last)[0])))
+
+    def grow(self, X, Y, n_new, random_state=None):
+        """Ajoute n_new arbres appris sur (X, Y) et retire les n_new plus anciens (standardisation inchangée)."""
+        Y = np.asarray(Y, dtype=np.float64)
+        grow_forest(self.forest, X, (Y - self.mean_) / self.scale_, n_new, random_state)
+        return self
+
+    @property
+    def estimators_(self):
+        return self.forest.estimators_
+
+
+def grow_forest(forest, X, y, n_new, random_state=None):
+    """
+    warm_start : n_new arbres ajoutés sur la fenêtre récente, puis les n_new plus
+    anciens (en tête de estimators_) sont retirés. La taille de la forêt reste fixe.
+    random_state : graine des nouveaux arbres (sinon les mêmes tirages à chaque ajout).
+    """
+    size = len(forest.estimators_)
+    params = {"warm_start": True, "n_estimators": size + n_new}
+    if random_state is not None:
+        params["random_state"] = random_state
+    forest.set_params(**params)
+    forest.fit(X, y)
+    forest.estimators_ = forest.estimators_[n_new:]
+    forest.set_params(warm_start=False, n_estimators=size)
+    return forest
+
+
+###----------------------------------------------------------------------------------
+# Comparaison par cible / multi-sorties (holdout chronologique)
+###----------------------------------------------------------------------------------
+def _artifact_bytes(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer, compress=3)
+    return buffer.tell()
+
+
+def _step_latency(predict_fn, X_row, repeats=20):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        predict_fn(X_row)
+    return (time.perf_counter() - t0) / repeats
+
+
+def compare_modes(features, Y, targets=TARGETS, test_size=0.2, **forest_params):
+    """
+    Entraîne les deux modes sur les (1 - test_size) premières lignes et les évalue
+    sur les suivantes : RMSE / MAPE par cible, temps d'entraînement, taille des
+    artefacts et latence d'un pas de prédiction (une ligne, cinq cibles).
+    """
+    X = np.asarray(features, dtype=np.float32)
+    Y = np.asarray(Y, dtype=np.float64)
+    split = int(len(X) * (1 - test_size))
+    X_train, X_test, Y_train, Y_test = X[:split], X[split:], Y[:split], Y[split:]
+    params = {**FOREST_PARAMS, **forest_params}
+
+    t0 = time.perf_counter()
+    per_target = [RandomForestRegressor(**params).fit(X_train, Y_train[:, i]) for i in range(len(targets))]
+    per_target_fit = time.perf_counter() - t0
+    per_target_pred = np.column_stack([m.predict(X_test) for m in per_target])
+
+    t0 = time.perf_counter()
+    multi = MultiOutputForecaster(targets, **params).fit(X_train, Y_train)
+    multi_fit = time.perf_counter() - t0
+    multi_pred = multi.predict(X_test)
+
+    report = {"targets": {}, "per_target": {}, "multi": {}}
+    print(f"\n🔬 Comparaison des modes ({len(X_train)} lignes d'entraînement, {len(X_test)} de test)")
+    print(f"{'cible':<16}{'RMSE / cible':>14}{'RMSE multi':>14}{'MAPE / cible':>14}{'MAPE multi':>12}")
+    for i, target in enumerate(targets):
+        scores = {
+            "rmse_per_target": mean_squared_error(Y_test[:, i], per_target_pred[:, i]) ** 0.5,
+            "rmse_multi": mean_squared_error(Y_test[:, i], multi_pred[:, i]) ** 0.5,
+            "mape_per_target": mean_absolute_percentage_error(Y_test[:, i], per_target_pred[:, i]),
+            "mape_multi": mean_absolute_percentage_error(Y_test[:, i], multi_pred[:, i]),
+        }
+        report["targets"][target] = scores
+        print(f"{target:<16}{scores['rmse_per_target']:>14.2f}{scores['rmse_multi']:>14.2f}"
+              f"{scores['mape_per_target']:>14.2%}{scores['mape_multi']:>12.2%}")
+
+    X_row = X_test[:1]
+    report["per_target"] = {
+        "fit_s": per_target_fit,
+        "artifact_bytes": sum(_artifact_bytes(m) for m in per_target),
+        "step_s": _step_latency(lambda x: [m.predict(x) for m in per_target], X_row),
+    }
+    report["multi"] = {
+        "fit_s": multi_fit,
+        "artifact_bytes": _artifact_bytes(multi),
+        "step_s": _step_latency(multi.predict, X_row),
+    }
+    for mode, label in [("per_target", "par cible"), ("multi", "multi-sorties")]:
+        r = report[mode]
+        print(f"📊 {label:<14} | entraînement {r['fit_s']:7.2f}s | artefact(s) {r['artifact_bytes'] / 1024 / 1024:6.1f} Mo "
+              f"| pas de prédiction {r['step_s'] * 1000:6.1f} ms")
+    return report
+
+
+###----------------------------------------------------------------------------------
+# Comparaison des apprenants (par table) : entraînement, latence, taille, erreur
+###----------------------------------------------------------------------------------
+def _artifact_raw_bytes(model):
+    # Format du registre : joblib non compressé
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def fit_learner(learner, X, Y, targets=TARGETS, binner=None):
+    """Modèles par cible pour un apprenant ; retourne une liste de modèles exposant predict(X)."""
+    if learner == "rf":
+        return [RandomForestRegressor(**FOREST_PARAMS).fit(X, Y[:, i]) for i in range(len(targets))]
+    binner = binner or FeatureBinner().fit(X)
+    X_binned = binner.transform(X)
+    estimators = [HistGradientBoostingRegressor(**HGB_PARAMS).fit(X_binned, Y[:, i]) for i in range(len(targets))]
+    return [BinnedRegressor(binner, [est], [t]) for est, t in zip(estimators, targets)]
+
+
+def compare_learners(features, Y, targets=TARGETS, test_size=0.2, label=""):
+    """
+    RF vs HGB sur holdout chronologique, cinq cibles : temps d'entraînement (binning
+    compris pour hgb), latence d'un pas de prédiction (forêt compilée pour rf, comme en
+    production), taille des artefacts (joblib non compressé) et RMSE / MAPE par cible.
+    """
+    from compiled_forest import CompiledForest
+
+    X = np.asarray(features, dtype=np.float32)
+    Y = np.asarray(Y, dtype=np.float64)
+    split = int(len(X) * (1 - test_size))
+    X_train, X_test, Y_train, Y_test = X[:split], X[split:], Y[:split], Y[split:]
+
+    report = {}
+    for learner in LEARNERS:
+        t0 = time.perf_counter()
+        models = fit_learner(learner, X_train, Y_train, targets)
+        fit_s = time.perf_counter() - t0
+        served = [CompiledForest.from_model(m) for m in models] if learner == "rf" else models
+        pred = np.column_stack([m.predict(X_test) for m in served])
+        report[learner] = {
+            "fit_s": fit_s,
+            "step_s": _step_latency(lambda x: [m.predict(x) for m in served], X_test[:1]),
+            "artifact_bytes": sum(_artifact_raw_bytes(m) for m in models),
+            "rmse": {t: mean_squared_error(Y_test[:, i], pred[:, i]) ** 0.5 for i, t in enumerate(targets)},
+            "mape": {t: mean_absolute_percentage_error(Y_test[:, i], pred[:, i]) for i, t in enumerate(targets)},
+        }
+
+    print(f"\n🔬 Apprenants {label} ({len(X_train)} lignes d'entraînement, {len(X_test)} de test)")
+    print(f"{'cible':<16}" + "".join(f"{'RMSE ' + l:>14}{'MAPE ' + l:>12}" for l in LEARNERS))
+    for t in targets:
+        print(f"{t:<16}" + "".join(f"{report[l]['rmse'][t]:>14.2f}{report[l]['mape'][t]:>12.2%}" for l in LEARNERS))
+    for l in LEARNERS:
+        r = report[l]
+        print(f"📊 {l:<4} | entraînement {r['fit_s']:7.2f}s | artefacts {r['artifact_bytes'] / 1024 / 1024:6.1f} Mo "
+              f"| pas de prédiction {r['step_s'] * 1000:6.2f} ms")
+    report["best"] = min(LEARNERS, key=lambda l: np.mean(list(report[l]["mape"].values())))
+    print(f"👉 MAPE moyen le plus bas : {report['best']}")
+    return report
+
+
+if __name__ == "__main__":
+    # Comparaison sur données synthétiques : python forecaster.py [nombre de bougies]
+    import sys
+    import pandas as pd
+    from indicators import make_candles, add_indicators
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    df, _ = add_indicators(make_candles(n))
+    for col in ["open", "high", "low", "close", "volume"]:
+        df[f"shifted_{col}"] = df[col].shift(-1)
+    df = df.replace([np.inf, -np.inf], np.nan).dropna()
+    compare_modes(df.drop(columns=TARGETS), df[TARGETS])
+    compare_learners(df.drop(columns=TARGETS), df[TARGETS], label="synthétiques")
@@ -0,0 +1,150 @@
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error, mean_absolute_percentage_error
+from forecaster import MultiOutputForecaster, grow_forest, model_name, learner_for
+from train_scheduler import CPU_BUDGET
+
+###----------------------------------------------------------------------------------
+# Réentraînement incrémental (warm start) piloté par le volume de données nouvelles
+# Le filigrane d'un modèle est la fin de sa fenêtre d'entraînement (manifeste du
+# registre). Pour chaque modèle courant :
+# - "skip"  : moins de MIN_NEW_ROWS bougies nouvelles et pas de dérive
+# - "grow"  : n arbres ajoutés sur les RECENT_ROWS dernières lignes (warm_start) et
+#             les n plus anciens retirés, n proportionnel à la part de lignes nouvelles
+# - "full"  : pas de modèle courant, définition des features changée, plus de
+#             RECENT_ROWS lignes nouvelles, ou "grow" dû pour un apprenant hgb (pas de
+#             retrait d'arbres possible ; entraînement déjà rapide) → entraînement complet
+#             (train_scheduler) ; sous le seuil, une table hgb est sautée comme une autre
+# Dérive : une forêt ne prédit pas hors de l'intervalle des cibles vues à
+# l'entraînement ; si plus de DRIFT_SHARE des lignes nouvelles en sortent, on ajoute
+# au moins DRIFT_TREES_FRACTION de nouveaux arbres même sous le seuil de volume.
+###----------------------------------------------------------------------------------
+
+MIN_NEW_ROWS = int(os.environ.get("P3_INCR_MIN_ROWS", "24"))
+RECENT_ROWS = int(os.environ.get("P3_INCR_WINDOW", "5000"))
+DRIFT_SHARE = float(os.environ.get("P3_INCR_DRIFT_SHARE", "0.05"))
+# Part maximale de la forêt remplacée en une mise à jour
+MAX_NEW_FRACTION = 0.5
+DRIFT_TREES_FRACTION = 0.1
+
+
+def target_range(Y, names):
+    """Intervalle [min, max] de chaque cible, enregistré dans le manifeste pour le contrôle de dérive."""
+    return {name: [float(Y[name].min()), float(Y[name].max())] for name in names}
+
+
+def drift_share(Y_new, ranges):
+    """Part des lignes nouvelles dont au moins une cible sort de l'intervalle d'entraînement."""
+    outside = np.zeros(len(Y_new), dtype=bool)
+    for name, (low, high) in ranges.items():
+        outside |= (Y_new[name] < low).to_numpy() | (Y_new[name] > high).to_numpy()
+    return float(outside.mean()) if len(outside) else 0.0
+
+
+def plan_update(registry, table, name, names, features, Y, current_feature_hash):
+    """Décide skip / grow / full pour un modèle ; retourne un dict décrivant la décision."""
+    version = registry.current(name, refresh=False)
+    if version is None:
+        return {"action": "full", "reason": "aucune version courante"}
+    registry.fetch(name, version)
+    manifest = registry.manifest(name, version)
+    if manifest.get("feature_hash") != current_feature_hash or manifest.get("features") != [str(c) for c in features.columns]:
+        return {"action": "full", "reason": "définition des features modifiée"}
+
+    watermark = pd.Timestamp(manifest["training_window"]["end"])
+    new_mask = (Y["date"] > watermark).to_numpy()
+    new_rows = int(new_mask.sum())
+    if new_rows >= RECENT_ROWS:
+        return {"action": "full", "reason": f"{new_rows} lignes nouvelles ≥ fenêtre {RECENT_ROWS}"}
+
+    ranges = manifest.get("target_range") or {}
+    share = drift_share(Y.loc[new_mask, names], {n: ranges[n] for n in names if n in ranges})
+    drift = share > DRIFT_SHARE
+    if new_rows < MIN_NEW_ROWS and not drift:
+        return {"action": "skip", "reason": f"{new_rows} ligne(s) nouvelle(s) < {MIN_NEW_ROWS}", "new_rows": new_rows}
+    # Mise à jour due : sans warm start (hgb), elle devient un entraînement complet
+    if learner_for(table) != "rf":
+        return {"action": "full", "reason": f"apprenant {learner_for(table)} sans warm start "
+                                            f"({'dérive' if drift else f'{new_rows} lignes nouvelles'})"}
+
+    n_trees = manifest["params"].get("n_estimators", 100)
+    n_new = math.ceil(n_trees * new_rows / RECENT_ROWS)
+    if drift:
+        n_new = max(n_new, math.ceil(n_trees * DRIFT_TREES_FRACTION))
+    n_new = min(max(n_new, 1), int(n_trees * MAX_NEW_FRACTION))
+    return {
+        "action": "grow",
+        "reason": f"dérive {share:.0%} hors intervalle" if drift else f"{new_rows} lignes nouvelles",
+        "version": version, "manifest": manifest, "new_rows": new_rows, "n_new": n_new,
+        "drift_share": share, "watermark": Y["date"].iloc[-1],
+    }
+
+
+def grow_model(registry, name, names, plan, features, Y):
+    """Charge la version courante, ajoute / retire plan["n_new"] arbres. Retourne (modèle, métriques, intervalles, infos)."""
+    t0 = time.perf_counter()
+    model = registry.load(name, plan["version"], mmap_mode=None)
+    X_recent = features.iloc[-RECENT_ROWS:]
+    Y_recent = Y[names].iloc[-RECENT_ROWS:]
+    # Graine dérivée du filigrane : de nouveaux tirages bootstrap à chaque mise à jour
+    seed = int(plan["watermark"].timestamp()) % (2 ** 31)
+
+    forest = getattr(model, "forest", model)
+    forest.set_params(n_jobs=CPU_BUDGET)
+    if isinstance(model, MultiOutputForecaster):
+        model.grow(X_recent, Y_recent, plan["n_new"], random_state=seed)
+        pred = model.predict(X_recent)
+    else:
+        grow_forest(model, X_recent, Y_recent[names[0]], plan["n_new"], random_state=seed)
+        pred = model.predict(X_recent)[:, None]
+    forest.set_params(n_jobs=None)
+
+    metrics = {
+        n: {"rmse": mean_squared_error(Y_recent[n], pred[:, i]) ** 0.5,
+            "mape": mean_absolute_percentage_error(Y_recent[n], pred[:, i])}
+        for i, n in enumerate(names)
+    }
+    # L'intervalle couvert par la forêt s'élargit à la fenêtre récente
+    previous = plan["manifest"].get("target_range") or {}
+    recent = target_range(Y_recent, names)
+    ranges = {n: [min(previous.get(n, recent[n])[0], recent[n][0]), max(previous.get(n, recent[n])[1], recent[n][1])]
+              for n in names}
+    info = {
+        "base_version": plan["version"],
+        "trees_added": plan["n_new"],
+        "trees_pruned": plan["n_new"],
+        "new_rows": plan["new_rows"],
+        "window_rows": len(X_recent),
+        "trigger": plan["reason"],
+        "wall_s": time.perf_counter() - t0,
+    }
+    return model, metrics, ranges, info
+
+
+def incremental_update(registry, datasets, targets, multi, current_feature_hash, publish):
+    """
+    Met à jour les modèles courants de chaque table. publish(name, model, table, metrics, ranges, info)
+    enregistre les modèles étendus. Retourne les couples (table, target) à entraîner complètement.
+    """
+    full = set()
+    registry.index(refresh=True)
+    for table, (features, Y) in datasets.items():
+        groups = [(None, list(targets))] if multi else [(t, [t]) for t in targets]
+        for target, names in groups:
+            name = model_name(table, target, learner_for(table))
+            plan = plan_update(registry, table, name, names, features, Y, current_feature_hash)
+            label = target or "multi-sorties"
+            if plan["action"] == "full":
+                print(f"🔁 {table} → {label} : entraînement complet ({plan['reason']})")
+                full.add((table, target))
+            elif plan["action"] == "skip":
+                print(f"⏭️ {table} → {label} : inchangé ({plan['reason']})")
+            else:
+                model, metrics, ranges, info = grow_model(registry, name, names, plan, features, Y)
+                print(f"🌱 {table} → {label} : +{info['trees_added']}/-{info['trees_pruned']} arbres sur "
+                      f"{info['window_rows']} lignes ({plan['reason']}) en {info['wall_s']:.1f}s")
+                publish(name, model, table, metrics, ranges, info)
+    return full
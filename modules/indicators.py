@@ -0,0 +1,507 @@
+import numpy as np
+import pandas as pd
+
+###----------------------------------------------------------------------------------
+# Moteur d'indicateurs techniques incrémental
+# Mêmes formules que la librairie `ta` (EMA 7/20/99, MACD 12/26/9, RSI de Wilder 14,
+# Bollinger %B 20/2, StochRSI 14, moyenne mobile volume 20) mais avec état conservé :
+# - compute(df) : calcul vectorisé sur tout l'historique + extraction de l'état final
+# - append(row) : ajout d'une bougie en O(1) par indicateur (récurrences EMA / Wilder,
+#   tampons circulaires de taille fixe pour Bollinger, volume MA et StochRSI)
+# Vérification contre `ta` : python indicators.py
+###----------------------------------------------------------------------------------
+
+EMA_WINDOWS = [7, 20, 99]
+MACD_FAST, MACD_SLOW, MACD_SIGN = 12, 26, 9
+RSI_WINDOW = 14
+BOLL_WINDOW, BOLL_DEV = 20, 2
+VOLUME_WINDOW = 20
+PCT_COLUMNS = ["open", "high", "low", "close", "volume", "body_size", "amplitude"]
+
+# Version des formules : à incrémenter à chaque changement de calcul d'une feature
+# (invalide le feature store et déclenche un réentraînement complet). Les refactorisations
+# sans effet sur les valeurs ne la modifient pas.
+FEATURE_VERSION = 1
+
+# Colonnes produites, dans l'ordre (compute() omet les EMA plus longues que l'historique)
+FEATURE_COLUMNS = (
+    [f"ema_{w}" for w in EMA_WINDOWS]
+    + ["macd", "macd_signal", "rsi", "boll_b", "stoch_rsi", "volume_ma20",
+       "body_size", "amplitude", "upper_wick", "lower_wick", "efficiency_ratio"]
+    + [f"{col}_pct_change_1" for col in PCT_COLUMNS]
+)
+
+
+def _ewm_step(prev, x, alpha):
+    """Une itération de ewm(adjust=False) telle que calculée par pandas."""
+    if np.isnan(prev):
+        return x
+    old_wt = 1.0 - alpha
+    return (old_wt * prev + alpha * x) / (old_wt + alpha)
+
+
+class RingBuffer:
+    """Fenêtre glissante de taille fixe (NaN tant qu'elle n'est pas pleine, comme rolling(window))."""
+
+    def __init__(self, window, values=()):
+        self.values = np.full(window, np.nan)
+        self.pos = 0
+        for v in list(values)[-window:]:
+            self.push(v)
+
+    def push(self, x):
+        self.values[self.pos] = x
+        self.pos = (self.pos + 1) % len(self.values)
+
+    def to_list(self):
+        """Valeurs de la plus ancienne à la plus récente (None pour NaN, sérialisable JSON)."""
+        ordered = np.roll(self.values, -self.pos)
+        return [None if np.isnan(v) else float(v) for v in ordered]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(len(values), [np.nan if v is None else v for v in values])
+
+
+class IndicatorEngine:
+    def __init__(self):
+        self.n = 0
+        self.ema = {w: np.nan for w in EMA_WINDOWS + [MACD_FAST, MACD_SLOW]}
+        self.macd_signal = np.nan
+        self.prev_close = np.nan
+        self.avg_up = np.nan
+        self.avg_dn = np.nan
+        self.closes = RingBuffer(BOLL_WINDOW)
+        self.volumes = RingBuffer(VOLUME_WINDOW)
+        self.rsis = RingBuffer(RSI_WINDOW)
+        self.prev = {col: np.nan for col in PCT_COLUMNS}
+
+    ###------------------------------------------------------------------------------
+    # Calcul complet (vectorisé) + état final
+    ###------------------------------------------------------------------------------
+    def compute(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Ajoute les colonnes d'indicateurs et d'analyse chandelle à `df` (mêmes colonnes,
+        même ordre et mêmes valeurs que l'ancien add_primary_kpis basé sur `ta`),
+        puis mémorise l'état nécessaire pour poursuivre avec append().
+        """
+        close, volume = df["close"], df["volume"]
+        n = len(df)
+        raw, macd, signal, avg_up, avg_dn, rsi = self._recurrences(close)
+
+        # EMA : valeurs brutes conservées pour l'état, masquées avant `window` bougies
+        ema_cols = []
+        for w in EMA_WINDOWS:
+            if n >= w:
+                df[f"ema_{w}"] = raw[w].where(np.arange(n) >= w - 1)
+                ema_cols.append(f"ema_{w}")
+        df.attrs["ema_cols"] = ema_cols
+
+        # MACD
+        df["macd"] = macd
+        df["macd_signal"] = signal.where(np.arange(n) >= MACD_SLOW + MACD_SIGN - 2)
+
+        # RSI (Wilder)
+        df["rsi"] = rsi
+
+        # Bollinger %B
+        mavg = close.rolling(BOLL_WINDOW).mean()
+        mstd = close.rolling(BOLL_WINDOW).std(ddof=0)
+        hband = mavg + BOLL_DEV * mstd
+        lband = mavg - BOLL_DEV * mstd
+        df["boll_b"] = (close - lband) / (hband - lband).where(hband != lband, np.nan)
+
+        # Stoch RSI
+        rsi_s = pd.Series(rsi, index=df.index)
+        lowest = rsi_s.rolling(RSI_WINDOW).min()
+        df["stoch_rsi"] = (rsi_s - lowest) / (rsi_s.rolling(RSI_WINDOW).max() - lowest)
+
+        # Moyenne mobile volume
+        df["volume_ma20"] = volume.rolling(window=VOLUME_WINDOW).mean()
+
+        # Analyse chandelle
+        df["body_size"] = df["close"] - df["open"]
+        df["amplitude"] = df["high"] - df["low"]
+        df["upper_wick"] = df["high"] - df[["close", "open"]].max(axis=1)
+        df["lower_wick"] = df[["close", "open"]].min(axis=1) - df["low"]
+        df["efficiency_ratio"] = np.where(df["amplitude"] != 0, df["body_size"].abs() / df["amplitude"], 0)
+
+        # Variations %
+        for col in PCT_COLUMNS:
+            df[f"{col}_pct_change_1"] = df[col].pct_change()
+
+        # --- État final ---
+        self.n = n
+        if n:
+            self.ema = {w: float(s.iloc[-1]) for w, s in raw.items()}
+            self.macd_signal = float(signal.iloc[-1])
+            self.prev_close = float(close.iloc[-1])
+            self.avg_up = float(avg_up.iloc[-1])
+            self.avg_dn = float(avg_dn.iloc[-1])
+            self.prev = {col: float(df[col].iloc[-1]) for col in PCT_COLUMNS}
+        self.closes = RingBuffer(BOLL_WINDOW, close.to_numpy(dtype=np.float64))
+        self.volumes = RingBuffer(VOLUME_WINDOW, volume.to_numpy(dtype=np.float64))
+        self.rsis = RingBuffer(RSI_WINDOW, rsi)
+        return df
+
+    ###------------------------------------------------------------------------------
+    # Ajout d'une bougie (O(1) par indicateur)
+    ###------------------------------------------------------------------------------
+    def append(self, row) -> dict:
+        """
+        Fait avancer l'état d'une bougie (dict ou Series avec open/high/low/close/volume)
+        et retourne la ligne complétée des indicateurs, dans l'ordre des colonnes de compute().
+        """
+        o, h, l = float(row["open"]), float(row["high"]), float(row["low"])
+        c, v = float(row["close"]), float(row["volume"])
+        self.n += 1
+        n = self.n
+        out = dict(row)
+
+        # EMA
+        for w in self.ema:
+            self.ema[w] = _ewm_step(self.ema[w], c, 2 / (w + 1))
+        for w in EMA_WINDOWS:
+            out[f"ema_{w}"] = self.ema[w] if n >= w else np.nan
+
+        # MACD
+        macd = self.ema[MACD_FAST] - self.ema[MACD_SLOW] if n >= MACD_SLOW else np.nan
+        if not np.isnan(macd):
+            self.macd_signal = _ewm_step(self.macd_signal, macd, 2 / (MACD_SIGN + 1))
+        out["macd"] = macd
+        out["macd_signal"] = self.macd_signal if n >= MACD_SLOW + MACD_SIGN - 1 else np.nan
+
+        # RSI (Wilder)
+        diff = c - self.prev_close
+        up = diff if diff > 0 else 0.0
+        dn = -diff if diff < 0 else 0.0
+        self.avg_up = _ewm_step(self.avg_up, up, 1 / RSI_WINDOW)
+        self.avg_dn = _ewm_step(self.avg_dn, dn, 1 / RSI_WINDOW)
+        self.prev_close = c
+        rsi = float(self._rsi(self.avg_up, self.avg_dn)) if n >= RSI_WINDOW else np.nan
+        out["rsi"] = rsi
+
+        # Bollinger %B
+        self.closes.push(c)
+        mavg = self.closes.values.mean()
+        mstd = self.closes.values.std()
+        hband, lband = mavg + BOLL_DEV * mstd, mavg - BOLL_DEV * mstd
+        out["boll_b"] = (c - lband) / (hband - lband) if hband != lband else np.nan
+
+        # Stoch RSI
+        self.rsis.push(rsi)
+        lowest, highest = self.rsis.values.min(), self.rsis.values.max()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["stoch_rsi"] = np.float64(rsi - lowest) / (highest - lowest)
+
+        # Moyenne mobile volume
+        self.volumes.push(v)
+        out["volume_ma20"] = self.volumes.values.mean()
+
+        # Analyse chandelle
+        body_size, amplitude = c - o, h - l
+        out["body_size"] = body_size
+        out["amplitude"] = amplitude
+        out["upper_wick"] = h - max(c, o)
+        out["lower_wick"] = min(c, o) - l
+        out["efficiency_ratio"] = abs(body_size) / amplitude if amplitude != 0 else 0
+
+        # Variations %
+        current = {"open": o, "high": h, "low": l, "close": c, "volume": v,
+                   "body_size": body_size, "amplitude": amplitude}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for col in PCT_COLUMNS:
+                out[f"{col}_pct_change_1"] = np.float64(current[col]) / self.prev[col] - 1
+        self.prev = current
+        return out
+
+    ###------------------------------------------------------------------------------
+    # Sérialisation de l'état (reprise dans un autre processus)
+    ###------------------------------------------------------------------------------
+    def to_dict(self):
+        def num(x):
+            return None if np.isnan(x) else float(x)
+
+        return {
+            "n": self.n,
+            "ema": {str(w): num(v) for w, v in self.ema.items()},
+            "macd_signal": num(self.macd_signal),
+            "prev_close": num(self.prev_close),
+            "avg_up": num(self.avg_up),
+            "avg_dn": num(self.avg_dn),
+            "closes": self.closes.to_list(),
+            "volumes": self.volumes.to_list(),
+            "rsis": self.rsis.to_list(),
+            "prev": {col: num(v) for col, v in self.prev.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        def num(x):
+            return np.nan if x is None else x
+
+        engine = cls()
+        engine.n = d["n"]
+        engine.ema = {int(w): num(v) for w, v in d["ema"].items()}
+        engine.macd_signal = num(d["macd_signal"])
+        engine.prev_close = num(d["prev_close"])
+        engine.avg_up = num(d["avg_up"])
+        engine.avg_dn = num(d["avg_dn"])
+        engine.closes = RingBuffer.from_list(d["closes"])
+        engine.volumes = RingBuffer.from_list(d["volumes"])
+        engine.rsis = RingBuffer.from_list(d["rsis"])
+        engine.prev = {col: num(v) for col, v in d["prev"].items()}
+        return engine
+
+    @classmethod
+    def _recurrences(cls, close):
+        """Séries des récurrences (EMA brutes, MACD, signal, moyennes de Wilder, RSI) sur tout l'historique."""
+        n = len(close)
+        raw = {w: close.ewm(span=w, adjust=False).mean() for w in EMA_WINDOWS + [MACD_FAST, MACD_SLOW]}
+        macd = (raw[MACD_FAST] - raw[MACD_SLOW]).where(np.arange(n) >= MACD_SLOW - 1)
+        signal = macd.ewm(span=MACD_SIGN, adjust=False).mean()
+        diff = close.diff(1)
+        avg_up = diff.where(diff > 0, 0.0).ewm(alpha=1 / RSI_WINDOW, adjust=False).mean()
+        avg_dn = (-diff.where(diff < 0, 0.0)).ewm(alpha=1 / RSI_WINDOW, adjust=False).mean()
+        rsi = cls._rsi(avg_up.to_numpy(), avg_dn.to_numpy())
+        rsi[:RSI_WINDOW - 1] = np.nan
+        return raw, macd, signal, avg_up, avg_dn, rsi
+
+    @staticmethod
+    def _rsi(avg_up, avg_dn):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(avg_dn == 0, 100, 100 - (100 / (1 + avg_up / avg_dn)))
+
+
+###----------------------------------------------------------------------------------
+# Moteur vectorisé sur N origines (backtests)
+# Même état et mêmes formules que IndicatorEngine.append(), un tableau (N,) par champ :
+# les N historiques avancent d'une bougie simulée en un seul appel. Les tampons
+# glissants sont des matrices (N, fenêtre) remplies dans le même ordre que RingBuffer
+# (position commune) : moyennes et écarts-types identiques au bit près.
+###----------------------------------------------------------------------------------
+class BatchIndicatorEngine:
+    def __init__(self, n, ema, macd_signal, prev_close, avg_up, avg_dn, closes, volumes, rsis, prev):
+        self.n = n
+        self.ema = ema
+        self.macd_signal = macd_signal
+        self.prev_close = prev_close
+        self.avg_up = avg_up
+        self.avg_dn = avg_dn
+        self.buffers = {"closes": closes, "volumes": volumes, "rsis": rsis}
+        self.pos = {name: 0 for name in self.buffers}
+        self.prev = prev
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, origins):
+        """État de IndicatorEngine après chaque ligne `origins` (positions) de l'historique OHLCV `df`."""
+        origins = np.asarray(origins)
+        if origins.min() < BOLL_WINDOW - 1:
+            raise ValueError(f"⛔ Les origines doivent avoir au moins {BOLL_WINDOW} bougies d'historique")
+        close = df["close"].reset_index(drop=True)
+        raw, macd, signal, avg_up, avg_dn, rsi = IndicatorEngine._recurrences(close)
+
+        def window(values, size):
+            return np.lib.stride_tricks.sliding_window_view(np.asarray(values, dtype=np.float64), size)[origins - size + 1].copy()
+
+        current = {"open": df["open"].to_numpy(dtype=np.float64), "high": df["high"].to_numpy(dtype=np.float64),
+                   "low": df["low"].to_numpy(dtype=np.float64), "close": close.to_numpy(dtype=np.float64),
+                   "volume": df["volume"].to_numpy(dtype=np.float64)}
+        current["body_size"] = current["close"] - current["open"]
+        current["amplitude"] = current["high"] - current["low"]
+        return cls(
+            n=origins + 1,
+            ema={w: s.to_numpy()[origins] for w, s in raw.items()},
+            macd_signal=signal.to_numpy()[origins],
+            prev_close=current["close"][origins],
+            avg_up=avg_up.to_numpy()[origins],
+            avg_dn=avg_dn.to_numpy()[origins],
+            closes=window(current["close"], BOLL_WINDOW),
+            volumes=window(current["volume"], VOLUME_WINDOW),
+            rsis=window(rsi, RSI_WINDOW),
+            prev={col: current[col][origins] for col in PCT_COLUMNS},
+        )
+
+    def _push(self, name, x):
+        buffer = self.buffers[name]
+        buffer[:, self.pos[name]] = x
+        self.pos[name] = (self.pos[name] + 1) % buffer.shape[1]
+        return buffer
+
+    @staticmethod
+    def _ewm_step(prev, x, alpha):
+        old_wt = 1.0 - alpha
+        return np.where(np.isnan(prev), x, (old_wt * prev + alpha * x) / (old_wt + alpha))
+
+    def append(self, rows) -> dict:
+        """rows : dict de tableaux (N,) open/high/low/close/volume. Retourne les colonnes de append()."""
+        o, h, l = (np.asarray(rows[k], dtype=np.float64) for k in ("open", "high", "low"))
+        c, v = np.asarray(rows["close"], dtype=np.float64), np.asarray(rows["volume"], dtype=np.float64)
+        self.n = self.n + 1
+        n = self.n
+        out = dict(rows)
+
+        # EMA
+        for w in self.ema:
+            self.ema[w] = self._ewm_step(self.ema[w], c, 2 / (w + 1))
+        for w in EMA_WINDOWS:
+            out[f"ema_{w}"] = np.where(n >= w, self.ema[w], np.nan)
+
+        # MACD
+        macd = np.where(n >= MACD_SLOW, self.ema[MACD_FAST] - self.ema[MACD_SLOW], np.nan)
+        self.macd_signal = np.where(np.isnan(macd), self.macd_signal,
+                                    self._ewm_step(self.macd_signal, macd, 2 / (MACD_SIGN + 1)))
+        out["macd"] = macd
+        out["macd_signal"] = np.where(n >= MACD_SLOW + MACD_SIGN - 1, self.macd_signal, np.nan)
+
+        # RSI (Wilder)
+        diff = c - self.prev_close
+        self.avg_up = self._ewm_step(self.avg_up, np.where(diff > 0, diff, 0.0), 1 / RSI_WINDOW)
+        self.avg_dn = self._ewm_step(self.avg_dn, np.where(diff < 0, -diff, 0.0), 1 / RSI_WINDOW)
+        self.prev_close = c
+        rsi = np.where(n >= RSI_WINDOW, IndicatorEngine._rsi(self.avg_up, self.avg_dn), np.nan)
+        out["rsi"] = rsi
+
+        # Bollinger %B
+        closes = self._push("closes", c)
+        mavg = closes.mean(axis=1)
+        mstd = closes.std(axis=1)
+        hband, lband = mavg + BOLL_DEV * mstd, mavg - BOLL_DEV * mstd
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["boll_b"] = np.where(hband != lband, (c - lband) / (hband - lband), np.nan)
+
+            # Stoch RSI
+            rsis = self._push("rsis", rsi)
+            lowest, highest = rsis.min(axis=1), rsis.max(axis=1)
+            out["stoch_rsi"] = (rsi - lowest) / (highest - lowest)
+
+        # Moyenne mobile volume
+        out["volume_ma20"] = self._push("volumes", v).mean(axis=1)
+
+        # Analyse chandelle
+        body_size, amplitude = c - o, h - l
+        out["body_size"] = body_size
+        out["amplitude"] = amplitude
+        out["upper_wick"] = h - np.maximum(c, o)
+        out["lower_wick"] = np.minimum(c, o) - l
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["efficiency_ratio"] = np.where(amplitude != 0, np.abs(body_size) / amplitude, 0)
+
+        # Variations %
+        current = {"open": o, "high": h, "low": l, "close": c, "volume": v,
+                   "body_size": body_size, "amplitude": amplitude}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for col in PCT_COLUMNS:
+                out[f"{col}_pct_change_1"] = current[col] / self.prev[col] - 1
+        self.prev = current
+        return out
+
+
+def add_indicators(df: pd.DataFrame):
+    """Raccourci : (df enrichi, moteur prêt pour append())."""
+    engine = IndicatorEngine()
+    return engine.compute(df), engine
+
+
+###----------------------------------------------------------------------------------
+# Vérification contre `ta` + comparaison de coût
+###----------------------------------------------------------------------------------
+def add_primary_kpis_ta(df):
+    """Ancien calcul via `ta` (référence)."""
+    import ta
+    for w in EMA_WINDOWS:
+        if len(df) >= w:
+            df[f"ema_{w}"] = ta.trend.ema_indicator(close=df["close"], window=w, fillna=False)
+    macd = ta.trend.MACD(close=df["close"], window_slow=26, window_fast=12, window_sign=9)
+    df["macd"] = macd.macd()
+    df["macd_signal"] = macd.macd_signal()
+    df["rsi"] = ta.momentum.rsi(close=df["close"], window=14)
+    boll = ta.volatility.BollingerBands(close=df["close"], window=20, window_dev=2)
+    df["boll_b"] = boll.bollinger_pband()
+    df["stoch_rsi"] = ta.momentum.stochrsi(close=df["close"], window=14, smooth1=3, smooth2=3)
+    df["volume_ma20"] = df["volume"].rolling(window=20).mean()
+    df["body_size"] = df["close"] - df["open"]
+    df["amplitude"] = df["high"] - df["low"]
+    df["upper_wick"] = df["high"] - df[["close", "open"]].max(axis=1)
+    df["lower_wick"] = df[["close", "open"]].min(axis=1) - df["low"]
+    df["efficiency_ratio"] = np.where(df["amplitude"] != 0, df["body_size"].abs() / df["amplitude"], 0)
+    for col in PCT_COLUMNS:
+        df[f"{col}_pct_change_1"] = df[col].pct_change()
+    return df
+
+
+def make_candles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(60_000 + np.cumsum(rng.normal(0, 50, n)), 1)
+    close[rng.random(n) < 0.05] = np.nan
+    close = pd.Series(close).ffill().to_numpy()
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 30, n))
+    return pd.DataFrame({
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": np.round(rng.gamma(2, 10, n), 3),
+    })
+
+
+def check_against_ta(n=2_000, split=150, rtol=1e-9, atol=1e-9):
+    """
+    compute() reprend les opérations pandas de `ta` : égalité à l'arrondi près.
+    append() recalcule la fenêtre Bollinger exactement (pandas cumule des sommes
+    glissantes) : écarts de l'ordre de 1e-11 sur %B, d'où la tolérance absolue.
+    """
+    import json
+    import time
+    expected = add_primary_kpis_ta(make_candles(n))
+    columns = [c for c in expected.columns if c not in ["open", "high", "low", "close", "volume"]]
+
+    # 1. Calcul complet : mêmes colonnes, même ordre, mêmes valeurs
+    got, engine = add_indicators(make_candles(n))
+    assert list(got.columns) == list(expected.columns)
+    for col in columns:
+        np.testing.assert_allclose(got[col], expected[col], rtol=rtol, atol=atol, err_msg=col)
+    print(f"✅ compute() identique à ta sur {n} bougies ({len(columns)} colonnes)")
+
+    # 2. Historique court + append() bougie par bougie
+    for head in (0, 5, split):
+        candles = make_candles(n)
+        _, engine = add_indicators(candles.head(head).copy())
+        engine = IndicatorEngine.from_dict(json.loads(json.dumps(engine.to_dict())))
+        rows = [engine.append(row) for row in candles.iloc[head:].to_dict(orient="records")]
+        appended = pd.DataFrame(rows)
+        for col in columns:
+            np.testing.assert_allclose(appended[col], expected[col].iloc[head:], rtol=rtol,
+                                       atol=atol, err_msg=f"{col} (historique de {head})")
+    print(f"✅ append() identique à ta après un historique de 0, 5 et {split} bougies (état sérialisé)")
+
+    # 3. Coût d'ajout d'une bougie : recalcul ta complet vs append()
+    for size in (200, 20_000):
+        candles = make_candles(size + 1)
+        t0 = time.perf_counter()
+        add_primary_kpis_ta(candles.copy())
+        full = time.perf_counter() - t0
+        _, engine = add_indicators(candles.head(size).copy())
+        t0 = time.perf_counter()
+        engine.append(candles.iloc[-1])
+        incremental = time.perf_counter() - t0
+        print(f"📊 {size:>6} bougies | recalcul ta : {full * 1000:7.2f} ms | append : {incremental * 1000:5.3f} ms")
+
+    # 4. Moteur vectorisé : mêmes lignes que N moteurs scalaires avancés en parallèle
+    candles, future = make_candles(n), make_candles(n, seed=1)
+    origins = np.array([BOLL_WINDOW - 1, 30, split, n // 2, n - 1])
+    batch = BatchIndicatorEngine.from_history(candles, origins)
+    engines = [add_indicators(candles.head(o + 1).copy())[1] for o in origins]
+    for step in range(15):
+        rows = {col: future[col].to_numpy()[origins + step - origins.min()] for col in ["open", "high", "low", "close", "volume"]}
+        got = batch.append(rows)
+        for i, engine in enumerate(engines):
+            expected = engine.append({col: rows[col][i] for col in rows})
+            for col in columns:
+                np.testing.assert_array_equal(got[col][i], expected[col], err_msg=f"{col} (origine {origins[i]}, pas {step})")
+    print(f"✅ BatchIndicatorEngine identique au bit près à append() ({len(origins)} origines × 15 pas)")
+
+
+if __name__ == "__main__":
+    check_against_ta()
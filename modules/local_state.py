@@ -0,0 +1,22 @@
+import json
+import os
+
+###----------------------------------------------------------------------------------
+# État local du pipeline (hors Supabase), partagé par tous les modules
+# P3_STATE_DIR : watermarks, checkpoints de tendances, feature store, miroir des prix,
+# registre de modèles, spool, session, recherche et benchmarks.
+# write_json : écriture atomique (.tmp puis os.replace), un lecteur concurrent voit
+# l'ancien ou le nouveau fichier, jamais un fichier tronqué.
+###----------------------------------------------------------------------------------
+
+STATE_DIR = os.environ.get("P3_STATE_DIR", "/tmp/p3_state")
+
+
+def write_json(path, payload, mode=0o666, **dump_kwargs):
+    """Écrit payload en JSON dans path de façon atomique ; mode = permissions du fichier créé."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f, **dump_kwargs)
+    os.replace(tmp, path)
@@ -0,0 +1,242 @@
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+import joblib
+from compiled_forest import CompiledForest
+from model_registry import LEARNERS_KEY
+
+###----------------------------------------------------------------------------------
+# Cache de modèles en mémoire (LRU plafonné) avec validation de version
+# - Chaque artefact est chargé une seule fois par processus (joblib.load).
+# - La version de référence est l'eTag (à défaut updated_at) de l'objet dans le bucket,
+#   relue par un seul listing du bucket au plus toutes les VERSION_TTL secondes.
+# - Le fichier local de /tmp/models est accompagné d'un .version : il n'est
+#   re-téléchargé que si l'objet du bucket a changé (modèle ré-entraîné).
+# - Les forêts sont compilées une fois par version ({nom}.compiled) puis relues en
+#   memory-map : pas de joblib.load ni de predict sklearn sur le chemin chaud.
+# - Avec un registre (model_registry), la version de référence est le pointeur
+#   "current" de l'index du registre ; les modèles absents du registre retombent sur
+#   l'ancien objet {nom}.pkl à la racine du bucket.
+###----------------------------------------------------------------------------------
+
+MODEL_DIR = os.environ.get("P3_MODEL_DIR", "/tmp/models/")
+# Plafond mémoire des modèles résidents (Mo)
+MAX_BYTES = int(float(os.environ.get("P3_MODEL_CACHE_MB", "1024")) * 1024 * 1024)
+# Durée de validité du listing des versions (secondes)
+VERSION_TTL = float(os.environ.get("P3_MODEL_VERSION_TTL", "60"))
+# Inférence via forêts compilées (0 : modèles sklearn tels quels)
+COMPILED = os.environ.get("P3_COMPILED_MODELS", "1") == "1"
+
+
+def _object_version(obj):
+    metadata = obj.get("metadata") or {}
+    return metadata.get("eTag") or obj.get("updated_at") or obj.get("id")
+
+
+def model_nbytes(model):
+    """Taille résidente estimée : somme des tableaux NumPy des arbres, sinon taille du pickle."""
+    if isinstance(model, CompiledForest):
+        return model.nbytes
+    estimators = getattr(model, "estimators_", None)
+    if estimators is not None and all(hasattr(e, "tree_") for e in estimators):
+        total = 0
+        for est in estimators:
+            state = est.tree_.__getstate__()
+            total += state["nodes"].nbytes + state["values"].nbytes
+        return total
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ModelCache:
+    def __init__(self, supabase, bucket_name, model_dir=MODEL_DIR, max_bytes=MAX_BYTES, version_ttl=VERSION_TTL,
+                 compiled=COMPILED, registry=None):
+        self.supabase = supabase
+        self.bucket_name = bucket_name
+        self.model_dir = model_dir
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self.compiled = compiled
+        self.registry = registry
+        self._registry_names = set()
+        self._learners = {}
+        self._entries = OrderedDict()  # nom → (modèle, version, octets)
+        self._versions = {}
+        self._versions_at = 0.0
+        self._lock = threading.RLock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "downloads": 0,
+            "evictions": 0,
+            "load_s": 0.0,
+            "download_s": 0.0,
+            "compiles": 0,
+            "resident_bytes": 0,
+        }
+        os.makedirs(model_dir, exist_ok=True)
+
+    ###------------------------------------------------------------------------------
+    # Versions distantes
+    ###------------------------------------------------------------------------------
+    def _bucket(self):
+        return self.supabase.storage.from_(self.bucket_name)
+
+    def refresh_versions(self, force=False):
+        """Un seul appel de listing pour tous les modèles du bucket (au plus toutes les version_ttl s)."""
+        with self._lock:
+            if not force and time.time() - self._versions_at < self.version_ttl:
+                return self._versions
+            try:
+                objects = self._bucket().list(None, {"limit": 1000})
+                versions = {obj["name"][:-4]: _object_version(obj) for obj in objects if obj["name"].endswith(".pkl")}
+                if self.registry is not None:
+                    index = self.registry.index(refresh=True)
+                    current = {name: entry["current"] for name, entry in index.items() if name != LEARNERS_KEY}
+                    self._learners = index.get(LEARNERS_KEY, {})
+                    self._registry_names = set(current)
+                    versions.update(current)
+                self._versions = versions
+                self._versions_at = time.time()
+            except Exception as e:
+                # Bucket injoignable : on garde les versions connues (modèles en cache / sur disque)
+                print(f"⚠️ Listing du bucket {self.bucket_name} impossible : {e}")
+            return self._versions
+
+    def remote_version(self, name):
+        return self.refresh_versions().get(name)
+
+    def learners(self):
+        """Apprenant servi par table publié dans le registre (rafraîchi avec les versions)."""
+        self.refresh_versions()
+        return self._learners
+
+    ###------------------------------------------------------------------------------
+    # Fichier local + sidecar de version
+    ###------------------------------------------------------------------------------
+    def _local_path(self, name):
+        return os.path.join(self.model_dir, f"{name}.pkl")
+
+    def _local_version(self, name):
+        try:
+            with open(self._local_path(name) + ".version", "r") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _download(self, name, version):
+        t0 = time.perf_counter()
+        try:
+            data = self._bucket().download(f"{name}.pkl")
+        except Exception as e:
+            raise Exception(f"⚠️ Erreur téléchargement Supabase pour {name} : {e}")
+        path = self._local_path(name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        with open(path + ".version", "w") as f:
+            f.write(version or "")
+        self.stats["downloads"] += 1
+        self.stats["download_s"] += time.perf_counter() - t0
+        print(f"✅ Modèle téléchargé : {name}")
+
+    def _load(self, name, path, version, mmap_mode=None):
+        if not self.compiled:
+            return joblib.load(path, mmap_mode=mmap_mode)
+        compiled_path = path + ".compiled"
+        try:
+            with open(os.path.join(compiled_path, "meta.json"), "r") as f:
+                compiled_version = json.load(f).get("version")
+            if compiled_version == (version or ""):
+                return CompiledForest.load(compiled_path)
+        except FileNotFoundError:
+            pass
+        model = joblib.load(path, mmap_mode=mmap_mode)
+        if not hasattr(model, "estimators_"):
+            return model
+        compiled = CompiledForest.from_model(model)
+        compiled.meta["version"] = version or ""
+        compiled.save(compiled_path)
+        self.stats["compiles"] += 1
+        print(f"🛠️ Modèle compilé : {name}")
+        return CompiledForest.load(compiled_path)
+
+    ###------------------------------------------------------------------------------
+    # Accès
+    ###------------------------------------------------------------------------------
+    def get(self, name):
+        with self._lock:
+            version = self.remote_version(name)
+            entry = self._entries.get(name)
+            if entry is not None and (version is None or entry[1] == version):
+                self._entries.move_to_end(name)
+                self.stats["hits"] += 1
+                return entry[0]
+
+            self.stats["misses"] += 1
+            if name in self._registry_names:
+                # Artefact immuable du registre (non compressé → memory-map)
+                if not os.path.exists(self.registry.artifact_path(name, version)):
+                    t0 = time.perf_counter()
+                    self.registry.fetch(name, version)
+                    self.stats["downloads"] += 1
+                    self.stats["download_s"] += time.perf_counter() - t0
+                path, mmap_mode = self.registry.artifact_path(name, version), "r"
+            else:
+                local_exists = os.path.exists(self._local_path(name))
+                if not local_exists or (version is not None and self._local_version(name) != version):
+                    print(f"📥 Téléchargement du modèle {name}...")
+                    self._download(name, version)
+                if version is None:
+                    version = self._local_version(name)
+                path, mmap_mode = self._local_path(name), None
+
+            t0 = time.perf_counter()
+            model = self._load(name, path, version, mmap_mode)
+            self.stats["load_s"] += time.perf_counter() - t0
+
+            if entry is not None:
+                self._evict(name)
+            self._entries[name] = (model, version, model_nbytes(model))
+            self.stats["resident_bytes"] += self._entries[name][2]
+            self._enforce_cap()
+            return model
+
+    def invalidate(self, name=None):
+        with self._lock:
+            for key in [name] if name else list(self._entries):
+                if key in self._entries:
+                    self._evict(key)
+            self._versions_at = 0.0
+
+    def _evict(self, name):
+        _, _, nbytes = self._entries.pop(name)
+        self.stats["resident_bytes"] -= nbytes
+
+    def _enforce_cap(self):
+        # On garde toujours au moins le modèle le plus récent
+        while self.stats["resident_bytes"] > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+            self.stats["evictions"] += 1
+
+    ###------------------------------------------------------------------------------
+    # Statistiques
+    ###------------------------------------------------------------------------------
+    def snapshot_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["resident_models"] = len(self._entries)
+            return stats
+
+    def print_stats(self):
+        s = self.snapshot_stats()
+        lookups = s["hits"] + s["misses"]
+        ratio = s["hits"] / lookups if lookups else 0.0
+        print(f"\n📊 Cache modèles : {s['hits']} hits / {s['misses']} misses ({ratio:.0%}) | "
+              f"{s['downloads']} téléchargement(s) en {s['download_s']:.2f}s | "
+              f"chargements {s['load_s']:.2f}s ({s['compiles']} compilation(s)) | {s['resident_models']} modèle(s) résident(s), "
+              f"{s['resident_bytes'] / 1024 / 1024:.1f} Mo (plafond {self.max_bytes / 1024 / 1024:.0f} Mo) | "
+              f"{s['evictions']} éviction(s)")
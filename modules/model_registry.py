@@ -0,0 +1,324 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+import joblib
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Registre de modèles versionnés
+# Chaque entraînement produit une version immuable :
+#   {root}/{nom}/{version}/model.joblib   (joblib non compressé → joblib.load(mmap_mode="r"))
+#   {root}/{nom}/{version}/manifest.json  (features, fenêtre d'entraînement, métriques, sha256)
+# La version courante de chaque modèle est un pointeur dans index.json :
+#   {nom: {"current": version, "history": [versions promues, dans l'ordre]},
+#    "_learners": {table: apprenant servi}}   (publié par l'entraînement, lu en P3_LEARNER=auto)
+# Promotion et rollback réécrivent uniquement l'index (os.replace en local, objet
+# unique registry/index.json dans le bucket) : bascule atomique, artefacts jamais écrasés.
+###----------------------------------------------------------------------------------
+
+REGISTRY_DIR = os.environ.get("P3_REGISTRY_DIR", os.path.join(STATE_DIR, "registry"))
+REMOTE_PREFIX = "registry"
+
+# Clé réservée de l'index (n'est pas un modèle)
+LEARNERS_KEY = "_learners"
+
+ARTIFACT = "model.joblib"
+MANIFEST = "manifest.json"
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _missing_object(error):
+    """Objet absent du bucket : FileNotFoundError (SQLite) ou réponse « not found » / 404 de Supabase Storage."""
+    if isinstance(error, FileNotFoundError):
+        return True
+    text = str(error).lower()
+    return "not found" in text or "not_found" in text or "404" in text
+
+
+class ModelRegistry:
+    def __init__(self, supabase=None, bucket_name="models", root=REGISTRY_DIR):
+        # supabase=None : registre purement local (pas de publication dans le bucket)
+        self.supabase = supabase
+        self.bucket_name = bucket_name
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(root, exist_ok=True)
+
+    ###------------------------------------------------------------------------------
+    # Chemins
+    ###------------------------------------------------------------------------------
+    def version_dir(self, name, version):
+        return os.path.join(self.root, name, version)
+
+    def artifact_path(self, name, version):
+        return os.path.join(self.version_dir(name, version), ARTIFACT)
+
+    def _remote(self, name, version, filename):
+        return f"{REMOTE_PREFIX}/{name}/{version}/{filename}"
+
+    def _bucket(self):
+        return self.supabase.storage.from_(self.bucket_name)
+
+    ###------------------------------------------------------------------------------
+    # Index (pointeur de version courante)
+    ###------------------------------------------------------------------------------
+    def index(self, refresh=False):
+        """
+        Index des versions courantes ; refresh=True le relit depuis le bucket. Seul un index
+        distant absent (premier entraînement) retombe sur la copie locale : toute autre erreur
+        est levée, pour que promote / rollback ne republient jamais un index périmé.
+        """
+        if refresh and self.supabase is not None:
+            try:
+                index = json.loads(self._bucket().download(f"{REMOTE_PREFIX}/index.json"))
+            except Exception as e:
+                if not _missing_object(e):
+                    raise
+                print("ℹ️ Pas d'index distant : copie locale utilisée")
+            else:
+                write_json(self.index_path, index, indent=2, default=str)
+                return index
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_index(self, index):
+        write_json(self.index_path, index, indent=2, default=str)
+        if self.supabase is not None:
+            payload = json.dumps(index, indent=2).encode()
+            self._bucket().upload(f"{REMOTE_PREFIX}/index.json", payload, {"upsert": "true"})
+
+    def current(self, name, refresh=False):
+        return (self.index(refresh).get(name) or {}).get("current")
+
+    def learners(self, refresh=False):
+        """Apprenant servi par table, tel que publié par l'entraînement."""
+        return dict(self.index(refresh).get(LEARNERS_KEY, {}))
+
+    def select_learner(self, table, learner):
+        """Publie l'apprenant servi pour la table (une fois ses modèles promus)."""
+        index = self.index(refresh=True)
+        learners = index.setdefault(LEARNERS_KEY, {})
+        if learners.get(table) == learner:
+            return
+        learners[table] = learner
+        self._save_index(index)
+        print(f"🎯 Registre : {table} servi par {learner}")
+
+    ###------------------------------------------------------------------------------
+    # Enregistrement
+    ###------------------------------------------------------------------------------
+    def register(self, name, model, features, training_window, metrics, params=None, extra=None):
+        """Écrit une nouvelle version immuable (artefact + manifeste) et la publie. Retourne le manifeste."""
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        tmp_dir = os.path.join(self.root, name, f".{stamp}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, ARTIFACT)
+        joblib.dump(model, tmp_path)  # non compressé : memory-mappable
+
+        checksum = _sha256(tmp_path)
+        version = f"{stamp}-{checksum[:8]}"
+        manifest = {
+            "name": name,
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "model_class": type(model).__name__,
+            "features": [str(c) for c in features],
+            "training_window": training_window,
+            "metrics": metrics,
+            "params": params or {},
+            "sha256": checksum,
+            "bytes": os.path.getsize(tmp_path),
+            **(extra or {}),
+        }
+        write_json(os.path.join(tmp_dir, MANIFEST), manifest, indent=2, default=str)
+        os.replace(tmp_dir, self.version_dir(name, version))
+
+        if self.supabase is not None:
+            bucket = self._bucket()
+            with open(self.artifact_path(name, version), "rb") as f:
+                bucket.upload(self._remote(name, version, ARTIFACT), f.read())
+            bucket.upload(self._remote(name, version, MANIFEST), json.dumps(manifest, indent=2, default=str).encode())
+        print(f"📦 Registre : {name} version {version} ({manifest['bytes'] / 1024 / 1024:.1f} Mo)")
+        return manifest
+
+    def manifest(self, name, version):
+        """Manifeste d'une version ; lu dans le bucket (sans l'artefact) si la version n'est pas locale."""
+        path = os.path.join(self.version_dir(name, version), MANIFEST)
+        if not os.path.exists(path) and self.supabase is not None:
+            return json.loads(self._bucket().download(self._remote(name, version, MANIFEST)))
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def versions(self, name):
+        """Versions présentes localement (ordre chronologique)."""
+        base = os.path.join(self.root, name)
+        if not os.path.isdir(base):
+            return []
+        return sorted(v for v in os.listdir(base) if not v.startswith("."))
+
+    ###------------------------------------------------------------------------------
+    # Promotion / rollback
+    ###------------------------------------------------------------------------------
+    def promote(self, name, version):
+        if not os.path.isdir(self.version_dir(name, version)) and self.supabase is None:
+            raise ValueError(f"⛔ Version inconnue : {name} {version}")
+        index = self.index(refresh=True)
+        entry = index.setdefault(name, {"current": None, "history": []})
+        if entry["current"] == version:
+            return
+        entry["current"] = version
+        entry["history"].append(version)
+        self._save_index(index)
+        print(f"🚀 Registre : {name} → {version}")
+
+    def rollback(self, name):
+        """Revient à la version promue précédente. Retourne la version restaurée."""
+        index = self.index(refresh=True)
+        entry = index.get(name)
+        if not entry or len(entry["history"]) < 2:
+            raise ValueError(f"⛔ Aucune version précédente pour {name}")
+        entry["history"].pop()
+        entry["current"] = entry["history"][-1]
+        self._save_index(index)
+        print(f"⏪ Registre : {name} → {entry['current']}")
+        return entry["current"]
+
+    ###------------------------------------------------------------------------------
+    # Récupération / chargement
+    ###------------------------------------------------------------------------------
+    def fetch(self, name, version):
+        """Chemin local de l'artefact, téléchargé et vérifié (sha256) s'il est absent."""
+        path = self.artifact_path(name, version)
+        if os.path.exists(path):
+            return path
+        if self.supabase is None:
+            raise FileNotFoundError(f"⛔ Artefact absent : {path}")
+
+        t0 = time.perf_counter()
+        bucket = self._bucket()
+        manifest = json.loads(bucket.download(self._remote(name, version, MANIFEST)))
+        tmp_dir = os.path.join(self.root, name, f".{version}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        with open(os.path.join(tmp_dir, ARTIFACT), "wb") as f:
+            f.write(bucket.download(self._remote(name, version, ARTIFACT)))
+        if _sha256(os.path.join(tmp_dir, ARTIFACT)) != manifest["sha256"]:
+            raise ValueError(f"⛔ Checksum invalide pour {name} {version}")
+        write_json(os.path.join(tmp_dir, MANIFEST), manifest, indent=2, default=str)
+        os.replace(tmp_dir, self.version_dir(name, version))
+        print(f"✅ Registre : {name} {version} téléchargé en {time.perf_counter() - t0:.2f}s")
+        return path
+
+    def load(self, name, version=None, mmap_mode="r"):
+        version = version or self.current(name)
+        if version is None:
+            raise ValueError(f"⛔ Aucune version courante pour {name}")
+        return joblib.load(self.fetch(name, version), mmap_mode=mmap_mode)
+
+
+###----------------------------------------------------------------------------------
+# Benchmark : chargement à froid et RSS (un sous-processus par format)
+###----------------------------------------------------------------------------------
+_LOAD_SNIPPET = """
+import sys, time, json
+def rss():
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) * 1024
+    return fields
+fmt, path = sys.argv[1], sys.argv[2]
+import joblib, numpy as np
+import sklearn.ensemble  # import hors mesure : seul le chargement de l'artefact est compté
+from compiled_forest import CompiledForest
+X = np.zeros((1, int(sys.argv[3])), dtype=np.float32)
+before = rss()
+t0 = time.perf_counter()
+if fmt == "joblib_compress3":
+    model = joblib.load(path)
+elif fmt == "joblib_mmap":
+    model = joblib.load(path, mmap_mode="r")
+else:
+    model = CompiledForest.load(path)
+model.predict(X)
+elapsed = time.perf_counter() - t0
+after = rss()
+print(json.dumps({"load_s": elapsed, **{k: after[k] - before[k] for k in after}}))
+"""
+
+
+def benchmark_formats(n_rows=20_000, n_features=30, work_dir="/tmp/p3_registry_bench"):
+    import subprocess
+    import sys
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+    from compiled_forest import CompiledForest
+    from forecaster import FOREST_PARAMS
+
+    os.makedirs(work_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    y = X[:, 0] * 3 + np.sin(X[:, 1]) + rng.normal(scale=0.1, size=n_rows)
+    model = RandomForestRegressor(**FOREST_PARAMS).fit(X, y)
+
+    paths = {
+        "joblib_compress3": os.path.join(work_dir, "model_c3.pkl"),
+        "joblib_mmap": os.path.join(work_dir, ARTIFACT),
+        "compiled_mmap": os.path.join(work_dir, "model.compiled"),
+    }
+    joblib.dump(model, paths["joblib_compress3"], compress=3)
+    joblib.dump(model, paths["joblib_mmap"])
+    CompiledForest.from_model(model).save(paths["compiled_mmap"])
+
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    print(f"\n{'format':<18}{'taille':>10}{'chargement':>12}{'RSS':>10}{'dont privé':>12}{'dont fichier':>14}")
+    results = {}
+    for fmt, path in paths.items():
+        size = (sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                if os.path.isdir(path) else os.path.getsize(path))
+        out = subprocess.run([sys.executable, "-c", _LOAD_SNIPPET, fmt, path, str(n_features)],
+                             capture_output=True, text=True, env=env, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        results[fmt] = {"bytes": size, **r}
+        mb = 1024 * 1024
+        print(f"{fmt:<18}{size / mb:>8.1f}Mo{r['load_s'] * 1000:>10.0f}ms{r['VmRSS'] / mb:>8.1f}Mo"
+              f"{r['RssAnon'] / mb:>10.1f}Mo{r['RssFile'] / mb:>12.1f}Mo")
+    return results
+
+
+if __name__ == "__main__":
+    # python model_registry.py list [nom] | promote nom version | rollback nom | bench
+    import sys
+    from supabase_client import get_client
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "bench":
+        benchmark_formats()
+        sys.exit(0)
+
+    registry = ModelRegistry(get_client())
+    if command == "list":
+        index = registry.index(refresh=True)
+        for name in sys.argv[2:] or sorted(n for n in index if n != LEARNERS_KEY):
+            entry = index.get(name, {})
+            print(f"📦 {name} : courante {entry.get('current')} | historique {entry.get('history', [])}")
+        print(f"🎯 Apprenants servis : {index.get(LEARNERS_KEY, {})}")
+    elif command == "promote":
+        registry.promote(sys.argv[2], sys.argv[3])
+    elif command == "rollback":
+        registry.rollback(sys.argv[2])
+    else:
+        raise SystemExit(f"Commande inconnue : {command}")
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import mean_squared_error, mean_absolute_percentage_error
+from sklearn.model_selection import ParameterSampler
+from threadpoolctl import threadpool_limits
+from forecaster import FeatureBinner, LEARNERS, LEARNER_PARAMS, TUNED_PARAMS_PATH, tuned_params
+from feature_store import feature_hash
+from train_scheduler import CPU_BUDGET, START_METHOD
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Validation croisée walk-forward + recherche d'hyperparamètres (successive halving)
+# - Plis à fenêtre croissante : train = [0, fin_k), test = [fin_k + GAP, fin_k + GAP + taille)
+#   (GAP = 1 : la cible shifted_* de la dernière ligne d'entraînement est la première
+#   bougie de test)
+# - Matrices construites une seule fois par table et sauvées en .npy, relues en
+#   memory-map par les workers : X/Y communs (les plis sont des préfixes) et, pour hgb,
+#   une matrice binnée par pli (binner appris sur le train du pli uniquement)
+# - Successive halving : ressource = part des lignes d'entraînement (sous-échantillon régulier) ;
+#   à chaque tour, seul le meilleur 1/ETA des candidats passe au tour suivant ; le gagnant
+#   est toujours scoré sur toutes les lignes avant la comparaison des apprenants
+# - Budget de temps par table (P3_SEARCH_BUDGET_S) ; meilleure configuration par
+#   table et par apprenant écrite dans TUNED_PARAMS_PATH (lue par l'entraînement)
+###----------------------------------------------------------------------------------
+
+SEARCH_DIR = os.environ.get("P3_SEARCH_DIR", os.path.join(STATE_DIR, "search"))
+N_FOLDS = int(os.environ.get("P3_SEARCH_FOLDS", "4"))
+N_CANDIDATES = int(os.environ.get("P3_SEARCH_CANDIDATES", "18"))
+BUDGET_S = float(os.environ.get("P3_SEARCH_BUDGET_S", "900"))
+# Cible utilisée pour le score (paramètres partagés par les cinq cibles de la table)
+SEARCH_TARGET = os.environ.get("P3_SEARCH_TARGET", "shifted_close")
+ETA = 3
+GAP = 1
+# Part des lignes réservée au premier entraînement (le reste est découpé en N_FOLDS blocs de test)
+MIN_TRAIN_SHARE = 0.5
+
+SEARCH_SPACE = {
+    "rf": {
+        "max_depth": [6, 8, 10, 14, 18],
+        "min_samples_leaf": [1, 5, 20, 50],
+        "max_features": [1.0, 0.7, 0.5, "sqrt"],
+    },
+    "hgb": {
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "max_iter": [100, 200, 400],
+        "max_leaf_nodes": [15, 31, 63],
+        "min_samples_leaf": [20, 50, 100],
+        "l2_regularization": [0.0, 0.1, 1.0],
+    },
+}
+
+
+def walk_forward_folds(n_rows, n_folds=N_FOLDS, min_train_share=MIN_TRAIN_SHARE, gap=GAP):
+    """Liste de (fin du train, début du test, fin du test) à fenêtre d'entraînement croissante."""
+    first = int(n_rows * min_train_share)
+    test_size = (n_rows - first) // n_folds
+    folds = []
+    for k in range(n_folds):
+        train_end = first + k * test_size
+        folds.append((train_end, train_end + gap, min(train_end + test_size, n_rows)))
+    return folds
+
+
+###----------------------------------------------------------------------------------
+# Matrices des plis (construites une fois, memory-map)
+###----------------------------------------------------------------------------------
+class FoldCache:
+    def __init__(self, table, features, Y, folds, root=SEARCH_DIR):
+        self.table = table
+        self.folds = folds
+        key = hashlib.sha256(f"{feature_hash()}|{len(features)}|{features.index[-1]}|{list(Y.columns)}".encode())
+        self.table_dir = os.path.join(root, table)
+        self.dir = os.path.join(self.table_dir, key.hexdigest()[:16])
+        os.makedirs(self.dir, exist_ok=True)
+        self._features, self._Y = features, Y
+
+    def path(self, name):
+        return os.path.join(self.dir, f"{name}.npy")
+
+    def _save(self, name, array):
+        if not os.path.exists(self.path(name)):
+            np.save(self.path(name) + ".tmp.npy", array)
+            os.replace(self.path(name) + ".tmp.npy", self.path(name))
+        return self.path(name)
+
+    def build(self, learners):
+        """Écrit X, Y et les matrices binnées des plis ; retourne les chemins par apprenant et par pli."""
+        t0 = time.perf_counter()
+        X = np.ascontiguousarray(self._features.to_numpy(dtype=np.float32))
+        paths = {"X": self._save("X", X), "Y": self._save("Y", self._Y.to_numpy(dtype=np.float64))}
+        for k, (train_end, _, test_end) in enumerate(self.folds):
+            if "hgb" in learners and not os.path.exists(self.path(f"fold{k}_binned")):
+                binner = FeatureBinner().fit(X[:train_end])
+                self._save(f"fold{k}_binned", binner.transform(X[:test_end]))
+            paths[f"fold{k}_binned"] = self.path(f"fold{k}_binned")
+        print(f"🗂️ {self.table} : matrices des plis prêtes en {time.perf_counter() - t0:.1f}s ({self.dir})")
+        self._prune()
+        return paths
+
+    def _prune(self):
+        """Supprime les matrices des recherches précédentes de la table (clés périmées)."""
+        for name in os.listdir(self.table_dir):
+            path = os.path.join(self.table_dir, name)
+            if path != self.dir and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+# Matrices déjà ouvertes dans ce worker (chemin → memmap)
+_opened = {}
+
+
+def _open(path):
+    if path not in _opened:
+        _opened[path] = np.load(path, mmap_mode="r")
+    return _opened[path]
+
+
+###----------------------------------------------------------------------------------
+# Évaluation d'un (candidat, pli, ressource) — exécutée dans un worker
+###----------------------------------------------------------------------------------
+def evaluate(task):
+    t0 = time.perf_counter()
+    k, (train_end, test_start, test_end) = task["fold"]
+    y = _open(task["paths"]["Y"])[:, task["target_col"]]
+    X = _open(task["paths"]["X"] if task["learner"] == "rf" else task["paths"][f"fold{k}_binned"])
+    # Ressource : sous-échantillon régulier (pas de 1/ressource) de toute la fenêtre d'entraînement,
+    # pour couvrir tout l'intervalle de prix (une forêt n'extrapole pas)
+    step = max(1, round(1 / task["resource"]))
+
+    params = {**LEARNER_PARAMS[task["learner"]], **task["params"]}
+    with threadpool_limits(1):
+        if task["learner"] == "rf":
+            model = RandomForestRegressor(**params, n_jobs=1)
+        else:
+            model = HistGradientBoostingRegressor(**params)
+        model.fit(X[:train_end:step], y[:train_end:step])
+        pred = model.predict(X[test_start:test_end])
+    truth = y[test_start:test_end]
+    return {"candidate": task["candidate"], "fold": k,
+            "mape": float(mean_absolute_percentage_error(truth, pred)),
+            "rmse": float(mean_squared_error(truth, pred) ** 0.5),
+            "wall_s": time.perf_counter() - t0}
+
+
+def score_candidates(pool, paths, folds, learner, candidates, alive, target_col, resource):
+    """MAPE / RMSE moyens sur tous les plis de chaque candidat de `alive`, à la ressource donnée."""
+    tasks = [{"learner": learner, "params": candidates[c], "candidate": c, "fold": (k, fold),
+              "resource": resource, "paths": paths, "target_col": target_col}
+             for c in alive for k, fold in enumerate(folds)]
+    results = list(pool.map(evaluate, tasks))
+    return {c: {"mape": float(np.mean([res["mape"] for res in results if res["candidate"] == c])),
+                "rmse": float(np.mean([res["rmse"] for res in results if res["candidate"] == c]))}
+            for c in alive}
+
+
+def successive_halving(pool, paths, folds, learner, candidates, target_col, budget_s):
+    """
+    Tours de successive halving ; retourne (meilleur candidat, score, historique des tours).
+    Le score retourné est toujours mesuré sur toutes les lignes (ressource 1) : si le budget
+    arrête la recherche sur un sous-échantillon, le gagnant est réévalué, pour que les
+    scores de deux apprenants restent comparables.
+    """
+    rounds = max(1, math.ceil(math.log(len(candidates), ETA)) + 1)
+    alive = list(range(len(candidates)))
+    history, scores = [], {}
+    t0 = time.perf_counter()
+    for r in range(rounds):
+        resource = ETA ** (r - rounds + 1)
+        scores = score_candidates(pool, paths, folds, learner, candidates, alive, target_col, resource)
+        ranked = sorted(alive, key=lambda c: scores[c]["mape"])
+        elapsed = time.perf_counter() - t0
+        history.append({"round": r, "resource": resource, "candidates": len(alive), "elapsed_s": elapsed,
+                        "best_mape": scores[ranked[0]]["mape"]})
+        print(f"   🔎 {learner} tour {r + 1}/{rounds} : {len(alive)} candidat(s) × {len(folds)} plis, "
+              f"{resource:.0%} des lignes | meilleur MAPE {scores[ranked[0]]['mape']:.3%} | {elapsed:.0f}s")
+        alive = ranked[:max(1, math.ceil(len(alive) / ETA))]
+        if len(ranked) == 1:
+            break
+        if elapsed > budget_s:
+            print(f"   ⏳ Budget de {budget_s:.0f}s atteint : arrêt après le tour {r + 1}")
+            break
+    best = alive[0]
+    if resource < 1:
+        scores = score_candidates(pool, paths, folds, learner, candidates, [best], target_col, 1)
+        print(f"   🎯 {learner} : gagnant réévalué sur 100% des lignes | MAPE {scores[best]['mape']:.3%}")
+    return candidates[best], scores[best], history
+
+
+###----------------------------------------------------------------------------------
+# Recherche par table
+###----------------------------------------------------------------------------------
+def search_table(pool, table, features, Y, targets, learners=LEARNERS, n_candidates=N_CANDIDATES,
+                 budget_s=BUDGET_S, seed=42):
+    folds = walk_forward_folds(len(features))
+    paths = FoldCache(table, features, Y[targets], folds).build(learners)
+    target_col = targets.index(SEARCH_TARGET)
+
+    config = {"folds": folds, "target": SEARCH_TARGET}
+    for learner in learners:
+        candidates = [{k: (v.item() if hasattr(v, "item") else v) for k, v in c.items()}
+                      for c in ParameterSampler(SEARCH_SPACE[learner], n_candidates, random_state=seed)]
+        # Paramètres actuels toujours évalués (référence)
+        candidates.insert(0, {k: LEARNER_PARAMS[learner][k] for k in SEARCH_SPACE[learner] if k in LEARNER_PARAMS[learner]})
+        t0 = time.perf_counter()
+        params, score, history = successive_halving(pool, paths, folds, learner, candidates, target_col,
+                                                    budget_s / len(learners))
+        config[learner] = {"params": params, "cv": score, "rounds": history, "search_s": time.perf_counter() - t0}
+        print(f"✅ {table} [{learner}] : {params} | CV MAPE {score['mape']:.3%} RMSE {score['rmse']:.2f}")
+    config["best"] = min(learners, key=lambda l: config[l]["cv"]["mape"])
+    return config
+
+
+def search_tables(datasets, targets, learners=LEARNERS, path=TUNED_PARAMS_PATH):
+    """datasets : {table: (features, Y)} → configurations écrites dans path (fusionnées avec l'existant)."""
+    try:
+        with open(path, "r") as f:
+            tuned = json.load(f)
+    except FileNotFoundError:
+        tuned = {}
+
+    workers = max(1, CPU_BUDGET)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(START_METHOD)) as pool:
+        for table, (features, Y) in datasets.items():
+            print(f"\n🧪 Recherche {table} : {len(features)} lignes, {N_FOLDS} plis, {workers} worker(s)")
+            tuned[table] = search_table(pool, table, features, Y, targets, learners)
+
+    write_json(path, tuned, indent=2)
+    if path == TUNED_PARAMS_PATH:
+        tuned_params(refresh=True)
+
+    print(f"\n📋 Configurations retenues ({path})")
+    for table in datasets:
+        cfg = tuned[table]
+        print(f"   {table} → {cfg['best']} {cfg[cfg['best']]['params']} (CV MAPE {cfg[cfg['best']]['cv']['mape']:.3%})")
+    return tuned
+
+
+if __name__ == "__main__":
+    # Recherche sur données synthétiques : python model_search.py [nombre de bougies]
+    # (sur les vraies tables : P3_MODEL_MODE=search python train_all_models.py)
+    import sys
+    from indicators import make_candles, add_indicators
+    from forecaster import TARGETS
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    df, _ = add_indicators(make_candles(n))
+    for col in ["open", "high", "low", "close", "volume"]:
+        df[f"shifted_{col}"] = df[col].shift(-1)
+    df = df.replace([np.inf, -np.inf], np.nan).dropna()
+    features = df.drop(columns=TARGETS).astype(np.float32)
+    search_tables({"synthetic": (features, df[TARGETS])}, TARGETS,
+                  path=os.path.join(SEARCH_DIR, "synthetic_params.json"))
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+###----------------------------------------------------------------------------------
+# Lecture paginée (keyset sur `date`) des tables de prix
+# Un select("*") sur un mois ou une année de bougies minute est soit tronqué
+# silencieusement par la limite de lignes de PostgREST, soit matérialisé en un
+# énorme JSON/DataFrame. Ici on parcourt l'intervalle page par page
+# (date > dernière date lue) et chaque page est rendue sous forme de tableaux
+# NumPy compacts, ce qui permet d'agréger à mémoire constante.
+###----------------------------------------------------------------------------------
+
+OHLCV_FIELDS = ["open", "high", "low", "close", "volume"]
+PAGE_SIZE = 1000
+
+
+def _to_chunk(rows, fields):
+    dates = pd.to_datetime([r["date"] for r in rows], utc=True).tz_localize(None)
+    chunk = {"date": dates.values}
+    for field in fields:
+        chunk[field] = np.array([r[field] for r in rows], dtype=np.float64)
+    return chunk
+
+
+def iter_pages(supabase, table, start=None, end=None, fields=OHLCV_FIELDS, page_size=PAGE_SIZE):
+    """
+    Parcourt `table` par date croissante avec start <= date < end.
+
+    `start` / `end` : chaînes ISO (avec fuseau) ou None.
+    Chaque page est un dict de tableaux NumPy : "date" (datetime64[ns], UTC naïf)
+    et un tableau float64 par champ de `fields`.
+
+    On ne s'arrête que sur une page vide : une page plus courte que `page_size`
+    peut simplement refléter un max-rows serveur plus bas que le nôtre.
+    """
+    columns = ", ".join(["date"] + list(fields))
+    last_date = None
+
+    while True:
+        query = supabase.table(table).select(columns)
+        if last_date is not None:
+            query = query.gt("date", last_date)
+        elif start is not None:
+            query = query.gte("date", start)
+        if end is not None:
+            query = query.lt("date", end)
+
+        rows = query.order("date", desc=False).limit(page_size).execute().data
+        if not rows:
+            return
+
+        yield _to_chunk(rows, fields)
+        # Curseur = valeur renvoyée par le serveur, sans reconversion
+        last_date = rows[-1]["date"]
+
+
+def read_frame(supabase, table, start=None, end=None, fields=OHLCV_FIELDS, page_size=PAGE_SIZE):
+    """Matérialise toutes les pages en un DataFrame (pour les petits intervalles)."""
+    chunks = list(iter_pages(supabase, table, start, end, fields, page_size))
+    if not chunks:
+        return pd.DataFrame(columns=["date"] + list(fields))
+    return pd.DataFrame({
+        key: np.concatenate([c[key] for c in chunks]) for key in ["date"] + list(fields)
+    })
+
+
+###----------------------------------------------------------------------------------
+# Agrégation OHLCV page par page (first / max / min / last / sum)
+###----------------------------------------------------------------------------------
+class OHLCVFold:
+    """
+    Accumulateur OHLCV par slot, alimenté page par page.
+
+    `slot_fn` reçoit une Series de dates et renvoie la Series des débuts de slot
+    (ex. lambda d: d.dt.floor('1h')). Les pages doivent arriver triées par date :
+    seul le slot en cours peut chevaucher deux pages. La mémoire utilisée est
+    proportionnelle au nombre de slots, pas au nombre de bougies.
+    """
+
+    def __init__(self, slot_fn):
+        self.slot_fn = slot_fn
+        self.slots = []
+        self.values = []  # [open, high, low, close, volume] par slot
+        self.rows = 0
+
+    def add(self, chunk):
+        n = len(chunk["date"])
+        if n == 0:
+            return
+        self.rows += n
+
+        slots = self.slot_fn(pd.Series(chunk["date"])).values
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+        ends = np.r_[starts[1:], n]
+
+        opens = chunk["open"][starts]
+        highs = np.maximum.reduceat(chunk["high"], starts)
+        lows = np.minimum.reduceat(chunk["low"], starts)
+        closes = chunk["close"][ends - 1]
+        volumes = np.add.reduceat(chunk["volume"], starts)
+
+        for i, slot in enumerate(slots[starts]):
+            if self.slots and self.slots[-1] == slot:
+                acc = self.values[-1]
+                acc[1] = max(acc[1], highs[i])
+                acc[2] = min(acc[2], lows[i])
+                acc[3] = closes[i]
+                acc[4] += volumes[i]
+            else:
+                self.slots.append(slot)
+                self.values.append([opens[i], highs[i], lows[i], closes[i], volumes[i]])
+
+    def result(self):
+        df = pd.DataFrame(self.values, columns=OHLCV_FIELDS)
+        df.insert(0, "slot", pd.to_datetime(np.array(self.slots, dtype="datetime64[ns]")))
+        return df
+
+
+def fold_ohlcv(chunks, slot_fn):
+    """Agrège un flux de pages (voir iter_pages) en un DataFrame slot/open/high/low/close/volume."""
+    fold = OHLCVFold(slot_fn)
+    for chunk in chunks:
+        fold.add(chunk)
+    return fold.result()
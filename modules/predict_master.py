@@ -1,15 +1,20 @@
 import os
 import sys
+import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-import joblib
 from dotenv import load_dotenv
 import numpy as np
-import ta
 
 # Ajouter le dossier modules au path
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '..', 'modules')))
 from supabase_client import login_user
+from feature_store import load_features
+from price_mirror import PriceMirror
+from model_cache import ModelCache
+from forecaster import MODEL_MODE, model_name, learner_for
+from model_registry import ModelRegistry
 
 # ==========================================
 # 🔐 Auth Supabase
@@ -34,70 +39,41 @@ targets = ["shifted_open", "shifted_high", "shifted_low", "shifted_close", "shif
 model_dir = "/tmp/models/"
 os.makedirs(model_dir, exist_ok=True)
 bucket_name = "models"
+# "multi" : un seul modèle multi-sorties par table ({learner}_multi_{table})
+# P3_LEARNER : apprenant des modèles servis ("rf", "hgb", choix par table ou "auto" : publié dans le registre)
+model_mode = MODEL_MODE
 
 # ==========================================
-# ✅ Télécharger modèle depuis Supabase
-# ==========================================
-def download_model_from_supabase(file_name, dest_path):
-    try:
-        res = supabase.storage.from_(bucket_name).download(file_name)
-        with open(dest_path, "wb") as f:
-            f.write(res)
-        print(f"✅ Modèle téléchargé : {file_name}")
-    except Exception as e:
-        raise Exception(f"⚠️ Erreur téléchargement Supabase pour {file_name} : {e}")
-
-def load_model(table, target):
-    file_name = f"rf_model_{table}_{target}.pkl"
-    local_path = os.path.join(model_dir, file_name)
-    if not os.path.exists(local_path):
-        print(f"📥 Téléchargement du modèle {file_name}...")
-        download_model_from_supabase(file_name, local_path)
-    return joblib.load(local_path)
-
-# ==========================================
-# ✅ Ajout KPI
-# ==========================================
-def add_primary_kpis(df):
-    df["date"] = pd.to_datetime(df["date"])
-    for w in [7, 20, 99]:
-        if len(df) >= w:
-            df[f"ema_{w}"] = ta.trend.ema_indicator(close=df["close"], window=w, fillna=False)
-    macd = ta.trend.MACD(close=df["close"], window_slow=26, window_fast=12, window_sign=9)
-    df["macd"] = macd.macd()
-    df["macd_signal"] = macd.macd_signal()
-    df["rsi"] = ta.momentum.rsi(close=df["close"], window=14)
-    boll = ta.volatility.BollingerBands(close=df["close"], window=20, window_dev=2)
-    df["boll_b"] = boll.bollinger_pband()
-    df["stoch_rsi"] = ta.momentum.stochrsi(close=df["close"], window=14, smooth1=3, smooth2=3)
-    df["volume_ma20"] = df["volume"].rolling(window=20).mean()
-    df["body_size"] = df["close"] - df["open"]
-    df["amplitude"] = df["high"] - df["low"]
-    df["upper_wick"] = df["high"] - df[["close", "open"]].max(axis=1)
-    df["lower_wick"] = df[["close", "open"]].min(axis=1) - df["low"]
-    df["efficiency_ratio"] = np.where(df["amplitude"] != 0, df["body_size"].abs() / df["amplitude"], 0)
-    for col in ["open", "high", "low", "close", "volume", "body_size", "amplitude"]:
-        df[f"{col}_pct_change_1"] = df[col].pct_change()
-    return df
-
-# ==========================================
-# ✅ Récupération des 200 dernières lignes
-# ==========================================
-def get_last_data_block(table):
-    response = supabase.table(table).select("*").order("date", desc=True).limit(201).execute()
-    rows = response.data[::-1]
-    if len(rows) < 200:
+# ✅ Modèles : cache mémoire LRU, version courante lue dans le registre
+# ==========================================
+model_cache = ModelCache(supabase, bucket_name, model_dir, registry=ModelRegistry(supabase, bucket_name))
+
+def load_model(table, target=None):
+    # target=None → artefact multi-sorties de la table
+    return model_cache.get(model_name(table, target, learner_for(table, published=model_cache.learners())))
+
+def predict_targets(table, X_last):
+    if model_mode == "multi":
+        return load_model(table).predict_dict(X_last)
+    return {target: float(load_model(table, target).predict(X_last)[0]) for target in targets}
+
+# ==========================================
+# ✅ Récupération des 200 dernières lignes (features déjà calculées)
+# ==========================================
+def get_last_data_block(table, sync=True):
+    """Retourne (df, moteur) : mêmes features que l'entraînement, moteur prêt pour les bougies simulées."""
+    df, engine = load_features(supabase, table, tail=200, sync=sync)
+    if len(df) < 200:
         raise Exception(f"⚠️ Pas assez de données dans {table}")
-    df = pd.DataFrame(rows)
-    df = df.iloc[:-1]  # Supprimer la dernière ligne (en cours)
-    return df.tail(200)
+    return df, engine
 
 # ==========================================
-# ✅ UPSERT prédiction
+# ✅ UPSERT groupé des prédictions (un aller-retour par timeframe)
 # ==========================================
-def insert_prediction(pred_table, new_date, new_row):
-    supabase.table(pred_table).upsert(new_row, on_conflict="date").execute()
-    print(f"✅ UPSERT {pred_table} | {new_date} | Close = {new_row['close']:.2f}")
+def insert_predictions(pred_table, rows):
+    supabase.table(pred_table).upsert(rows, on_conflict="date").execute()
+    for row in rows:
+        print(f"✅ UPSERT {pred_table} | {row['date']} | Close = {row['close']:.2f}")
 
 # ==========================================
 # ✅ Nouvelle logique : Translation Vectorielle
@@ -116,32 +92,72 @@ def adjust_predictions(pred_values, last_real):
 # ==========================================
 # ✅ Batch multi-step avec simulation
 # ==========================================
-def predict_batch(table, pred_table, delta_time, steps):
-    df = get_last_data_block(table)
-    df = add_primary_kpis(df)
-
+def forecast_rows(table, df, engine, delta_time, steps, timings=None, predict=None):
+    """
+    Simulation multi-step sans écriture : lignes prédites (df et engine sont avancés sur place).
+    predict(table, X_last) → {cible: valeur} (défaut : predict_targets, modèles du registre).
+    """
+    timings = timings if timings is not None else {"features": 0.0, "inference": 0.0}
+    predict = predict or predict_targets
+    rows = []
     for _ in range(steps):
         X = df.drop(columns=["date"])
         X_last = X.iloc[-1:].replace([np.inf, -np.inf], np.nan).ffill().fillna(0)
         last_real = df.iloc[-1]
 
-        pred_values = {}
-        for target in targets:
-            model = load_model(table, target)
-            pred_values[target] = float(model.predict(X_last)[0])
+        t0 = time.perf_counter()
+        pred_values = predict(table, X_last)
+        timings["inference"] += time.perf_counter() - t0
 
         corrected = adjust_predictions(pred_values, last_real)
         new_date = pd.to_datetime(last_real["date"]) + delta_time
         new_row = {"date": new_date.isoformat(), **corrected}
+        rows.append(new_row)
+
+        # KPI de la bougie simulée uniquement (état conservé, pas de recalcul complet)
+        t0 = time.perf_counter()
+        simulated = engine.append({**new_row, "date": new_date})
+        df = pd.concat([df, pd.DataFrame([simulated])], ignore_index=True)
+        timings["features"] += time.perf_counter() - t0
+    return rows
+
+def predict_batch(table, pred_table, delta_time, steps):
+    """Prédit `steps` bougies puis les écrit en un seul upsert. Retourne les durées par phase (s)."""
+    timings = {"fetch": 0.0, "features": 0.0, "inference": 0.0, "write": 0.0}
+
+    t0 = time.perf_counter()
+    PriceMirror(table).sync(supabase)
+    timings["fetch"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    df, engine = get_last_data_block(table, sync=False)
+    timings["features"] += time.perf_counter() - t0
+
+    rows = forecast_rows(table, df, engine, delta_time, steps, timings)
+
+    t0 = time.perf_counter()
+    insert_predictions(pred_table, rows)
+    timings["write"] = time.perf_counter() - t0
+    return timings
 
-        insert_prediction(pred_table, new_date, new_row)
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        df = add_primary_kpis(df)
+def print_timings(results):
+    print(f"\n⏱️ {'table':<8}{'fetch':>9}{'features':>10}{'inférence':>11}{'écriture':>10}{'total':>9}")
+    for table, timings in results.items():
+        print(f"   {table:<8}{timings['fetch']:>8.2f}s{timings['features']:>9.2f}s{timings['inference']:>10.2f}s"
+              f"{timings['write']:>9.2f}s{sum(timings.values()):>8.2f}s")
 
 # ==========================================
 # ✅ Main (Ultra simplifié)
 # ==========================================
 if __name__ == "__main__":
-    for table, (pred_table, delta_time, steps) in interval_to_table.items():
-        print(f"\n⚡ Prédictions pour {table} → {steps} bougies")
-        predict_batch(table, pred_table, delta_time, steps)
+    # Un worker par timeframe (I/O réseau et inférence NumPy se recouvrent)
+    t_cycle = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(interval_to_table)) as pool:
+        futures = {}
+        for table, (pred_table, delta_time, steps) in interval_to_table.items():
+            print(f"\n⚡ Prédictions pour {table} → {steps} bougies")
+            futures[table] = pool.submit(predict_batch, table, pred_table, delta_time, steps)
+        results = {table: future.result() for table, future in futures.items()}
+    print_timings(results)
+    print(f"⏱️ Cycle complet : {time.perf_counter() - t_cycle:.2f}s")
+    model_cache.print_stats()
@@ -0,0 +1,163 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+from paginated_reader import read_frame as read_remote, OHLCV_FIELDS
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Miroir local colonnaire des tables de prix (bitcoin_prices_minits, btc_*)
+# Un fichier Arrow IPC par partition de dates (mois ou année selon la table) et un
+# meta.json avec le high-water mark. sync() ne télécharge que les lignes postérieures
+# au high-water mark, en relisant les REFETCH_ROWS dernières bougies (bougie en cours
+# encore modifiée par ws.py / rollup.py) ; seule la partition courante est réécrite.
+# Les lectures par intervalle de dates se font en memory-map, sans réseau.
+###----------------------------------------------------------------------------------
+
+MIRROR_DIR = os.environ.get("P3_MIRROR_DIR", os.path.join(STATE_DIR, "mirror"))
+
+COLUMNS = ["date"] + OHLCV_FIELDS
+SCHEMA = pa.schema([pa.field("date", pa.timestamp("ns", tz="UTC"))]
+                   + [pa.field(col, pa.float64()) for col in OHLCV_FIELDS])
+
+# Granularité des partitions (format strftime de la clé)
+PARTITION_FORMAT = {
+    "bitcoin_prices_minits": "%Y-%m",
+    "btc_t15": "%Y-%m",
+}
+DEFAULT_PARTITION_FORMAT = "%Y"
+
+# Nombre de dernières bougies relues à chaque sync (encore mutables côté serveur)
+REFETCH_ROWS = 2
+
+
+def _utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+class PriceMirror:
+    def __init__(self, table, root=MIRROR_DIR):
+        self.table = table
+        self.dir = os.path.join(root, table)
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.fmt = PARTITION_FORMAT.get(table, DEFAULT_PARTITION_FORMAT)
+
+    ###------------------------------------------------------------------------------
+    # Métadonnées et partitions
+    ###------------------------------------------------------------------------------
+    def load_meta(self):
+        try:
+            with open(self.meta_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_meta(self, meta):
+        write_json(self.meta_path, meta)
+
+    def _partition_path(self, key):
+        return os.path.join(self.dir, f"{key}.arrow")
+
+    def _read_partition(self, key) -> pa.Table:
+        source = pa.memory_map(self._partition_path(key), "r")
+        return ipc.open_file(source).read_all()
+
+    def _write_partition(self, key, df):
+        table = pa.Table.from_pandas(df[COLUMNS], schema=SCHEMA, preserve_index=False)
+        tmp = self._partition_path(key) + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self._partition_path(key))
+
+    ###------------------------------------------------------------------------------
+    # Synchronisation (delta)
+    ###------------------------------------------------------------------------------
+    def sync(self, supabase):
+        """Télécharge les lignes nouvelles (et les dernières bougies mutables). Retourne le nombre de lignes lues."""
+        meta = self.load_meta() or {"table": self.table, "refetch_from": None, "high_water": None,
+                                    "partitions": [], "rows": 0}
+
+        df = read_remote(supabase, self.table, start=meta["refetch_from"])
+        if df.empty:
+            return 0
+        df["date"] = pd.to_datetime(df["date"]).dt.tz_localize("UTC")
+        df = df.drop_duplicates("date", keep="last").sort_values("date").reset_index(drop=True)
+
+        os.makedirs(self.dir, exist_ok=True)
+        keys = df["date"].dt.strftime(self.fmt)
+        replaced = 0
+        for key in keys.unique():
+            part = df[keys == key]
+            if key in meta["partitions"]:
+                existing = self._read_partition(key).to_pandas()
+                kept = existing[existing["date"] < part["date"].iloc[0]]
+                replaced += len(existing) - len(kept)
+                part = pd.concat([kept, part], ignore_index=True)
+            else:
+                meta["partitions"].append(key)
+            self._write_partition(key, part)
+
+        meta["partitions"].sort()
+        meta["rows"] += len(df) - replaced
+        meta["high_water"] = df["date"].iloc[-1].isoformat()
+        meta["refetch_from"] = df["date"].iloc[max(len(df) - REFETCH_ROWS, 0)].isoformat()
+        self._save_meta(meta)
+        return len(df)
+
+    ###------------------------------------------------------------------------------
+    # Lecture locale
+    ###------------------------------------------------------------------------------
+    def read(self, start=None, end=None) -> pa.Table:
+        """Lignes avec start <= date < end (bornes optionnelles, ISO ou Timestamp)."""
+        meta = self.load_meta()
+        if meta is None or not meta["partitions"]:
+            return SCHEMA.empty_table()
+
+        keys = meta["partitions"]
+        if start is not None:
+            start = _utc(start)
+            keys = [k for k in keys if k >= start.strftime(self.fmt)]
+        if end is not None:
+            end = _utc(end)
+            keys = [k for k in keys if k <= end.strftime(self.fmt)]
+        if not keys:
+            return SCHEMA.empty_table()
+
+        table = pa.concat_tables([self._read_partition(k) for k in keys])
+        if start is not None:
+            table = table.filter(pc.greater_equal(table["date"], pa.scalar(start, SCHEMA.field("date").type)))
+        if end is not None:
+            table = table.filter(pc.less(table["date"], pa.scalar(end, SCHEMA.field("date").type)))
+        return table
+
+    def frame(self, start=None, end=None) -> pd.DataFrame:
+        return self.read(start, end).to_pandas()
+
+
+def sync_and_read(supabase, table, start=None, end=None):
+    """Synchronise le miroir de `table` puis retourne l'intervalle demandé (DataFrame, dates UTC)."""
+    mirror = PriceMirror(table)
+    mirror.sync(supabase)
+    return mirror.frame(start, end)
+
+
+if __name__ == "__main__":
+    # Synchronisation des miroirs : python price_mirror.py [table ...]
+    import sys
+    import time
+    from supabase_client import get_client
+
+    supabase = get_client()
+    tables = sys.argv[1:] or ["bitcoin_prices_minits", "btc_t15", "btc_h", "btc_d", "btc_w", "btc_m", "btc_y"]
+    for table in tables:
+        t0 = time.perf_counter()
+        fetched = PriceMirror(table).sync(supabase)
+        synced = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rows = len(PriceMirror(table).read())
+        print(f"🪞 {table} : {fetched} ligne(s) synchronisée(s) en {synced:.2f}s | "
+              f"lecture locale de {rows} lignes en {(time.perf_counter() - t0) * 1000:.1f} ms")
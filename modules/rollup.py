@@ -0,0 +1,219 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+import pandas as pd
+from dotenv import load_dotenv
+from supabase_client import login_user
+from paginated_reader import read_frame
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Moteur d'agrégation multi-timeframes en cascade
+# Remplace l'exécution des six scripts update_btc_* dans run_all_updates.py :
+#   1m → 15m → 1h → 1d → 1w / 1M → 1y
+# Chaque niveau est construit à partir du niveau inférieur et ne relit que les
+# lignes postérieures à son watermark (persisté sur disque). Le coût d'un cycle
+# dépend donc du volume de nouvelles bougies et non plus de la longueur du segment.
+# Les scripts update_btc_* restent disponibles pour recalculer un segment complet.
+###----------------------------------------------------------------------------------
+
+STATE_PATH = os.path.join(STATE_DIR, "rollup_state.json")
+
+
+def _floor(freq):
+    return lambda dates: dates.dt.floor(freq)
+
+
+def _week_start(dates):
+    # Semaine du lundi 00:00 au lundi suivant (identique à to_period('W').start_time)
+    days = dates.dt.normalize()
+    return days - pd.to_timedelta(days.dt.weekday, unit="D")
+
+
+def _truncate(unit):
+    return lambda dates: pd.Series(
+        dates.values.astype(f"datetime64[{unit}]").astype("datetime64[ns]"), index=dates.index
+    )
+
+
+# (niveau, table source, table cible, fonction de troncature)
+LEVELS = [
+    ("t15", "bitcoin_prices_minits", "btc_t15", _floor("15min")),
+    ("h", "btc_t15", "btc_h", _floor("1h")),
+    ("d", "btc_h", "btc_d", _floor("1D")),
+    ("w", "btc_d", "btc_w", _week_start),
+    ("m", "btc_d", "btc_m", _truncate("M")),
+    ("y", "btc_m", "btc_y", _truncate("Y")),
+]
+
+
+###----------------------------------------------------------------------------------
+# Watermarks persistés
+###----------------------------------------------------------------------------------
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, "r") as f:
+            return {k: pd.Timestamp(v) for k, v in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state, path=STATE_PATH):
+    write_json(path, {k: v.isoformat() for k, v in state.items()})
+
+
+###----------------------------------------------------------------------------------
+# Lecture / écriture Supabase
+###----------------------------------------------------------------------------------
+def _to_utc_iso(ts):
+    return ts.tz_localize(timezone.utc).isoformat()
+
+
+def fetch_rows(supabase, table, start=None, end=None):
+    """
+    Bougies OHLCV de `table` avec start <= date < end, triées par date.
+    Lecture paginée : un rattrapage après coupure n'est pas tronqué par PostgREST.
+    Dates normalisées en UTC naïf (les tables btc_* sont écrites sans fuseau).
+    """
+    return read_frame(
+        supabase,
+        table,
+        start=_to_utc_iso(start) if start is not None else None,
+        end=_to_utc_iso(end) if end is not None else None,
+    )
+
+
+def fetch_last_date(supabase, table):
+    response = supabase.table(table).select("date").order("date", desc=True).limit(1).execute()
+    if not response.data:
+        return None
+    return pd.Timestamp(pd.to_datetime(response.data[0]["date"], utc=True)).tz_localize(None)
+
+
+def aggregate(df, slot_fn):
+    """Agrégation OHLCV (open = 1ère valeur, close = dernière, high = max, low = min, volume = somme)."""
+    df = df.sort_values("date")
+    slots = slot_fn(df["date"])
+    agg = df.groupby(slots.values).agg(
+        open=("open", "first"),
+        high=("high", "max"),
+        low=("low", "min"),
+        close=("close", "last"),
+        volume=("volume", "sum"),
+    )
+    agg.index.name = "date"
+    return agg.reset_index()
+
+
+def to_records(agg):
+    return [
+        {
+            "date": row.date.strftime('%Y-%m-%dT%H:%M:%S'),
+            "open": float(row.open),
+            "high": float(row.high),
+            "low": float(row.low),
+            "close": float(row.close),
+            "volume": float(row.volume),
+        }
+        for row in agg.itertuples(index=False)
+    ]
+
+
+###----------------------------------------------------------------------------------
+# Cycle d'agrégation
+###----------------------------------------------------------------------------------
+def rollup_level(supabase, source, target, slot_fn, watermark, fresh=None, level=None):
+    """
+    Recalcule les slots de `target` touchés depuis `watermark`.
+
+    - Les lignes source sont relues à partir du début du slot contenant le watermark.
+    - `fresh` : lignes source déjà calculées pendant ce cycle ; seule la partie
+      antérieure à ces lignes est relue en base.
+    - `level` : nom du niveau, pour les backends qui savent agréger en SQL
+      (supports_pushdown) : aucune ligne ne transite alors par Python.
+
+    Retourne (DataFrame agrégé, nouveau watermark).
+    """
+    start = slot_fn(pd.Series([watermark]))[0] if watermark is not None else None
+
+    if level is not None and getattr(supabase, "supports_pushdown", False):
+        agg, last = supabase.rollup_sql(level, source, target, start)
+        return agg, last if last is not None else watermark
+
+    if fresh is not None and not fresh.empty and (start is None or fresh["date"].min() > start):
+        head = fetch_rows(supabase, source, start=start, end=fresh["date"].min())
+        rows = pd.concat([head, fresh], ignore_index=True) if not head.empty else fresh
+    elif fresh is not None and not fresh.empty:
+        rows = fresh[fresh["date"] >= start]
+    else:
+        rows = fetch_rows(supabase, source, start=start)
+
+    if rows.empty:
+        return rows, watermark
+
+    agg = aggregate(rows, slot_fn)
+    supabase.table(target).upsert(to_records(agg)).execute()
+    return agg, rows["date"].max()
+
+
+def run_cycle(supabase, levels=None, state_path=STATE_PATH, timings=None):
+    """
+    Exécute un passage de la cascade. `levels` restreint les niveaux traités
+    (ex. ["t15", "h"]) : un niveau sauté rattrapera son retard au prochain passage
+    grâce à son propre watermark. `timings` (dict) reçoit la durée en secondes de
+    chaque niveau traité, y compris en cas d'erreur.
+    """
+    state = load_state(state_path)
+    fresh_by_table = {}
+    summary = {}
+
+    for name, source, target, slot_fn in LEVELS:
+        if levels is not None and name not in levels:
+            continue
+
+        t0 = time.perf_counter()
+        watermark = state.get(name)
+        if watermark is None:
+            # Premier lancement : on repart du dernier slot déjà présent dans la cible
+            watermark = fetch_last_date(supabase, target)
+            print(f"ℹ️ Aucun watermark pour {target}, reprise au dernier slot : {watermark}")
+
+        try:
+            agg, new_watermark = rollup_level(
+                supabase, source, target, slot_fn, watermark, fresh_by_table.get(source), level=name
+            )
+        except Exception as e:
+            print(f"❌ Erreur agrégation {source} → {target} :", e)
+            if timings is not None:
+                timings[name] = time.perf_counter() - t0
+            continue
+
+        fresh_by_table[target] = agg
+        summary[target] = len(agg)
+        if new_watermark is not None:
+            state[name] = new_watermark
+            save_state(state, state_path)
+
+        print(f"✅ {target} : {len(agg)} slot(s) mis à jour (watermark {new_watermark})")
+        if timings is not None:
+            timings[name] = time.perf_counter() - t0
+
+    return summary
+
+
+def main(supabase=None, levels=None):
+    load_dotenv()
+
+    if supabase is None:
+        supabase = login_user(os.getenv("SUPABASE_EMAIL"), os.getenv("SUPABASE_PASSWORD"))
+        if not supabase:
+            print("❌ Échec de l'authentification Supabase")
+            return
+
+    print(f"📌 Agrégation en cascade ({datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} UTC)")
+    return run_cycle(supabase, levels=levels)
+
+
+if __name__ == "__main__":
+    main()
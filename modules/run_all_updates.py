@@ -1,49 +1,166 @@
-import subprocess
+import os
+import sys
 import time
+from datetime import datetime
+from dotenv import load_dotenv
 
-# PHASE 1 : Mise à jour des tables de prix
-price_update_scripts = [
-    "P3-WCS/modules/update_btc_t15.py",
-    "P3-WCS/modules/update_btc_h.py",
-    "P3-WCS/modules/update_btc_d.py",
-    "P3-WCS/modules/update_btc_w.py",
-    "P3-WCS/modules/update_btc_m.py",
-    "P3-WCS/modules/update_btc_y.py"
+# Les jobs sont importés une seule fois (pandas, supabase, .env...) au démarrage
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import rollup
+import main_supabase
+from supabase_client import login_user, print_call_stats
+
+###----------------------------------------------------------------------------------
+# Ordonnanceur persistant des mises à jour
+# Remplace le lancement de sous-processus python3 à chaque minute : un seul
+# processus, un seul client Supabase authentifié, et une cadence propre à chaque job
+# alignée sur les bornes de bougies (ex. 60 s → chaque minute pile, 3600 s → chaque heure).
+###----------------------------------------------------------------------------------
+
+# (nom, période en secondes, décalage en secondes, fonction(supabase))
+# fonction None : niveau de la cascade rollup (nom = niveau de rollup.LEVELS)
+# L'ordre du tableau est l'ordre d'exécution lorsque plusieurs jobs sont dus.
+JOBS = [
+    # PHASE 1 : Mise à jour des tables de prix (cascade 1m → 15m → 1h → 1d → 1w/1M → 1y)
+    # Les niveaux dus à un même tick passent dans un seul run_cycle : chacun réutilise les
+    # slots frais du niveau précédent (fresh_by_table). Chaque période est un multiple de
+    # celle de sa source, qui est donc toujours due en même temps.
+    ("t15", 60, 0, None),
+    ("h", 60, 0, None),
+    ("d", 300, 0, None),
+    ("w", 900, 0, None),
+    ("m", 900, 0, None),
+    ("y", 3600, 0, None),
+    # PHASE 2 : Tendances et statistiques (après l'agrégation de la minute)
+    ("trends", 60, 5, main_supabase.main),
 ]
 
-# PHASE 2 : Mise à jour des tendances et statistiques Supabase
-trend_update_script = "P3-WCS/modules/main_supabase.py"
+# Intervalle (secondes) d'affichage du bilan des jobs
+REPORT_INTERVAL = 3600
 
-while True:
-    print("\n🚀 DÉMARRAGE DU PROCESSUS COMPLET")
-    print("=" * 50)
 
-    # -------------------
-    # Phase 1 : Prix
-    # -------------------
-    print("\n📌 PHASE 1 : Mise à jour des tables prix")
-    for script in price_update_scripts:
+def next_run(period, offset, after):
+    """Prochaine échéance alignée : k * period + offset strictement après `after` (epoch)."""
+    return ((after - offset) // period + 1) * period + offset
+
+
+class Job:
+    def __init__(self, name, period, offset, fn):
+        self.name = name
+        self.period = period
+        self.offset = offset
+        self.fn = fn
+        self.next_at = next_run(period, offset, time.time())
+        self.stats = {
+            "runs": 0,
+            "errors": 0,
+            "skipped": 0,
+            "last_duration": 0.0,
+            "max_duration": 0.0,
+            "total_duration": 0.0,
+            "last_lateness": 0.0,
+            "max_lateness": 0.0,
+        }
+
+    def run(self, supabase):
+        started = time.time()
+        failed = False
         try:
-            print(f"▶️ Exécution : {script}", flush=True)
-            subprocess.run(["python3", script], check=True)
-            print(f"✅ {script} terminé avec succès\n")
-        except subprocess.CalledProcessError as e:
-            print(f"❌ Erreur dans {script} : {e}\n")
-        time.sleep(2)  # Pause pour éviter surcharge API/DB
-
-    # -------------------
-    # Phase 2 : Tendances
-    # -------------------
-    print("\n📌 PHASE 2 : Calcul des tendances et upsert Supabase")
+            self.fn(supabase)
+        except Exception as e:
+            failed = True
+            print(f"❌ Erreur dans le job {self.name} : {e}")
+        self.record(started, time.time() - started, failed)
+
+    def record(self, started, duration, failed=False):
+        """Statistiques d'une exécution démarrée à `started` (epoch), puis prochaine échéance."""
+        scheduled = self.next_at
+        lateness = started - scheduled
+        s = self.stats
+        if failed:
+            s["errors"] += 1
+        s["runs"] += 1
+        s["last_duration"] = duration
+        s["max_duration"] = max(s["max_duration"], duration)
+        s["total_duration"] += duration
+        s["last_lateness"] = lateness
+        s["max_lateness"] = max(s["max_lateness"], lateness)
+
+        # Échéances manquées (job trop long) : on ne les rattrape pas en rafale
+        self.next_at = next_run(self.period, self.offset, time.time())
+        s["skipped"] += max(int((self.next_at - scheduled) // self.period) - 1, 0)
+
+        print(f"⏱️ {self.name} : {duration:.2f}s (retard au démarrage : {lateness:.2f}s)")
+
+
+def run_cascade(jobs, supabase):
+    """Un seul passage de la cascade pour les niveaux dus ; statistiques par niveau."""
+    started = time.time()
+    timings = {}
     try:
-        print(f"▶️ Exécution : {trend_update_script}")
-        subprocess.run(["python3", trend_update_script], check=True)
-        print(f"✅ {trend_update_script} terminé avec succès\n")
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Erreur dans {trend_update_script} : {e}\n")
+        summary = rollup.run_cycle(supabase, levels=[job.name for job in jobs], timings=timings)
+    except Exception as e:
+        print(f"❌ Erreur dans la cascade rollup : {e}")
+        summary = {}
+    # Début de chaque niveau dans le passage : les niveaux précédents s'exécutent avant lui
+    targets = {name: target for name, _, target, _ in rollup.LEVELS}
+    for job in jobs:
+        job.record(started, timings.get(job.name, 0.0), failed=targets[job.name] not in summary)
+        started += timings.get(job.name, 0.0)
 
-    print("✅ Toutes les mises à jour sont terminées.")
+
+def print_report(jobs):
+    print("\n📊 Bilan des jobs")
+    print(f"{'job':<8}{'runs':>6}{'err':>5}{'sautés':>8}{'moy (s)':>9}{'max (s)':>9}{'retard max (s)':>16}")
+    for job in jobs:
+        s = job.stats
+        avg = s["total_duration"] / s["runs"] if s["runs"] else 0.0
+        print(f"{job.name:<8}{s['runs']:>6}{s['errors']:>5}{s['skipped']:>8}"
+              f"{avg:>9.2f}{s['max_duration']:>9.2f}{s['max_lateness']:>16.2f}")
+    print_call_stats()
+    print()
+
+
+def main():
+    load_dotenv()
+
+    print("\n🔐 Authentification unique du processus...")
+    supabase = login_user(os.getenv("SUPABASE_EMAIL"), os.getenv("SUPABASE_PASSWORD"))
+    if not supabase:
+        print("❌ Échec de l'authentification : arrêt de l'ordonnanceur.")
+        return
+
+    jobs = [Job(*job) for job in JOBS]
+    next_report = time.time() + REPORT_INTERVAL
+
+    print("\n🚀 DÉMARRAGE DE L'ORDONNANCEUR")
     print("=" * 50)
+    for job in jobs:
+        print(f"▶️ {job.name} : toutes les {job.period}s (+{job.offset}s), "
+              f"première exécution {datetime.fromtimestamp(job.next_at):%H:%M:%S}")
+
+    try:
+        while True:
+            now = time.time()
+            due = [job for job in jobs if job.next_at <= now]
+            if not due:
+                time.sleep(min(job.next_at for job in jobs) - now)
+                continue
+
+            levels = [job for job in due if job.fn is None]
+            if levels:
+                run_cascade(levels, supabase)
+            for job in due:
+                if job.fn is not None:
+                    job.run(supabase)
+
+            if time.time() >= next_report:
+                print_report(jobs)
+                next_report = time.time() + REPORT_INTERVAL
+    except KeyboardInterrupt:
+        print("\n🛑 Arrêt demandé")
+        print_report(jobs)
+
 
-    print("\n⏳ Nouvelle exécution dans 60 secondes...\n")
-    time.sleep(60)
+if __name__ == "__main__":
+    main()
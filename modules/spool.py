@@ -0,0 +1,286 @@
+import os
+import struct
+import threading
+import time
+from local_state import STATE_DIR
+
+
+###----------------------------------------------------------------------------------
+# Spool disque (journal append-only) des bougies reçues par WebSocket
+# Chaque bougie est écrite sur disque avant l'envoi vers Supabase. Un drainer
+# rejoue le journal par gros lots et mémorise un offset de reprise (checkpoint) :
+# une coupure réseau devient un rattrapage automatique au lieu d'un backfill manuel.
+###----------------------------------------------------------------------------------
+
+# Enregistrement binaire à taille fixe (49 octets) :
+# heure d'ouverture (ms), open, high, low, close, volume, bougie clôturée
+RECORD = struct.Struct("<qdddddB")
+
+SPOOL_DIR = STATE_DIR
+
+
+class KlineSpool:
+    """
+    Journal append-only d'enregistrements `RECORD` avec fichier de checkpoint.
+
+    - `append_many` écrit un lot puis fait un seul fsync (fsync groupé).
+    - `read_from(offset)` relit les enregistrements à partir d'un offset.
+    - `commit(offset)` persiste l'offset de reprise de façon atomique.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.checkpoint_path = path + ".ckpt"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fh = open(path, "ab")
+        self._drop_torn_tail()
+        self.appended = 0
+        self.fsyncs = 0
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+    def append_many(self, candles):
+        """candles : itérable de tuples (t_ms, open, high, low, close, volume, closed)."""
+        payload = b"".join(
+            RECORD.pack(int(t), o, h, l, c, v, 1 if closed else 0)
+            for t, o, h, l, c, v, closed in candles
+        )
+        if not payload:
+            return 0
+        with self._lock:
+            self._fh.write(payload)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self.fsyncs += 1
+        count = len(payload) // RECORD.size
+        self.appended += count
+        return count
+
+    # ------------------------------------------------------------------
+    # Lecture / checkpoint
+    # ------------------------------------------------------------------
+    def size(self):
+        with self._lock:
+            return os.path.getsize(self.path)
+
+    def read_from(self, offset, max_records):
+        """Retourne (liste de tuples, offset suivant)."""
+        end = self.size()
+        length = min(end - offset, max_records * RECORD.size)
+        length -= length % RECORD.size
+        if length <= 0:
+            return [], offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            buf = f.read(length)
+        candles = [
+            (t, o, h, l, c, v, bool(closed))
+            for t, o, h, l, c, v, closed in RECORD.iter_unpack(buf)
+        ]
+        return candles, offset + len(buf)
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                offset = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        # Checkpoint incohérent (spool tronqué à la main) : on repart du début
+        if offset > self.size() or offset % RECORD.size:
+            print(f"⚠️ Checkpoint {offset} invalide pour {self.path}, reprise à 0")
+            return 0
+        return offset
+
+    def commit(self, offset):
+        """Persiste l'offset atomiquement, puis compacte si tout a été rejoué."""
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+        return self._maybe_compact(offset)
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+    def _maybe_compact(self, offset):
+        """Tronque le spool lorsqu'il est entièrement rejoué et dépasse max_bytes."""
+        with self._lock:
+            size = os.path.getsize(self.path)
+            if offset != size or size < self.max_bytes:
+                return offset
+            self._fh.truncate(0)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            with open(self.checkpoint_path, "w") as f:
+                f.write("0")
+            print(f"🧹 Spool compacté ({size} octets rejoués)")
+            return 0
+
+    def _drop_torn_tail(self):
+        """Supprime un éventuel enregistrement partiel (crash pendant une écriture)."""
+        size = os.path.getsize(self.path)
+        torn = size % RECORD.size
+        if torn:
+            print(f"⚠️ Enregistrement partiel de {torn} octets ignoré dans {self.path}")
+            self._fh.truncate(size - torn)
+
+
+###----------------------------------------------------------------------------------
+# Drainer : rejoue le spool vers la base par gros lots
+###----------------------------------------------------------------------------------
+class SpoolDrainer:
+    """
+    Thread qui relit le spool depuis le checkpoint, fusionne les états d'une même
+    bougie (le dernier gagne) et appelle `upsert_fn(records)` par lots de
+    `batch_size`. En cas d'échec, l'offset n'avance pas et on réessaie avec un
+    backoff exponentiel : rien n'est perdu tant que le spool est sur disque.
+    """
+
+    def __init__(self, spool, to_record, upsert_fn, batch_size=5000,
+                 idle_interval=1.0, max_backoff=60.0):
+        self.spool = spool
+        self.to_record = to_record
+        self.upsert_fn = upsert_fn
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        self.offset = spool.load_checkpoint()
+
+        self.stats = {
+            "replayed": 0,
+            "batches": 0,
+            "failures": 0,
+            "max_batch": 0,
+            "last_error": None,
+        }
+
+    def notify(self):
+        self._wake.set()
+
+    def lag_records(self):
+        return max(self.spool.size() - self.offset, 0) // RECORD.size
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, drain=True, timeout=10.0):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if drain:
+            try:
+                while self.drain_once():
+                    pass
+            except Exception as e:
+                print(f"⚠️ Spool non vidé à l'arrêt ({self.lag_records()} bougies en attente) :", e)
+
+    def drain_once(self):
+        """Rejoue un lot. Retourne le nombre de bougies envoyées (0 si rien à faire)."""
+        candles, next_offset = self.spool.read_from(self.offset, self.batch_size)
+        if not candles:
+            return 0
+
+        latest = {}
+        for candle in candles:
+            latest[candle[0]] = candle
+        records = [self.to_record(*latest[t][:6]) for t in sorted(latest)]
+
+        self.upsert_fn(records)
+
+        self.offset = self.spool.commit(next_offset)
+        self.stats["replayed"] += len(records)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(records))
+        return len(records)
+
+    def _run(self):
+        backoff = self.idle_interval
+        while self._running:
+            try:
+                sent = self.drain_once()
+                backoff = self.idle_interval
+            except Exception as e:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = str(e)
+                print(f"❌ Rejeu du spool impossible ({self.lag_records()} bougies en attente), "
+                      f"nouvel essai dans {backoff:.0f}s :", e)
+                self._wake.wait(backoff)
+                self._wake.clear()
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if sent:
+                lag = self.lag_records()
+                if lag >= self.batch_size:
+                    print(f"⏩ Rattrapage : {sent} bougies rejouées, {lag} restantes")
+                continue
+            self._wake.wait(self.idle_interval)
+            self._wake.clear()
+
+
+###----------------------------------------------------------------------------------
+# Démonstration locale : base factice qui échoue volontairement
+###----------------------------------------------------------------------------------
+if __name__ == "__main__":
+    import tempfile
+
+    class FlakyTable:
+        """Remplace Supabase : échoue `failures` fois puis accepte les upserts."""
+
+        def __init__(self, failures):
+            self.failures = failures
+            self.rows = {}
+
+        def upsert(self, records):
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("base indisponible (simulée)")
+            for r in records:
+                self.rows[r["t"]] = r
+
+    def to_record(t, o, h, l, c, v):
+        return {"t": t, "open": o, "high": h, "low": l, "close": c, "volume": v}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "klines.spool")
+        table = FlakyTable(failures=3)
+
+        # Panne : les bougies s'accumulent dans le spool
+        spool = KlineSpool(path)
+        t0 = 1_700_000_000_000
+        for i in range(0, 250, 10):
+            spool.append_many(
+                (t0 + j * 60_000, 1.0, 2.0, 0.5, 1.5, float(j), True) for j in range(i, i + 10)
+            )
+
+        drainer = SpoolDrainer(spool, to_record, table.upsert, batch_size=100,
+                               idle_interval=0.05, max_backoff=0.2).start()
+        while drainer.stats["replayed"] < 100:
+            time.sleep(0.05)
+
+        # Arrêt "brutal" puis redémarrage : reprise depuis le checkpoint
+        drainer.stop(drain=False)
+        spool.close()
+        spool = KlineSpool(path)
+        drainer = SpoolDrainer(spool, to_record, table.upsert, batch_size=100)
+        print(f"🔁 Reprise à l'offset {drainer.offset} ({drainer.lag_records()} bougies en attente)")
+        while drainer.drain_once():
+            pass
+
+        assert len(table.rows) == 250, len(table.rows)
+        print(f"✅ {len(table.rows)} bougies présentes en base malgré les échecs simulés")
@@ -0,0 +1,497 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from local_state import STATE_DIR
+
+###----------------------------------------------------------------------------------
+# Backend de stockage embarqué (SQLite) — même interface que le client Supabase
+# Sous-ensemble de supabase-py utilisé par les modules :
+#   client.table(t).select(cols).eq/neq/gt/gte/lt/lte(...).order(col, desc).limit(n).execute()
+#   client.table(t).insert(rows) / upsert(rows, on_conflict) / update(values).eq(...) / delete()
+#   client.rpc("execute_sql", {"query": ...}).execute()   (aussi via client.postgrest)
+#   client.storage.from_(bucket).upload(name, file, options) / download(name) / remove(names)
+# Sélection : P3_BACKEND=sqlite (voir supabase_client.get_client).
+# Les tables sont créées à la volée (clé : trend_id pour trend_stats_*, date sinon)
+# et les dates sont stockées en ISO UTC ("YYYY-MM-DDTHH:MM:SS+00:00"), comme PostgREST
+# les renvoie. Chemins rapides propres au backend : rollup_sql() et gaps().
+###----------------------------------------------------------------------------------
+
+SQLITE_PATH = os.environ.get("P3_SQLITE_PATH", os.path.join(STATE_DIR, "p3.sqlite"))
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+# Expressions SQL de troncature des niveaux de rollup.LEVELS
+SLOT_SQL = {
+    "t15": f"strftime('{ISO_FORMAT}', (CAST(strftime('%s', date) AS INTEGER) / 900) * 900, 'unixepoch')",
+    "h": f"strftime('{ISO_FORMAT}', (CAST(strftime('%s', date) AS INTEGER) / 3600) * 3600, 'unixepoch')",
+    "d": f"strftime('{ISO_FORMAT}', (CAST(strftime('%s', date) AS INTEGER) / 86400) * 86400, 'unixepoch')",
+    "w": "strftime('%Y-%m-%dT00:00:00+00:00', date, 'weekday 0', '-6 days')",
+    "m": "strftime('%Y-%m-01T00:00:00+00:00', date)",
+    "y": "strftime('%Y-01-01T00:00:00+00:00', date)",
+}
+
+for _type, _cast in [(np.int64, int), (np.int32, int), (np.float32, float), (np.bool_, bool)]:
+    sqlite3.register_adapter(_type, _cast)
+
+
+def _is_timestamp(column):
+    return column == "date" or column.endswith("_time")
+
+
+def _normalize_timestamps(values):
+    """Dates ISO (avec ou sans fuseau, naïves = UTC), Timestamp ou datetime → texte ISO UTC."""
+    parsed = pd.to_datetime(pd.Series(values), utc=True, format="ISO8601")
+    return [None if pd.isna(ts) else ts.strftime(ISO_FORMAT) for ts in parsed]
+
+
+def _sql_type(value):
+    if isinstance(value, (bool, np.bool_, int, np.integer)):
+        return "INTEGER"
+    if isinstance(value, (float, np.floating)):
+        return "REAL"
+    if isinstance(value, (bytes, bytearray)):
+        return "BLOB"
+    return "TEXT"
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+###----------------------------------------------------------------------------------
+# Requêtes table (interface fluide PostgREST)
+###----------------------------------------------------------------------------------
+class TableQuery:
+    OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.columns = "*"
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+        self.payload = None
+        self.on_conflict = None
+
+    # --- Actions ---
+    def select(self, columns="*", count=None):
+        self.action, self.columns = "select", columns
+        return self
+
+    def insert(self, records):
+        self.action, self.payload = "insert", records if isinstance(records, list) else [records]
+        return self
+
+    def upsert(self, records, on_conflict="", **kwargs):
+        self.action, self.payload = "upsert", records if isinstance(records, list) else [records]
+        self.on_conflict = on_conflict or None
+        return self
+
+    def update(self, values):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    # --- Filtres / modificateurs ---
+    def _filter(self, op, column, value):
+        if _is_timestamp(column):
+            value = _normalize_timestamps([value])[0]
+        self.filters.append((column, self.OPERATORS[op], value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def order(self, column, desc=False):
+        self.ordering.append(f'"{column}" {"DESC" if desc else "ASC"}')
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    # --- Exécution ---
+    def _where(self):
+        if not self.filters:
+            return "", []
+        clause = " AND ".join(f'"{col}" {op} ?' for col, op, _ in self.filters)
+        return f" WHERE {clause}", [value for _, _, value in self.filters]
+
+    def execute(self):
+        return Response(getattr(self, f"_execute_{self.action}")())
+
+    def _execute_select(self):
+        if not self.client.table_exists(self.table):
+            return []
+        columns = "*" if self.columns.strip() == "*" else ", ".join(
+            f'"{c.strip()}"' for c in self.columns.split(","))
+        where, params = self._where()
+        sql = f'SELECT {columns} FROM "{self.table}"{where}'
+        if self.ordering:
+            sql += " ORDER BY " + ", ".join(self.ordering)
+        if self.row_limit is not None:
+            sql += f" LIMIT {int(self.row_limit)}"
+        return self.client.query(sql, params)
+
+    def _rows(self):
+        columns = list(dict.fromkeys(c for record in self.payload for c in record))
+        values = {c: [record.get(c) for record in self.payload] for c in columns}
+        for c in columns:
+            if _is_timestamp(c):
+                values[c] = _normalize_timestamps(values[c])
+        return columns, list(zip(*(values[c] for c in columns)))
+
+    def _execute_insert(self):
+        if not self.payload:
+            return []
+        self.client.ensure_table(self.table, self.payload)
+        columns, rows = self._rows()
+        names = ", ".join(f'"{c}"' for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        sql = f'INSERT INTO "{self.table}" ({names}) VALUES ({marks})'
+        if self.action == "upsert":
+            key = self.on_conflict or self.client.primary_key(self.table)
+            updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns if c != key)
+            sql += f' ON CONFLICT("{key}") DO ' + (f"UPDATE SET {updates}" if updates else "NOTHING")
+        self.client.execute_many(sql, rows)
+        return self.payload
+
+    _execute_upsert = _execute_insert
+
+    def _execute_update(self):
+        self.client.ensure_table(self.table, [self.payload])
+        values = dict(self.payload)
+        for c in values:
+            if _is_timestamp(c):
+                values[c] = _normalize_timestamps([values[c]])[0]
+        assignments = ", ".join(f'"{c}" = ?' for c in values)
+        where, params = self._where()
+        self.client.execute(f'UPDATE "{self.table}" SET {assignments}{where}', list(values.values()) + params)
+        return [self.payload]
+
+    def _execute_delete(self):
+        if not self.client.table_exists(self.table):
+            return []
+        where, params = self._where()
+        self.client.execute(f'DELETE FROM "{self.table}"{where}', params)
+        return []
+
+
+class RpcCall:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        if self.name != "execute_sql":
+            raise ValueError(f"⛔ RPC inconnue pour le backend SQLite : {self.name}")
+        return Response(self.client.query(self.params["query"].strip().rstrip(";")))
+
+
+###----------------------------------------------------------------------------------
+# Stockage de fichiers (buckets) dans la même base
+###----------------------------------------------------------------------------------
+class Bucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def upload(self, path, file, file_options=None):
+        if hasattr(file, "read"):
+            data = file.read()
+        elif isinstance(file, str):
+            with open(file, "rb") as f:
+                data = f.read()
+        else:
+            data = file
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        verb = "INSERT OR REPLACE" if upsert else "INSERT"
+        self.client.execute(
+            f"{verb} INTO storage_objects (bucket, name, data, size, etag, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [self.name, path, sqlite3.Binary(data), len(data), hashlib.md5(data).hexdigest(),
+             pd.Timestamp.now(tz="UTC").isoformat()])
+        return {"Key": f"{self.name}/{path}"}
+
+    def download(self, path):
+        rows = self.client.query("SELECT data FROM storage_objects WHERE bucket = ? AND name = ?", [self.name, path])
+        if not rows:
+            raise FileNotFoundError(f"⛔ Objet introuvable : {self.name}/{path}")
+        return bytes(rows[0]["data"])
+
+    def remove(self, paths):
+        for path in paths:
+            self.client.execute("DELETE FROM storage_objects WHERE bucket = ? AND name = ?", [self.name, path])
+        return []
+
+    def list(self, path=None, options=None):
+        """Même forme que la réponse Storage : name, updated_at, metadata.eTag / size."""
+        rows = self.client.query("SELECT name, size, etag, updated_at FROM storage_objects "
+                                 "WHERE bucket = ? AND name LIKE ? ORDER BY name", [self.name, f"{path or ''}%"])
+        return [{"name": r["name"], "updated_at": r["updated_at"],
+                 "metadata": {"eTag": f'"{r["etag"]}"', "size": r["size"]}} for r in rows]
+
+
+class Storage:
+    def __init__(self, client):
+        self.client = client
+
+    def from_(self, bucket):
+        return Bucket(self.client, bucket)
+
+
+###----------------------------------------------------------------------------------
+# Client
+###----------------------------------------------------------------------------------
+class SQLiteClient:
+    def __init__(self, path=SQLITE_PATH, pushdown=True):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Chemins rapides SQL (rollup, détection de trous) ; False = chemin générique
+        self.supports_pushdown = pushdown
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS storage_objects "
+                          "(bucket TEXT, name TEXT, data BLOB, size INTEGER, etag TEXT, updated_at TEXT, "
+                          "PRIMARY KEY (bucket, name))")
+        self._migrate_storage()
+        self._lock = threading.RLock()
+        self._columns = {}
+        self.storage = Storage(self)
+
+    def _migrate_storage(self):
+        """Bases créées avant size / etag / updated_at : ajout des colonnes et calcul pour les objets existants."""
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(storage_objects)")}
+        added = [(c, t) for c, t in [("size", "INTEGER"), ("etag", "TEXT"), ("updated_at", "TEXT")] if c not in existing]
+        for column, sql_type in added:
+            self.conn.execute(f"ALTER TABLE storage_objects ADD COLUMN {column} {sql_type}")
+        if added:
+            now = pd.Timestamp.now(tz="UTC").isoformat()
+            rows = self.conn.execute("SELECT bucket, name, data FROM storage_objects WHERE etag IS NULL").fetchall()
+            for row in rows:
+                data = bytes(row["data"])
+                self.conn.execute("UPDATE storage_objects SET size = ?, etag = ?, updated_at = COALESCE(updated_at, ?) "
+                                  "WHERE bucket = ? AND name = ?",
+                                  [len(data), hashlib.md5(data).hexdigest(), now, row["bucket"], row["name"]])
+            print(f"🧱 storage_objects : colonne(s) {', '.join(c for c, _ in added)} ajoutée(s), {len(rows)} objet(s) mis à jour")
+
+    @property
+    def postgrest(self):
+        return self
+
+    def table(self, name):
+        return TableQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return RpcCall(self, name, params)
+
+    # --- Accès bas niveau ---
+    def query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            self.conn.execute(sql, params)
+
+    def execute_many(self, sql, rows):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(sql, rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # --- Schéma à la volée ---
+    @staticmethod
+    def primary_key(table):
+        return "trend_id" if table.startswith("trend_stats") else "date"
+
+    def table_exists(self, table):
+        return bool(self._table_columns(table))
+
+    def _table_columns(self, table):
+        if table not in self._columns:
+            with self._lock:
+                rows = self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+            if not rows:
+                return set()
+            self._columns[table] = {row["name"] for row in rows}
+        return self._columns[table]
+
+    def ensure_table(self, table, records):
+        """Crée la table ou ajoute les colonnes manquantes d'après les enregistrements."""
+        types = {}
+        for record in records:
+            for column, value in record.items():
+                if column not in types or (types[column] == "TEXT" and value is not None):
+                    types[column] = "TEXT" if value is None or _is_timestamp(column) else _sql_type(value)
+
+        existing = self._table_columns(table)
+        with self._lock:
+            if not existing:
+                key = self.primary_key(table)
+                types.setdefault(key, "TEXT" if _is_timestamp(key) else "INTEGER")
+                columns = ", ".join(f'"{c}" {t}{" PRIMARY KEY" if c == key else ""}' for c, t in types.items())
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns})')
+            else:
+                for column in types.keys() - existing:
+                    self.conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {types[column]}')
+        self._columns.pop(table, None)
+
+    ###------------------------------------------------------------------------------
+    # Chemins rapides propres au backend
+    ###------------------------------------------------------------------------------
+    def rollup_sql(self, level, source, target, start=None):
+        """
+        Agrégation OHLCV de `source` vers `target` (upsert) entièrement en SQL.
+        Retourne (DataFrame des slots écrits, dates en UTC naïf ; date max lue dans la source).
+        """
+        if not self.table_exists(source):
+            return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume"]), None
+        self.ensure_table(target, [{"date": "", "open": 0.0, "high": 0.0, "low": 0.0, "close": 0.0, "volume": 0.0}])
+
+        where, params = "", []
+        if start is not None:
+            where, params = " WHERE date >= ?", _normalize_timestamps([start])
+        sql = f"""
+            INSERT INTO "{target}" (date, open, high, low, close, volume)
+            SELECT slot, open, high, low, close, volume FROM (
+                SELECT slot,
+                       FIRST_VALUE(open) OVER w AS open,
+                       MAX(high) OVER w AS high,
+                       MIN(low) OVER w AS low,
+                       LAST_VALUE(close) OVER w AS close,
+                       SUM(volume) OVER w AS volume,
+                       ROW_NUMBER() OVER (PARTITION BY slot ORDER BY date DESC) AS rn
+                FROM (SELECT date, open, high, low, close, volume, {SLOT_SQL[level]} AS slot
+                      FROM "{source}"{where})
+                WINDOW w AS (PARTITION BY slot ORDER BY date
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+            ) WHERE rn = 1
+            ON CONFLICT(date) DO UPDATE SET open = excluded.open, high = excluded.high,
+                low = excluded.low, close = excluded.close, volume = excluded.volume
+            RETURNING date, open, high, low, close, volume
+        """
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                rows = [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+                last = self.conn.execute(f'SELECT MAX(date) AS last FROM "{source}"{where}', params).fetchone()["last"]
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        agg = pd.DataFrame(rows, columns=["date", "open", "high", "low", "close", "volume"])
+        agg["date"] = pd.to_datetime(agg["date"], utc=True).dt.tz_localize(None)
+        agg = agg.sort_values("date").reset_index(drop=True)
+        last = pd.Timestamp(last).tz_localize(None) if last is not None else None
+        return agg, last
+
+    def gaps(self, table, step_seconds):
+        """Trous de la série : liste de (dernière date avant le trou, première date après)."""
+        if not self.table_exists(table):
+            return []
+        rows = self.query(f"""
+            SELECT prev, date FROM (
+                SELECT date, LAG(date) OVER (ORDER BY date) AS prev FROM "{table}"
+            ) WHERE prev IS NOT NULL
+              AND CAST(strftime('%s', date) AS INTEGER) - CAST(strftime('%s', prev) AS INTEGER) > ?
+        """, [step_seconds])
+        return [(row["prev"], row["date"]) for row in rows]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_sqlite_client():
+    """Client SQLite partagé du processus (base SQLITE_PATH)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SQLiteClient()
+            print(f"🗄️ Backend SQLite : {_client.path}")
+        return _client
+
+
+###----------------------------------------------------------------------------------
+# Comparaison chemin générique / chemin SQL sur la cascade de rollup
+# Usage : python sqlite_backend.py [nombre de bougies minute]   (défaut : 200 000)
+###----------------------------------------------------------------------------------
+def _load_minutes(client, n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 60_000 + np.cumsum(rng.normal(0, 5, n))
+    dates = pd.date_range("2024-01-01", periods=n, freq="min", tz="UTC")
+    spread = np.abs(rng.normal(0, 3, n))
+    records = pd.DataFrame({
+        "date": dates.strftime(ISO_FORMAT),
+        "open": np.r_[close[0], close[:-1]],
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+        "volume": rng.gamma(2, 1, n),
+    }).to_dict(orient="records")
+    client.table("bitcoin_prices_minits").upsert(records).execute()
+
+
+def compare_rollup(n=200_000):
+    import tempfile
+    import time
+    import rollup
+
+    tables = ["btc_t15", "btc_h", "btc_d", "btc_w", "btc_m", "btc_y"]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for pushdown in (False, True):
+            client = SQLiteClient(os.path.join(tmp, f"p3_{pushdown}.sqlite"), pushdown=pushdown)
+            _load_minutes(client, n)
+            t0 = time.perf_counter()
+            rollup.run_cycle(client, state_path=os.path.join(tmp, f"state_{pushdown}.json"))
+            elapsed = time.perf_counter() - t0
+            results[pushdown] = {t: pd.DataFrame(client.table(t).select("*").order("date").execute().data)
+                                 for t in tables}
+            print(f"📊 rollup {'SQL (pushdown)' if pushdown else 'générique (pandas)'} : {elapsed:.2f}s pour {n:,} bougies")
+
+    for t in tables:
+        a, b = results[False][t], results[True][t]
+        assert list(a["date"]) == list(b["date"]), t
+        for col in ["open", "high", "low", "close", "volume"]:
+            np.testing.assert_allclose(a[col], b[col], rtol=1e-9, err_msg=f"{t}.{col}")
+    print(f"✅ Tables {', '.join(tables)} identiques entre les deux chemins")
+
+
+if __name__ == "__main__":
+    import sys
+    compare_rollup(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
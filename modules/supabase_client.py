@@ -1,6 +1,12 @@
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+from supabase_auth import SyncSupportedStorage
 from dotenv import load_dotenv
+import httpx
+import json
 import os
+import threading
+import time
+from local_state import STATE_DIR, write_json
 
 load_dotenv()
 
@@ -10,65 +16,196 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 SUPABASE_EMAIL = os.environ.get("SUPABASE_EMAIL")
 SUPABASE_PASSWORD = os.environ.get("SUPABASE_PASSWORD")
 
-def get_supabase_connection() -> Client:
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_KEY")
+# Session persistée sur disque (réutilisée d'un script à l'autre jusqu'à expiration)
+SESSION_PATH = os.environ.get("SUPABASE_SESSION_PATH", os.path.join(STATE_DIR, "supabase_session.json"))
+# Rafraîchissement anticipé du token (secondes avant expires_at)
+REFRESH_MARGIN = int(os.environ.get("SUPABASE_REFRESH_MARGIN", "300"))
+# Backend de stockage : "supabase" (défaut) ou "sqlite" (base locale, voir sqlite_backend.py)
+BACKEND = os.environ.get("P3_BACKEND", "supabase")
 
-    if not url or not key:
-        raise ValueError("❌ Les variables SUPABASE_URL ou SUPABASE_KEY sont manquantes ou vides.")
 
-    print("✅ Connexion Supabase initialisée avec succès.")
-    return create_client(url, key)
+###----------------------------------------------------------------------------------
+# Stockage de session sur disque
+###----------------------------------------------------------------------------------
+class FileSessionStorage(SyncSupportedStorage):
+    """Stockage GoTrue persistant : un fichier JSON (clé → valeur) lisible par le seul utilisateur."""
 
-def get_supabase_connection() -> Client:
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_KEY")
+    def __init__(self, path=SESSION_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, items):
+        write_json(self.path, items, mode=0o600)
+
+    def get_item(self, key):
+        with self._lock:
+            return self._read().get(key)
+
+    def set_item(self, key, value):
+        with self._lock:
+            items = self._read()
+            items[key] = value
+            self._write(items)
+
+    def remove_item(self, key):
+        with self._lock:
+            items = self._read()
+            if items.pop(key, None) is not None:
+                self._write(items)
+
+
+###----------------------------------------------------------------------------------
+# Pool HTTP partagé (keep-alive) + statistiques de latence par appel
+###----------------------------------------------------------------------------------
+_call_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _endpoint(request):
+    # "/rest/v1/btc_h" , "/auth/v1/token", "/storage/v1/object"...
+    parts = request.url.path.strip("/").split("/")
+    return f"{request.method} /{'/'.join(parts[:3])}"
+
+
+def _on_request(request):
+    request.extensions["p3_started"] = time.perf_counter()
+
+
+def _on_response(response):
+    response.read()
+    started = response.request.extensions.get("p3_started")
+    if started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    key = _endpoint(response.request)
+    with _stats_lock:
+        s = _call_stats.setdefault(key, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["calls"] += 1
+        s["errors"] += response.status_code >= 400
+        s["total_ms"] += elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+
+
+def _create_http_pool():
+    return httpx.Client(
+        timeout=httpx.Timeout(30.0, connect=10.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        follow_redirects=True,
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+def get_call_stats():
+    """Latence par endpoint : appels, erreurs, moyenne et max (ms)."""
+    with _stats_lock:
+        return {
+            key: {**s, "avg_ms": s["total_ms"] / s["calls"] if s["calls"] else 0.0}
+            for key, s in _call_stats.items()
+        }
+
+
+def print_call_stats():
+    stats = get_call_stats()
+    if not stats:
+        return
+    print("\n📊 Appels Supabase")
+    for key, s in sorted(stats.items()):
+        print(f"   {key:<40} {s['calls']:>6} appels | moy {s['avg_ms']:7.1f} ms "
+              f"| max {s['max_ms']:7.1f} ms | erreurs {s['errors']}")
+
+
+###----------------------------------------------------------------------------------
+# Fabrique de client partagée par tout le processus
+###----------------------------------------------------------------------------------
+_client = None
+_client_lock = threading.Lock()
 
-    if not url or not key:
-        raise ValueError("❌ Les variables SUPABASE_URL ou SUPABASE_KEY sont manquantes ou vides.")
 
+def _ensure_fresh_session(client):
+    """Session valide et rafraîchie avant expiration ; connexion par mot de passe en dernier recours."""
+    try:
+        session = client.auth.get_session()
+    except Exception as e:
+        print(f"⚠️ Session persistée inutilisable : {e}")
+        session = None
+
+    if session and session.expires_at and session.expires_at - time.time() < REFRESH_MARGIN:
+        try:
+            session = client.auth.refresh_session().session
+            print("🔄 Token Supabase rafraîchi")
+        except Exception as e:
+            print(f"⚠️ Rafraîchissement impossible : {e}")
+            session = None
+
+    if session:
+        return session
+
+    auth_response = client.auth.sign_in_with_password({
+        "email": SUPABASE_EMAIL,
+        "password": SUPABASE_PASSWORD
+    })
+    if not auth_response.session:
+        raise ValueError("❌ Authentification échouée")
+    print(f"✅ Authentification réussie pour {auth_response.user.email}")
+    return auth_response.session
+
+
+def get_client() -> Client:
+    """
+    Retourne le client Supabase authentifié du processus.
+
+    - La session est lue depuis SESSION_PATH (pas de connexion par mot de passe
+      tant qu'elle est valide) et rafraîchie REFRESH_MARGIN secondes avant expiration.
+    - Un seul pool HTTP keep-alive est partagé par PostgREST, Auth et Storage.
+    - P3_BACKEND=sqlite : client embarqué de même interface (tables, RPC SQL, buckets).
+    """
+    if BACKEND == "sqlite":
+        from sqlite_backend import get_sqlite_client
+        return get_sqlite_client()
+
+    global _client
+    with _client_lock:
+        if _client is None:
+            if not SUPABASE_URL or not SUPABASE_KEY:
+                raise ValueError("❌ Les variables SUPABASE_URL ou SUPABASE_KEY sont manquantes ou vides.")
+            options = ClientOptions(
+                storage=FileSessionStorage(),
+                persist_session=True,
+                auto_refresh_token=True,
+                httpx_client=_create_http_pool(),
+            )
+            _client = create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+        _ensure_fresh_session(_client)
+        return _client
+
+
+def get_supabase_connection() -> Client:
+    client = get_client()
     print("✅ Connexion Supabase initialisée avec succès.")
-    return create_client(url, key)
+    return client
+
 
 def get_supabase_client():
-    """Crée un client Supabase de base."""
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    """Client Supabase partagé du processus."""
+    return get_client()
+
 
 def login_user(email, password):
-    """Authentifie un utilisateur et retourne un client authentifié."""
-    
-    supabase = get_supabase_client()
-    
+    """Authentifie un utilisateur et retourne un client authentifié (session réutilisée si valide)."""
     try:
-        # Authentifier l'utilisateur
-        auth_response = supabase.auth.sign_in_with_password({
-            "email": SUPABASE_EMAIL,
-            "password": SUPABASE_PASSWORD
-        })
-        
-        # Vérifier si l'authentification a réussi
-        if auth_response.user:
-            print(f"✅ Authentification réussie pour {auth_response.user.email}")
-            
-            # Stocker les tokens pour une utilisation ultérieure
-            session_data = {
-                "access_token": auth_response.session.access_token,
-                "refresh_token": auth_response.session.refresh_token,
-                "expires_at": auth_response.session.expires_at
-            }
-            
-            # Vous pourriez sauvegarder ces tokens de manière sécurisée
-            # pour les réutiliser plus tard
-            
-            return supabase  # Le client est déjà authentifié
-        else:
-            print("❌ Authentification échouée")
-            return None
-        
+        return get_client()
     except Exception as e:
         print(f"❌ Erreur d'authentification: {e}")
         return None
 
+
 def restore_session(access_token, refresh_token):
     """Restaure une session existante."""
     
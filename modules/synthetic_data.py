@@ -0,0 +1,139 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from local_state import STATE_DIR
+
+###----------------------------------------------------------------------------------
+# Générateur déterministe de bougies minute synthétiques (benchmarks)
+# - Marche aléatoire en log-prix, rendements de Student (queues épaisses)
+# - Régimes de volatilité (calme / normal / agité) à durée géométrique
+# - Plages plates : prix figé, bougies o = h = l = c (variations nulles, cas limite
+#   de compute_trend_count)
+# - Trous volontaires dans les dates (minutes manquantes), désactivables
+# Génération par blocs de CHUNK_ROWS lignes, chacun avec son propre générateur
+# ([seed, bloc]) et l'état reporté du bloc précédent : même résultat quelle que soit la
+# taille demandée (les n premières lignes d'un jeu plus grand sont identiques) et
+# mémoire bornée jusqu'à 50M lignes. Jeux mis en cache en Arrow IPC (memory-map).
+###----------------------------------------------------------------------------------
+
+DATA_DIR = os.environ.get("P3_BENCH_DATA_DIR", os.path.join(STATE_DIR, "bench", "data"))
+
+CHUNK_ROWS = 1_000_000
+START = np.datetime64("2020-01-01T00:00", "m")
+START_PRICE = 30_000.0
+TICK = 0.01
+# Écart-type des rendements log par minute de chaque régime
+REGIME_SIGMAS = np.array([0.0002, 0.0006, 0.0018])
+REGIME_MEAN_MINUTES = 1440
+FLAT_RATE = 0.002
+FLAT_MEAN_MINUTES = 8
+GAP_RATE = 0.0002
+GAP_MAX_MINUTES = 90
+STUDENT_DF = 4
+
+SCHEMA = pa.schema([pa.field("date", pa.timestamp("ns"))]
+                   + [pa.field(col, pa.float64()) for col in ["open", "high", "low", "close", "volume"]])
+
+
+def _runs(rng, n, rate, mean_length):
+    """Masque des plages (débuts tirés avec probabilité `rate`, longueurs géométriques)."""
+    starts = np.flatnonzero(rng.random(n) < rate)
+    lengths = rng.geometric(1 / mean_length, len(starts))
+    delta = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, np.minimum(starts + lengths, n), -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def _chunk(rng, n, state, gaps):
+    """Un bloc de n bougies à partir de `state` (close, régime, minute) ; retourne (DataFrame, état)."""
+    # Régimes : changements à probabilité constante, nouveau régime tiré au hasard
+    segment = np.cumsum(rng.random(n) < 1 / REGIME_MEAN_MINUTES)
+    regimes = np.r_[state["regime"], rng.integers(0, len(REGIME_SIGMAS), segment[-1])][segment]
+    sigma = REGIME_SIGMAS[regimes]
+
+    # Rendements de Student normalisés (variance 1), nuls sur les plages plates
+    returns = sigma * rng.standard_t(STUDENT_DF, n) / np.sqrt(STUDENT_DF / (STUDENT_DF - 2))
+    flat = _runs(rng, n, FLAT_RATE, FLAT_MEAN_MINUTES)
+    returns[flat] = 0.0
+    close = np.round(state["close"] * np.exp(np.cumsum(returns)) / TICK) * TICK
+    open_ = np.r_[state["close"], close[:-1]]
+
+    # Mèches proportionnelles à la volatilité du régime (aucune sur les plages plates)
+    wick = np.abs(rng.normal(0, 0.5, (2, n))) * sigma * close
+    wick[:, flat] = 0.0
+    high = np.round((np.maximum(open_, close) + wick[0]) / TICK) * TICK
+    low = np.round((np.minimum(open_, close) - wick[1]) / TICK) * TICK
+    volume = np.round(rng.gamma(2.0, 5.0, n) * sigma / REGIME_SIGMAS[0], 3)
+    volume[flat] = 0.0
+
+    # Dates : une minute par bougie, plus les trous
+    minutes = state["minute"] + np.arange(n)
+    if gaps:
+        skipped = np.where(rng.random(n) < GAP_RATE, rng.integers(1, GAP_MAX_MINUTES + 1, n), 0)
+        minutes = minutes + np.cumsum(skipped)
+    dates = (START + minutes.astype("timedelta64[m]")).astype("datetime64[ns]")
+
+    df = pd.DataFrame({"date": dates, "open": open_, "high": high, "low": low, "close": close, "volume": volume})
+    return df, {"close": float(close[-1]), "regime": int(regimes[-1]), "minute": int(minutes[-1]) + 1}
+
+
+def iter_minute_candles(n, seed=0, gaps=True):
+    """Bougies minute par blocs de CHUNK_ROWS lignes (DataFrames date/open/high/low/close/volume)."""
+    state = {"close": START_PRICE, "regime": 1, "minute": 0}
+    for k, offset in enumerate(range(0, n, CHUNK_ROWS)):
+        rng = np.random.default_rng([seed, k])
+        df, state = _chunk(rng, CHUNK_ROWS, state, gaps)
+        yield df.iloc[:n - offset] if n - offset < CHUNK_ROWS else df
+
+
+def make_minute_candles(n, seed=0, gaps=True):
+    return pd.concat(iter_minute_candles(n, seed, gaps), ignore_index=True)
+
+
+def dataset_path(n, seed=0, gaps=True, root=DATA_DIR):
+    return os.path.join(root, f"minutes_{n}_s{seed}{'' if gaps else '_nogap'}.arrow")
+
+
+def load_dataset(n, seed=0, gaps=True, root=DATA_DIR) -> pa.Table:
+    """Jeu de données figé : généré une fois (bloc par bloc) puis relu en memory-map."""
+    path = dataset_path(n, seed, gaps, root)
+    if not os.path.exists(path):
+        os.makedirs(root, exist_ok=True)
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with ipc.new_file(sink, SCHEMA) as writer:
+                for df in iter_minute_candles(n, seed, gaps):
+                    writer.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False))
+        os.replace(path + ".tmp", path)
+    return ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def describe(df):
+    """Résumé des propriétés du jeu (contrôle visuel du générateur)."""
+    steps = df["date"].diff().dt.total_seconds().div(60).iloc[1:]
+    moves = np.diff(df["close"].to_numpy())
+    return {
+        "rows": len(df),
+        "start": str(df["date"].iloc[0]),
+        "end": str(df["date"].iloc[-1]),
+        "gaps": int((steps > 1).sum()),
+        "missing_minutes": int((steps - 1).clip(lower=0).sum()),
+        "zero_moves": float(np.mean(moves == 0)),
+        "min_close": float(df["close"].min()),
+        "max_close": float(df["close"].max()),
+    }
+
+
+if __name__ == "__main__":
+    # python synthetic_data.py [lignes] [seed] : génère / met en cache le jeu et affiche son résumé
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    t0 = time.perf_counter()
+    table = load_dataset(n, seed)
+    print(f"🧪 {n:,} bougies minute en {time.perf_counter() - t0:.2f}s → {dataset_path(n, seed)}")
+    print(describe(table.to_pandas()))
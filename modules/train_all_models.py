@@ -1,16 +1,16 @@
 import os
 import sys
-import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, mean_absolute_percentage_error
-import joblib
-import ta
 
 # Ajouter le dossier modules au path
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '..', 'modules')))
 from supabase_client import login_user
+from feature_store import load_features, feature_hash
+from forecaster import MODEL_MODE, compare_modes, compare_learners, model_name, learner_for, learner_params, tuned_config
+from model_registry import ModelRegistry
+from train_scheduler import prepare_tables, run_training
+from incremental_training import incremental_update, target_range
 
 # ==========================================
 # 🔐 Auth Supabase
@@ -27,81 +27,49 @@ print("✅ Connexion Supabase OK.")
 tables = ["btc_t15", "btc_h", "btc_d"]
 targets = ["shifted_open", "shifted_high", "shifted_low", "shifted_close", "shifted_volume"]
 max_rows = 500_000
-local_model_dir = "/tmp/models/"
+# P3_MODEL_MODE : "per_target" (une forêt par target), "multi" (une forêt multi-sorties)
+# ou "compare" / "compare_learners" (évaluation sur holdout, sans upload)
+# ou "search" (validation walk-forward + recherche d'hyperparamètres, sans upload)
+# P3_LEARNER : "rf", "hgb", choix par table ("btc_t15=hgb,btc_h=rf") ou "auto" (résultat de la recherche)
+model_mode = MODEL_MODE
+# P3_TRAINING : "full" (tout réentraîner) ou "incremental" (warm start sur les données nouvelles)
+training_mode = os.environ.get("P3_TRAINING", "full")
 bucket_name = "models"
 
-os.makedirs(local_model_dir, exist_ok=True)
-
 # ==========================================
-# ✅ Fonction Upload vers Supabase Storage
+# ✅ Registre : version immuable + manifeste, puis promotion
 # ==========================================
-def upload_model_to_supabase(file_path, file_name):
+registry = ModelRegistry(supabase, bucket_name)
+
+def publish_model(name, model, table, features, dates, metrics, extra=None, learner="rf"):
     try:
-        with open(file_path, "rb") as f:
-            supabase.storage.from_(bucket_name).upload(file_name, f, {"upsert": "true"})
-        print(f"✅ Modèle uploadé/updaté dans Supabase Storage : {file_name}")
+        manifest = registry.register(
+            name, model,
+            features=features.columns,
+            training_window={"start": dates.min().isoformat(), "end": dates.max().isoformat(), "rows": len(features)},
+            metrics=metrics,
+            params=learner_params(table, learner),
+            extra={"table": table, "learner": learner, "feature_hash": feature_hash(),
+                   # Score walk-forward de la configuration (les métriques sont calculées sur l'entraînement)
+                   "cv": tuned_config(table).get(learner, {}).get("cv"), **(extra or {})},
+        )
+        registry.promote(name, manifest["version"])
     except Exception as e:
-        print(f"⚠️ Échec upload Supabase : {file_name} | Erreur : {e}")
-
-# ==========================================
-# ✅ Ajout KPI (version locale)
-# ==========================================
-def add_primary_kpis(df):
-    df["date"] = pd.to_datetime(df["date"])
-
-    # EMA dynamiques
-    for w in [7, 20, 99]:
-        if len(df) >= w:
-            df[f"ema_{w}"] = ta.trend.ema_indicator(close=df["close"], window=w, fillna=False)
-
-    # MACD
-    macd = ta.trend.MACD(close=df["close"], window_slow=26, window_fast=12, window_sign=9)
-    df["macd"] = macd.macd()
-    df["macd_signal"] = macd.macd_signal()
-
-    # RSI
-    df["rsi"] = ta.momentum.rsi(close=df["close"], window=14)
-
-    # Bollinger %B
-    boll = ta.volatility.BollingerBands(close=df["close"], window=20, window_dev=2)
-    df["boll_b"] = boll.bollinger_pband()
-
-    # Stochastic RSI
-    df["stoch_rsi"] = ta.momentum.stochrsi(close=df["close"], window=14, smooth1=3, smooth2=3)
-
-    # Moyenne mobile volume
-    df["volume_ma20"] = df["volume"].rolling(window=20).mean()
-
-    # Analyse chandelle
-    df["body_size"] = df["close"] - df["open"]
-    df["amplitude"] = df["high"] - df["low"]
-    df["upper_wick"] = df["high"] - df[["close", "open"]].max(axis=1)
-    df["lower_wick"] = df[["close", "open"]].min(axis=1) - df["low"]
-    df["efficiency_ratio"] = np.where(df["amplitude"] != 0, df["body_size"].abs() / df["amplitude"], 0)
-
-    # Variations %
-    for col in ["open", "high", "low", "close", "volume", "body_size", "amplitude"]:
-        df[f"{col}_pct_change_1"] = df[col].pct_change()
-
-    return df.dropna()
+        print(f"⚠️ Échec publication du modèle : {name} | Erreur : {e}")
 
 # ==========================================
 # 🔄 Fonction récupération Supabase + préparation
 # ==========================================
 def fetch_and_prepare(table_name):
-    print(f"\n📥 Récupération des données : {table_name}")
-    response = supabase.table(table_name).select("*").order("date").execute()
-    data = response.data
-    if not data:
+    print(f"\n📥 Récupération des features : {table_name}")
+    # Features matérialisées (mêmes octets que ceux lus par predict_master)
+    df, _ = load_features(supabase, table_name)
+    if df.empty:
         print(f"⚠️ Table vide : {table_name}")
         return None
 
-    df = pd.DataFrame(data)
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"]).sort_values("date").reset_index(drop=True)
-
-    # Ajout KPI locaux
-    df = add_primary_kpis(df)
+    # Lignes de chauffe des indicateurs
+    df = df.dropna()
 
     # Ajout colonnes shifted
     for col in ["open", "high", "low", "close", "volume"]:
@@ -113,12 +81,12 @@ def fetch_and_prepare(table_name):
     return df
 
 # ==========================================
-# 🤖 Boucle d'entraînement par table et target
+# 🧹 Features (sans date + targets) alignées sur les targets
 # ==========================================
-for table in tables:
+def prepare_table(table):
     df = fetch_and_prepare(table)
     if df is None:
-        continue
+        return None
 
     # Features (sans date + targets)
     drop_cols = ["date"] + [f"shifted_{c}" for c in ["open", "high", "low", "close", "volume"]]
@@ -132,25 +100,61 @@ for table in tables:
     features = features.astype(np.float32)
 
     print(f"\n✅ Table {table} prête : {features.shape[0]} lignes")
+    # Dates conservées pour la fenêtre d'entraînement du manifeste
+    return features, df[targets + ["date"]].loc[features.index]  # Alignement indices
 
-    for target_col in targets:
-        print(f"\n⚡ Entraînement modèle pour {table} → {target_col}")
-
-        y = df[target_col].loc[features.index]  # Alignement indices
-        model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42)
-        model.fit(features, y)
-
-        pred = model.predict(features)
-        mse = mean_squared_error(y, pred)
-        rmse = mse ** 0.5
-        mape = mean_absolute_percentage_error(y, pred)
-        print(f"✅ {target_col} | RMSE: {rmse:.2f} | MAPE: {mape:.2%}")
-
-        # Sauvegarde locale (debug) + upload Supabase
-        file_name = f"rf_model_{table}_{target_col}.pkl"
-        local_path = os.path.join(local_model_dir, file_name)
-
-        joblib.dump(model, local_path, compress=3)
-        print(f"💾 Modèle sauvegardé localement : {local_path}")
-
-        upload_model_to_supabase(local_path, file_name)
+# ==========================================
+# 🤖 Entraînement : tables préparées en parallèle, jobs (table, target) sur un pool de processus
+# ==========================================
+if __name__ == "__main__":
+    datasets = prepare_tables(tables, prepare_table)
+
+    if model_mode == "compare":
+        for table, (features, Y) in datasets.items():
+            compare_modes(features, Y[targets], targets)
+        sys.exit(0)
+
+    if model_mode == "compare_learners":
+        best = {table: compare_learners(features, Y[targets], targets, label=table)["best"]
+                for table, (features, Y) in datasets.items()}
+        print(f"\n👉 P3_LEARNER={','.join(f'{t}={l}' for t, l in best.items())}")
+        sys.exit(0)
+
+    if model_mode == "search":
+        from model_search import search_tables
+        search_tables(datasets, targets)
+        print("\n👉 P3_LEARNER=auto pour entraîner avec les configurations retenues")
+        sys.exit(0)
+
+    def publish(result):
+        table = result["table"]
+        features, Y = datasets[table]
+        for target_col, m in result["metrics"].items():
+            print(f"✅ {table} {target_col} | RMSE: {m['rmse']:.2f} | MAPE: {m['mape']:.2%}")
+        # Version immuable dans le registre (local + bucket) puis promotion
+        publish_model(model_name(table, result["target"], result["learner"]), result["model"], table, features,
+                      Y["date"], result["metrics"], {"target_range": target_range(Y, list(result["metrics"]))},
+                      learner=result["learner"])
+
+    def publish_incremental(name, model, table, metrics, ranges, info):
+        features, Y = datasets[table]
+        window = features.iloc[-info["window_rows"]:]
+        publish_model(name, model, table, window, Y["date"].loc[window.index], metrics,
+                      {"target_range": ranges, "incremental": info}, learner=learner_for(table))
+
+    selected = None
+    if training_mode == "incremental":
+        selected = incremental_update(registry, datasets, targets, model_mode == "multi", feature_hash(),
+                                      publish_incremental)
+    if selected is None or selected:
+        run_training(datasets, targets, multi=model_mode == "multi", on_result=publish, selected=selected)
+
+    # Apprenant servi par table publié dans l'index du registre (lu par predict_master en
+    # P3_LEARNER=auto), une fois tous les modèles de la table promus
+    index = registry.index()
+    for table in datasets:
+        learner = learner_for(table)
+        names = ([model_name(table, None, learner)] if model_mode == "multi"
+                 else [model_name(table, target, learner) for target in targets])
+        if all((index.get(name) or {}).get("current") for name in names):
+            registry.select_learner(table, learner)
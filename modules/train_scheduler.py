@@ -0,0 +1,195 @@
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import mean_squared_error, mean_absolute_percentage_error
+from threadpoolctl import threadpool_limits
+from forecaster import MultiOutputForecaster, FeatureBinner, BinnedRegressor, learner_params, learner_for
+
+###----------------------------------------------------------------------------------
+# Ordonnanceur d'entraînement (tables × targets) sur un pool de processus
+# - Préparation des tables en parallèle (threads : I/O feature store + pandas)
+# - Matrices X (float32) et Y de chaque table publiées une seule fois en mémoire
+#   partagée ; les workers s'y attachent en lecture seule (aucun pickling des données)
+# - Budget CPU global P3_TRAIN_CPUS (défaut : tous les cœurs) réparti entre
+#   workers et threads des forêts (n_jobs) / OpenMP (HistGradientBoosting)
+# - Tables en hgb : la matrice partagée est la matrice binnée (uint8), calculée une
+#   seule fois par table et réutilisée par les cinq cibles
+# - P3_TRAIN_BASELINE=1 : les mêmes jobs sont rejoués ensuite avec un budget de 1 CPU
+#   (résultats non publiés) pour mesurer l'accélération réelle du pool
+# Ce module n'a pas d'effet de bord à l'import (workers sans login Supabase).
+###----------------------------------------------------------------------------------
+
+CPU_BUDGET = int(os.environ.get("P3_TRAIN_CPUS", "0")) or os.cpu_count()
+# fork : pas de ré-exécution du script appelant dans les workers (Linux)
+START_METHOD = os.environ.get("P3_TRAIN_START_METHOD", "fork" if "fork" in mp.get_all_start_methods() else "spawn")
+BASELINE = os.environ.get("P3_TRAIN_BASELINE", "0") == "1"
+
+
+class SharedArray:
+    """Tableau NumPy copié une fois dans un segment de mémoire partagée."""
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf)[...] = array
+        self.spec = {"name": self.shm.name, "shape": array.shape, "dtype": array.dtype.str}
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Segments déjà attachés dans ce worker (nom → (segment, vue))
+_attached = {}
+
+
+def attach(spec):
+    if spec["name"] not in _attached:
+        shm = shared_memory.SharedMemory(name=spec["name"])
+        view = np.ndarray(spec["shape"], dtype=np.dtype(spec["dtype"]), buffer=shm.buf)
+        view.flags.writeable = False
+        _attached[spec["name"]] = (shm, view)
+    return _attached[spec["name"]][1]
+
+
+###----------------------------------------------------------------------------------
+# Job (exécuté dans un worker)
+###----------------------------------------------------------------------------------
+def fit_job(job):
+    """Entraîne un modèle (par target, ou multi-sorties si job["target"] est None)."""
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    X = attach(job["X"])
+    Y = attach(job["Y"])
+
+    if job["learner"] == "hgb":
+        names = job["targets"] if job["target"] is None else [job["target"]]
+        cols = [job["targets"].index(name) for name in names]
+        with threadpool_limits(job["threads"]):
+            estimators = [HistGradientBoostingRegressor(**job["params"]).fit(X, Y[:, c]) for c in cols]
+            pred = np.column_stack([est.predict(X) for est in estimators])
+        model = BinnedRegressor(job["binner"], estimators, names, job["columns"])
+        return _result(job, model, names, pred, Y[:, cols], t0, cpu0)
+
+    params = {**job["params"], "n_jobs": job["threads"]}
+    if job["target"] is None:
+        model = MultiOutputForecaster(job["targets"], **params).fit(X, Y)
+        forest, pred, truth = model.forest, model.predict(X), Y
+    else:
+        y = Y[:, job["targets"].index(job["target"])]
+        model = forest = RandomForestRegressor(**params).fit(X, y)
+        pred, truth = model.predict(X)[:, None], y[:, None]
+
+    # Modèle publié : noms de features pour predict_master, prédiction mono-thread
+    forest.feature_names_in_ = np.asarray(job["columns"], dtype=object)
+    forest.set_params(n_jobs=None)
+
+    names = job["targets"] if job["target"] is None else [job["target"]]
+    return _result(job, model, names, pred, truth, t0, cpu0)
+
+
+def _result(job, model, names, pred, truth, t0, cpu0):
+    metrics = {
+        name: {"rmse": mean_squared_error(truth[:, i], pred[:, i]) ** 0.5,
+               "mape": mean_absolute_percentage_error(truth[:, i], pred[:, i])}
+        for i, name in enumerate(names)
+    }
+    return {"table": job["table"], "target": job["target"], "learner": job["learner"], "model": model, "metrics": metrics,
+            "wall_s": time.perf_counter() - t0, "cpu_s": time.process_time() - cpu0,
+            "threads": job["threads"], "pid": os.getpid()}
+
+
+###----------------------------------------------------------------------------------
+# Orchestration (processus principal)
+###----------------------------------------------------------------------------------
+def prepare_tables(tables, prepare):
+    """prepare(table) → (features DataFrame float32, Y DataFrame) ou None ; une table par thread."""
+    with ThreadPoolExecutor(max_workers=len(tables)) as pool:
+        prepared = dict(zip(tables, pool.map(prepare, tables)))
+    return {table: data for table, data in prepared.items() if data is not None}
+
+
+def _run_jobs(jobs, cpu_budget, on_result=None):
+    """Exécute les jobs sur un pool de `cpu_budget` CPU ; retourne (résultats, durée écoulée)."""
+    workers = min(len(jobs), cpu_budget)
+    threads = max(1, cpu_budget // workers)
+    jobs = [{**job, "threads": threads} for job in jobs]
+
+    print(f"\n🧵 {len(jobs)} job(s) | {workers} worker(s) × {threads} thread(s) | budget {cpu_budget} CPU")
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(START_METHOD)) as pool:
+        futures = [pool.submit(fit_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            label = result["target"] or "multi-sorties"
+            print(f"✅ {result['table']} → {label} [{result['learner']}] en {result['wall_s']:.1f}s (pid {result['pid']})")
+            if on_result is not None:
+                on_result(result)
+            results.append(result)
+    return results, time.perf_counter() - t0
+
+
+def run_training(datasets, targets, multi=False, cpu_budget=CPU_BUDGET, on_result=None, selected=None,
+                 learners=learner_for, baseline=BASELINE):
+    """
+    datasets : {table: (features, Y)}. Un job par (table, target), ou par table en
+    multi-sorties (target None). selected : ensemble de couples (table, target) à
+    entraîner (défaut : tous). learners(table) → "rf" | "hgb". on_result(result) est appelé dans le processus principal
+    dès qu'un job se termine (publication dans le registre). baseline : rejoue les jobs avec
+    un budget de 1 CPU (référence séquentielle mesurée). Retourne la liste des résultats.
+    """
+    shared, jobs = [], []
+    try:
+        for table, (features, Y) in datasets.items():
+            if selected is not None and not any(t == table for t, _ in selected):
+                continue
+            learner = learners(table)
+            X = features.to_numpy(dtype=np.float32)
+            binner = None
+            if learner == "hgb":
+                # Binning une seule fois par table, partagé par toutes les cibles
+                binner = FeatureBinner().fit(X)
+                X = binner.transform(X)
+            X_shared = SharedArray(X)
+            Y_shared = SharedArray(Y[targets].to_numpy(dtype=np.float64))
+            shared += [X_shared, Y_shared]
+            base = {"table": table, "X": X_shared.spec, "Y": Y_shared.spec, "targets": list(targets),
+                    "columns": [str(c) for c in features.columns], "learner": learner, "binner": binner,
+                    "params": learner_params(table, learner), "rows": len(features)}
+            table_jobs = [{**base, "target": None}] if multi else [{**base, "target": t} for t in targets]
+            jobs += [j for j in table_jobs if selected is None or (table, j["target"]) in selected]
+
+        if not jobs:
+            return []
+        # Plus grosses tables d'abord : meilleur remplissage du pool
+        jobs.sort(key=lambda j: -j["rows"])
+        results, elapsed = _run_jobs(jobs, cpu_budget, on_result)
+        sequential = None
+        if baseline:
+            print("\n🐢 Référence séquentielle : mêmes jobs avec un budget de 1 CPU (non publiés)")
+            sequential = _run_jobs(jobs, 1)[1]
+    finally:
+        for array in shared:
+            array.release()
+
+    print_report(results, elapsed, sequential)
+    return results
+
+
+def print_report(results, elapsed, sequential=None):
+    # Accélération : durée de la référence séquentielle mesurée (P3_TRAIN_BASELINE=1) / durée
+    # du pool. Parallélisme moyen = CPU·s cumulés / durée écoulée (cœurs occupés en moyenne).
+    print(f"\n⏱️ {'table':<8}{'target':<16}{'modèle':>7}{'durée':>8}{'CPU':>8}{'threads':>9}")
+    for r in sorted(results, key=lambda r: (r["table"], r["target"] or "")):
+        print(f"   {r['table']:<8}{r['target'] or 'multi-sorties':<16}{r['learner']:>7}{r['wall_s']:>7.1f}s"
+              f"{r['cpu_s']:>7.1f}s{r['threads']:>9}")
+    cpu_s = sum(r["cpu_s"] for r in results)
+    print(f"⏱️ Total {elapsed:.1f}s | {cpu_s:.1f} CPU·s cumulés | parallélisme moyen {cpu_s / elapsed:.1f} cœur(s)")
+    if sequential is not None:
+        print(f"⏱️ Accélération x{sequential / elapsed:.2f} vs exécution séquentielle mesurée ({sequential:.1f}s, 1 CPU)")
+    else:
+        print("⏱️ Accélération non mesurée (P3_TRAIN_BASELINE=1 pour rejouer les jobs sur 1 CPU)")
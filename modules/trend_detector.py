@@ -0,0 +1,148 @@
+import json
+import os
+import pandas as pd
+from trend_supabase import compute_trend_count, aggregate_trends, finalize_trend_stats, get_interval
+from price_mirror import sync_and_read
+import trend_sketch
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Détection de tendances reprenable (checkpoint par table)
+# Au lieu de relire toutes les bougies depuis le début de la dernière tendance à
+# chaque cycle, on persiste l'état de fin de passage : dernier close, dernière
+# direction, trend_id / trend_count courants et agrégats de la tendance ouverte.
+# Un passage ne lit alors que les bougies postérieures au checkpoint : O(nouvelles bougies).
+###----------------------------------------------------------------------------------
+
+AGG_COLUMNS = ["start_time", "end_time", "duration", "start_price", "end_price", "max_price", "min_price"]
+
+
+def _state_path(table_name):
+    return os.path.join(STATE_DIR, f"trend_state_{table_name}.json")
+
+
+def load_state(table_name):
+    try:
+        with open(_state_path(table_name), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_state(table_name, state):
+    write_json(_state_path(table_name), state)
+
+
+def reset_state(table_name):
+    """Force un recalcul complet au prochain passage (ex. après correction de données)."""
+    try:
+        os.remove(_state_path(table_name))
+    except FileNotFoundError:
+        pass
+
+
+def drop_open_candle(df):
+    """
+    Retire la dernière bougie de la table (encore en cours) : seules les bougies
+    clôturées entrent dans le checkpoint, sinon leur close évoluerait après coup.
+    """
+    return df.iloc[:-1].reset_index(drop=True)
+
+
+def state_from_frame(df):
+    """Construit le checkpoint à partir d'un DataFrame passé par compute_trend_count."""
+    last = df.iloc[-1]
+    open_trend = aggregate_trends(df[df["trend_id"] == last["trend_id"]]).iloc[0]
+    return {
+        "last_date": pd.Timestamp(last["date"]).isoformat(),
+        "last_close": float(last["close"]),
+        "last_direction": df.attrs.get("trend_direction"),
+        "trend_id": int(last["trend_id"]),
+        "trend_count": int(last["trend_count"]),
+        "open_trend": _agg_to_dict(open_trend),
+    }
+
+
+def _agg_to_dict(row):
+    return {
+        "start_time": pd.Timestamp(row["start_time"]).isoformat(),
+        "end_time": pd.Timestamp(row["end_time"]).isoformat(),
+        "duration": int(row["duration"]),
+        "start_price": float(row["start_price"]),
+        "end_price": float(row["end_price"]),
+        "max_price": float(row["max_price"]),
+        "min_price": float(row["min_price"]),
+    }
+
+
+def merge_open_trend(stats, state):
+    """Fusionne la première tendance du lot avec les agrégats de la tendance ouverte du checkpoint."""
+    stats = stats.copy()
+    if stats.empty or stats.loc[0, "trend_id"] != state["trend_id"]:
+        return stats
+
+    carried = state["open_trend"]
+    stats.loc[0, "start_time"] = pd.Timestamp(carried["start_time"])
+    stats.loc[0, "start_price"] = carried["start_price"]
+    stats.loc[0, "duration"] += carried["duration"]
+    stats.loc[0, "max_price"] = max(stats.loc[0, "max_price"], carried["max_price"])
+    stats.loc[0, "min_price"] = min(stats.loc[0, "min_price"], carried["min_price"])
+    return stats
+
+
+def fetch_new_candles(supabase, table_name, last_date):
+    """Bougies strictement postérieures au checkpoint (miroir local synchronisé en delta)."""
+    df = sync_and_read(supabase, table_name, start=last_date)
+    return df[df["date"] > pd.Timestamp(last_date)].reset_index(drop=True)
+
+
+def resume(supabase, source_table, dest_table, state):
+    """
+    Reprend la détection depuis le checkpoint de `source_table` et écrit les deltas :
+    UPDATE de la tendance ouverte (si elle se prolonge) et INSERT des nouvelles.
+    Retourne le nouveau checkpoint (déjà persisté) ou l'ancien si rien de neuf.
+    """
+    df = fetch_new_candles(supabase, source_table, state["last_date"])
+    df = drop_open_candle(df)
+    if df.empty:
+        print("⚡ Aucune nouvelle bougie clôturée depuis le checkpoint")
+        return state
+
+    df.attrs["interval"] = get_interval(source_table)
+    df = compute_trend_count(df, start_id=state["trend_id"], carry=state)
+
+    stats = merge_open_trend(aggregate_trends(df), state)
+    # Agrégats de la tendance ouverte en fin de lot, avant calcul des scores
+    new_state = {
+        "last_date": pd.Timestamp(df["date"].iloc[-1]).isoformat(),
+        "last_close": float(df["close"].iloc[-1]),
+        "last_direction": df.attrs["trend_direction"],
+        "trend_id": int(df["trend_id"].iloc[-1]),
+        "trend_count": int(df["trend_count"].iloc[-1]),
+        "open_trend": _agg_to_dict(stats.iloc[-1]),
+    }
+
+    sketches = trend_sketch.load_or_rebuild(supabase, dest_table)
+    trend_stats = finalize_trend_stats(stats, df.attrs["interval"], sketches)
+    for col in trend_stats.columns:
+        if "time" in col or col == "date":
+            trend_stats[col] = trend_stats[col].astype(str)
+
+    updated = trend_stats[trend_stats["trend_id"] == state["trend_id"]]
+    inserted = trend_stats[trend_stats["trend_id"] != state["trend_id"]]
+
+    if not updated.empty:
+        supabase.table(dest_table).update(updated.iloc[0].to_dict()).eq("trend_id", state["trend_id"]).execute()
+    if not inserted.empty:
+        supabase.table(dest_table).insert(inserted.to_dict(orient="records")).execute()
+
+    if updated.empty:
+        # La tendance du checkpoint s'est close pile à la frontière : déjà en base, à ajouter aux sketches
+        closed = supabase.table(dest_table).select("slope, risk_score, trend_score, slope_pct") \
+            .eq("trend_id", state["trend_id"]).execute().data
+        sketches.add(pd.DataFrame(closed))
+    trend_sketch.record_closed_trends(dest_table, sketches, trend_stats)
+    save_state(source_table, new_state)
+    print(f"✅ {len(df)} bougie(s) traitée(s) | tendance {state['trend_id']} "
+          f"{'prolongée' if not updated.empty else 'close'} | {len(inserted)} nouvelle(s)")
+    return new_state
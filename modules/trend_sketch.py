@@ -0,0 +1,232 @@
+import json
+import os
+import numpy as np
+from local_state import STATE_DIR, write_json
+
+###----------------------------------------------------------------------------------
+# Sketches de distribution par table de tendances (trend_stats_*)
+# extract_trend_stats normalisait la pente / le risque et fixait les seuils
+# STRONG / MEDIUM / WEAK (p50 / p75) sur le seul lot courant : un passage
+# incrémental de 1 ou 2 tendances donnait des scores incomparables à l'historique.
+# On persiste ici, par table, des t-digests fusionnables (trend_score, |slope_pct|)
+# et les maxima courants (|slope|, risk_score) : mémoire O(1), mise à jour O(nouvelles tendances).
+###----------------------------------------------------------------------------------
+
+
+class TDigest:
+    """
+    t-digest fusionnable (fonction d'échelle k1) entièrement vectorisé :
+    les centroïdes sont regroupés par tranche unitaire de k(q) = δ/2π · asin(2q - 1),
+    plus fine aux extrémités de la distribution qu'au centre.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    @classmethod
+    def from_array(cls, values, compression=100):
+        digest = cls(compression)
+        digest.update(values)
+        return digest
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.r_[self.means, values], np.r_[self.weights, np.ones(len(values))])
+        return self
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.r_[self.means, other.means], np.r_[self.weights, other.weights])
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.r_[0.0, centers, self.count]
+        ys = np.r_[self.min, self.means, self.max]
+        return np.interp(np.asarray(q) * self.count, xs, ys)
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        groups = np.floor(k - k.min()).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def to_dict(self):
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min if np.isfinite(self.min) else None,
+            "max": self.max if np.isfinite(self.max) else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        digest = cls(d["compression"])
+        digest.means = np.asarray(d["means"], dtype=np.float64)
+        digest.weights = np.asarray(d["weights"], dtype=np.float64)
+        digest.min = d["min"] if d["min"] is not None else np.inf
+        digest.max = d["max"] if d["max"] is not None else -np.inf
+        return digest
+
+
+class TrendSketches:
+    """Distributions globales d'une table trend_stats_* utilisées par finalize_trend_stats."""
+
+    def __init__(self, score=None, abs_slope_pct=None, max_abs_slope=0.0, max_risk=0.0):
+        self.score = score or TDigest()
+        self.abs_slope_pct = abs_slope_pct or TDigest()
+        self.max_abs_slope = max_abs_slope
+        self.max_risk = max_risk
+
+    @property
+    def count(self):
+        return self.score.count
+
+    def add(self, stats):
+        """Ajoute des tendances clôturées (colonnes slope, risk_score, trend_score, slope_pct)."""
+        if stats.empty:
+            return self
+        self.max_abs_slope = max(self.max_abs_slope, float(np.nanmax(np.abs(stats["slope"]))))
+        self.max_risk = max(self.max_risk, float(np.nanmax(stats["risk_score"])))
+        self.score.update(stats["trend_score"].to_numpy())
+        self.abs_slope_pct.update(np.abs(stats["slope_pct"].to_numpy()))
+        return self
+
+    def to_dict(self):
+        return {
+            "score": self.score.to_dict(),
+            "abs_slope_pct": self.abs_slope_pct.to_dict(),
+            "max_abs_slope": self.max_abs_slope,
+            "max_risk": self.max_risk,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            TDigest.from_dict(d["score"]),
+            TDigest.from_dict(d["abs_slope_pct"]),
+            d["max_abs_slope"],
+            d["max_risk"],
+        )
+
+
+###----------------------------------------------------------------------------------
+# Persistance (un fichier par table de tendances)
+###----------------------------------------------------------------------------------
+def _sketch_path(dest_table):
+    return os.path.join(STATE_DIR, f"trend_sketch_{dest_table}.json")
+
+
+def load_sketches(dest_table):
+    try:
+        with open(_sketch_path(dest_table), "r") as f:
+            return TrendSketches.from_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def save_sketches(dest_table, sketches):
+    write_json(_sketch_path(dest_table), sketches.to_dict())
+
+
+###----------------------------------------------------------------------------------
+# Reconstruction depuis l'historique (un seul passage vectorisé)
+###----------------------------------------------------------------------------------
+HISTORY_COLUMNS = ["trend_id", "slope", "risk_score", "trend_efficiency", "slope_pct"]
+
+
+def fetch_trend_history(supabase, dest_table, page_size=1000):
+    """Colonnes utiles de toutes les tendances, lues par pages (keyset sur trend_id)."""
+    columns = {c: [] for c in HISTORY_COLUMNS}
+    last_id = None
+    while True:
+        query = supabase.table(dest_table).select(", ".join(HISTORY_COLUMNS))
+        if last_id is not None:
+            query = query.gt("trend_id", last_id)
+        rows = query.order("trend_id", desc=False).limit(page_size).execute().data
+        if not rows:
+            break
+        for c in HISTORY_COLUMNS:
+            columns[c].extend(r[c] for r in rows)
+        last_id = rows[-1]["trend_id"]
+    return {c: np.asarray(v, dtype=np.float64) for c, v in columns.items()}
+
+
+def rebuild_sketches(supabase, dest_table, exclude_open=True):
+    """
+    Reconstruit les sketches de `dest_table` depuis l'historique complet.
+    Les trend_score sont recalculés avec les maxima globaux (mêmes pondérations que
+    finalize_trend_stats). La dernière tendance, encore ouverte, est exclue par défaut :
+    elle sera ajoutée lorsqu'elle sera clôturée.
+    """
+    h = fetch_trend_history(supabase, dest_table)
+    if exclude_open and len(h["trend_id"]):
+        keep = h["trend_id"] != h["trend_id"].max()
+        h = {c: v[keep] for c, v in h.items()}
+
+    sketches = TrendSketches()
+    if len(h["trend_id"]) == 0:
+        save_sketches(dest_table, sketches)
+        return sketches
+
+    abs_slope = np.abs(h["slope"])
+    sketches.max_abs_slope = float(np.nanmax(abs_slope))
+    sketches.max_risk = float(np.nanmax(h["risk_score"]))
+    scores = ((abs_slope / (sketches.max_abs_slope + 1e-9)) * 0.5
+              + h["trend_efficiency"] * 0.4
+              - (h["risk_score"] / (sketches.max_risk + 1e-9)) * 0.1) * 100
+    sketches.score = TDigest.from_array(scores)
+    sketches.abs_slope_pct = TDigest.from_array(np.abs(h["slope_pct"]))
+
+    save_sketches(dest_table, sketches)
+    print(f"🧮 Sketches {dest_table} reconstruits sur {len(scores)} tendances")
+    return sketches
+
+
+def load_or_rebuild(supabase, dest_table):
+    sketches = load_sketches(dest_table)
+    if sketches is None:
+        sketches = rebuild_sketches(supabase, dest_table)
+    return sketches
+
+
+def record_closed_trends(dest_table, sketches, trend_stats):
+    """Ajoute aux sketches les tendances clôturées du lot (toutes sauf la dernière) et persiste."""
+    sketches.add(trend_stats.iloc[:-1])
+    save_sketches(dest_table, sketches)
+    return sketches
+
+
+if __name__ == "__main__":
+    # Reconstruction complète : python trend_sketch.py [table_destination ...]
+    import sys
+    from supabase_client import get_client
+    from main_supabase import TABLES_MAP
+
+    supabase = get_client()
+    for dest_table in sys.argv[1:] or TABLES_MAP.values():
+        rebuild_sketches(supabase, dest_table)
@@ -2,8 +2,9 @@
 import pandas as pd
 import numpy as np
 from datetime import timedelta
-import ta
 from supabase_client import get_supabase_connection
+from price_mirror import sync_and_read
+from indicators import IndicatorEngine
 
 
 
@@ -17,7 +18,7 @@ def get_interval(table_name: str, unit: str = "minutes") -> int:
     ou converti dans une autre unité : 'seconds', 'hours', 'days', etc.
     """
     base_minutes = {
-        'bitcoint_prices_minits': 1,
+        'bitcoin_prices_minits': 1,
         'btc_t15': 15,
         'btc_h': 60,
         'btc_d': 1440,
@@ -48,14 +49,11 @@ def get_interval(table_name: str, unit: str = "minutes") -> int:
 # 1 - Récupération des données dans la database et génération DataFrame
 ###----------------------------------------------------------------------------------
 def add_primary_kpis(table_name: str) -> pd.DataFrame:
-    ### Connexion à la base Supabae ###
+    ### Connexion à la base Supabae (synchronisation delta du miroir local) ###
     supabase = get_supabase_connection()
-    query = f"SELECT * FROM {table_name};"
-    response = supabase.postgrest.rpc("execute_sql", {"query": query}).execute()
-    if not response.data:
+    df = sync_and_read(supabase, table_name)
+    if df.empty:
         raise ValueError(f"⛔ Aucun enregistrement trouvé dans {table_name}")
-    else:
-        df = pd.DataFrame(response.data)
     
     df['date'] = pd.to_datetime(df['date'])
     df.attrs["interval"] = get_interval(table_name)
@@ -76,7 +74,16 @@ def add_primary_kpis(table_name: str) -> pd.DataFrame:
     date_range = pd.date_range(start=df['date'].min(), end=df['date'].max(), freq=freq)
     missing_dates = date_range.difference(df['date'])
     
-    if table_name == "bitcoin_prices_minits":
+    if table_name == "bitcoin_prices_minits" and getattr(supabase, "supports_pushdown", False):
+        # Détection des trous poussée en SQL (backend embarqué)
+        gaps = supabase.gaps(table_name, 60)
+        for before, after in gaps:
+            print(f"☢️ Période manquante : {pd.Timestamp(before) + timedelta(minutes=1)} "
+                  f"à {pd.Timestamp(after) - timedelta(minutes=1)}")
+        if gaps:
+            raise ValueError("⛔ Traitement interrompu : incohérence des données.")
+
+    elif table_name == "bitcoin_prices_minits":
         date_range = pd.date_range(start=df['date'].min(), end=df['date'].max(), freq='min')
         missing_dates = date_range.difference(df['date'])
 
@@ -102,54 +109,8 @@ def add_primary_kpis(table_name: str) -> pd.DataFrame:
     df['Hour'] = df['date'].dt.hour
     df['Minute'] = df['date'].dt.minute
 
-    # EMA dynamiques
-    ema_windows = [7, 20, 99]
-    ema_cols = []
-
-    for w in ema_windows:
-        if len(df) >= w:
-            col_name = f"ema_{w}"
-            df[col_name] = ta.trend.ema_indicator(close=df["close"], window=w, fillna=False)
-            ema_cols.append(col_name)
-
-    # Stocker dynamiquement les EMA réellement créées
-    df.attrs["ema_cols"] = ema_cols
-
-
-    # MACD
-    macd = ta.trend.MACD(
-        close=df["close"],
-        window_slow=26,
-        window_fast=12,
-        window_sign=9,
-        fillna=False
-    )
-    df["macd"] = macd.macd()
-    df["macd_signal"] = macd.macd_signal()
-
-    # RSI
-    df["rsi"] = ta.momentum.rsi(close=df["close"], window=14, fillna=False)
-
-    # Bollinger
-    boll = ta.volatility.BollingerBands(close=df["close"], window=20, window_dev=2, fillna=False)
-    df["boll_b"] = boll.bollinger_pband()
-
-    # Stoch RSI
-    df["stoch_rsi"] = ta.momentum.stochrsi(close=df["close"], window=14, smooth1=3, smooth2=3, fillna=False)
-
-    # Moyenne mobile volume
-    df["volume_ma20"] = df["volume"].rolling(window=20).mean()
-
-    # Analyse chandelle
-    df["body_size"] = df["close"] - df["open"]
-    df["amplitude"] = df["high"] - df["low"]
-    df["upper_wick"] = df["high"] - df[["close", "open"]].max(axis=1)
-    df["lower_wick"] = df[["close", "open"]].min(axis=1) - df["low"]
-    df["efficiency_ratio"] = np.where(df["amplitude"] != 0, df["body_size"].abs() / df["amplitude"], 0)
-
-    # Variations %
-    for col in ["open", "high", "low", "close", "volume", "body_size", "amplitude"]:
-        df[f"{col}_pct_change_1"] = df[col].pct_change()
+    # Indicateurs techniques + analyse chandelle (moteur incrémental partagé)
+    df = IndicatorEngine().compute(df)
 
     return df
 
@@ -213,45 +174,73 @@ def clean_indicators(df: pd.DataFrame) -> pd.DataFrame:
 ###----------------------------------------------------------------------------------
 # 3 - Création fonction révélatrice des tendances et étiquettage
 ###----------------------------------------------------------------------------------
-def compute_trend_count(df, start_id=0):
+def compute_trend_count(df, start_id=0, carry=None):
     """
     Ajoute trend_id et trend_count. Reprend à partir de start_id si mode incrémental.
-    """
-    trend_ids = [start_id]
-    trend_count = [0]
-    current_id = start_id
-    current_count = 0
-    last_direction = None
-
-    for i in range(1, len(df)):
-        prev_close = df["close"].iloc[i - 1]
-        curr_close = df["close"].iloc[i]
-
-        if curr_close > prev_close:
-            direction = 1
-        elif curr_close < prev_close:
-            direction = -1
-        else:
-            direction = last_direction if last_direction is not None else 0
 
-        # Incrémente trend_id si la direction change
-        if direction != last_direction and last_direction is not None:
-            current_id += 1
-            current_count = 0  # Reset compteur
-
-        # Sinon, on poursuit la tendance
-        if direction == last_direction:
-            current_count += 1
-        else:
-            current_count = 0
-
-        trend_ids.append(current_id)
-        trend_count.append(current_count)
-        last_direction = direction
+    Version vectorisée (NumPy) de la boucle ligne à ligne :
+    - direction = signe de la variation de close, les variations nulles héritant
+      de la direction précédente (forward-fill, 0 tant qu'aucune direction n'existe) ;
+    - trend_id = start_id + somme cumulée des changements de direction ;
+    - trend_count = position de la bougie dans sa séquence de direction.
 
+    `carry` (optionnel) : état laissé par un passage précédent
+    {"last_close", "last_direction", "trend_count"} ; la première bougie est alors
+    comparée à last_close et poursuit la tendance start_id au lieu d'en ouvrir une.
+    La direction finale est exposée dans df.attrs["trend_direction"].
+    """
+    close = df["close"].to_numpy(dtype=np.float64)
+    if carry is None:
+        trend_ids, trend_count, direction = _trend_labels(close, start_id)
+    else:
+        trend_ids, trend_count, direction = _trend_labels(
+            close,
+            start_id,
+            prev_close=carry["last_close"],
+            last_direction=carry["last_direction"],
+            last_count=carry["trend_count"],
+        )
     df["trend_id"] = trend_ids
     df["trend_count"] = trend_count
+    df.attrs["trend_direction"] = direction
     return df
+
+
+def _trend_labels(close, start_id=0, prev_close=None, last_direction=None, last_count=0):
+    """Retourne (trend_ids, trend_counts, direction finale) pour le tableau `close`."""
+    n = len(close)
+    if prev_close is None:
+        # Sans historique, la première bougie ouvre la tendance start_id
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), None
+        ids, counts, direction = _trend_labels(close[1:], start_id, prev_close=close[0])
+        return np.r_[start_id, ids], np.r_[0, counts], direction
+
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), last_direction
+
+    # Direction de chaque bougie (NaN traité comme une variation nulle)
+    diff = close - np.r_[prev_close, close[:-1]]
+    raw = np.where(diff > 0, 1, np.where(diff < 0, -1, 0))
+    positions = np.arange(n)
+    last_move = np.where(raw != 0, positions, -1)
+    np.maximum.accumulate(last_move, out=last_move)
+    seed = last_direction if last_direction is not None else 0
+    direction = np.where(last_move >= 0, raw[np.maximum(last_move, 0)], seed)
+
+    # Changement de direction (jamais sur la première comparaison sans direction connue)
+    change = np.zeros(n, dtype=bool)
+    change[0] = last_direction is not None and direction[0] != last_direction
+    change[1:] = direction[1:] != direction[:-1]
+    trend_ids = start_id + np.cumsum(change)
+
+    # Compteur : remis à 0 à chaque changement (et sur la première comparaison)
+    reset = change.copy()
+    reset[0] |= last_direction is None
+    run_start = np.where(reset, positions, -1)
+    np.maximum.accumulate(run_start, out=run_start)
+    trend_count = np.where(run_start >= 0, positions - run_start, last_count + 1 + positions)
+    return trend_ids, trend_count, int(direction[-1])
 # ************************************************************************
 #   SCRIPTS CONTROLES JUSQU'ICI (14/07/2025 - 09:30:00 UTC+2)
 # ************************************************************************
@@ -260,7 +249,7 @@ def compute_trend_count(df, start_id=0):
 # 4 - Fonction d'extraction par tendance
 # Note : Cette fonction remplace l'ancienne version low-res, car la durée est désormais fiable via ("date", "count")
 ###----------------------------------------------------------------------------------
-def extract_trend_stats(df: pd.DataFrame) -> pd.DataFrame:
+def extract_trend_stats(df: pd.DataFrame, sketches=None) -> pd.DataFrame:
     """
     Extrait les statistiques clés de chaque tendance identifiée par trend_id.
 
@@ -276,15 +265,20 @@ def extract_trend_stats(df: pd.DataFrame) -> pd.DataFrame:
     - Scores dérivés : trend_efficiency, risk_score, trend_score
     - Signal recalibré (STRONG / MEDIUM / WEAK)
     - Type de tendance (Haussière, Baissière, Neutre)
+
+    `sketches` (trend_sketch.TrendSketches, optionnel) : distributions globales de la
+    table de destination, pour des scores et seuils comparables à l'historique.
     """
 
     if "interval" not in df.attrs:
         raise ValueError("⛔ df.attrs['interval'] est requis pour normaliser le slope.")
 
-    interval = df.attrs["interval"]
+    return finalize_trend_stats(aggregate_trends(df), df.attrs["interval"], sketches)
+
 
-    # Agrégation des tendances par trend_id
-    stats = df.groupby("trend_id").agg(
+def aggregate_trends(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrégation des tendances par trend_id (colonnes brutes, sans scores)."""
+    return df.groupby("trend_id").agg(
         start_time=("date", "first"),
         end_time=("date", "last"),
         duration=("date", "count"),  # nombre de bougies réelles
@@ -294,6 +288,16 @@ def extract_trend_stats(df: pd.DataFrame) -> pd.DataFrame:
         min_price=("low", "min")
     ).reset_index()
 
+
+def finalize_trend_stats(stats: pd.DataFrame, interval, sketches=None) -> pd.DataFrame:
+    """
+    Calcule les colonnes dérivées (pente, scores, signal, type) à partir des agrégats.
+
+    Sans `sketches`, normalisation et seuils sont calculés sur le seul lot. Avec,
+    ils reposent sur les distributions globales de la table (maxima courants, t-digests).
+    """
+    stats = stats.copy()
+
     # --- Calculs dérivés ---
     stats["delta_price"] = stats["end_price"] - stats["start_price"]
     stats["log_delta_price"] = np.log(stats["end_price"] / stats["start_price"])
@@ -309,14 +313,22 @@ def extract_trend_stats(df: pd.DataFrame) -> pd.DataFrame:
                                    stats["amplitude_slope"] / abs(stats["slope"]), 0)
 
     # --- Trend Score (inchangé) ---
-    norm_slope = stats["slope"].abs() / (stats["slope"].abs().max() + 1e-9)
-    norm_risk = stats["risk_score"] / (stats["risk_score"].max() + 1e-9)
+    max_abs_slope = stats["slope"].abs().max()
+    max_risk = stats["risk_score"].max()
+    if sketches is not None:
+        max_abs_slope = max(max_abs_slope, sketches.max_abs_slope)
+        max_risk = max(max_risk, sketches.max_risk)
+    norm_slope = stats["slope"].abs() / (max_abs_slope + 1e-9)
+    norm_risk = stats["risk_score"] / (max_risk + 1e-9)
     norm_efficiency = stats["trend_efficiency"]
     stats["trend_score"] = ((norm_slope * 0.5) + (norm_efficiency * 0.4) - (norm_risk * 0.1)) * 100
 
     # --- Signal recalibré (dynamique par quantiles) ---
-    p50 = stats["trend_score"].quantile(0.50)
-    p75 = stats["trend_score"].quantile(0.75)
+    if sketches is not None and sketches.count:
+        p50, p75 = sketches.score.quantile([0.50, 0.75])
+    else:
+        p50 = stats["trend_score"].quantile(0.50)
+        p75 = stats["trend_score"].quantile(0.75)
 
     def classify_signal(score):
         if score >= p75:
@@ -330,7 +342,11 @@ def extract_trend_stats(df: pd.DataFrame) -> pd.DataFrame:
 
     # --- Classification tendance avec seuil adaptatif ---
     stats["slope_pct"] = stats["delta_price"] / stats["start_price"]
-    threshold = max(stats["slope_pct"].abs().median() * 0.5, 0.0001)
+    if sketches is not None and sketches.count:
+        median_slope_pct = sketches.abs_slope_pct.quantile(0.50)
+    else:
+        median_slope_pct = stats["slope_pct"].abs().median()
+    threshold = max(median_slope_pct * 0.5, 0.0001)
 
     def classify_trend(row):
         if row["slope_pct"] > threshold:
@@ -1,7 +1,7 @@
 from supabase_client import login_user
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import pandas as pd
+from paginated_reader import iter_pages, fold_ohlcv
 import os
 from dotenv import load_dotenv
 
@@ -25,30 +25,21 @@ def main():
     print(f"📌 Agrégation annuelle pour : {segment_start} → {segment_end}")
 
     try:
-        # 1. Récupération des bougies minute
-        response = supabase.table("bitcoin_prices_minits") \
-            .select("*") \
-            .gte("date", segment_start.isoformat()) \
-            .lt("date", segment_end.isoformat()) \
-            .execute()
+        # 1. Lecture paginée des bougies minute (keyset sur date, mémoire constante)
+        pages = iter_pages(
+            supabase,
+            "bitcoin_prices_minits",
+            start=segment_start.isoformat(),
+            end=segment_end.isoformat()
+        )
 
-        if not response.data or len(response.data) == 0:
+        # 2. Agrégation annuelle, page par page
+        agg = fold_ohlcv(pages, lambda d: d.dt.to_period('Y').dt.start_time)
+
+        if agg.empty:
             print("⚠️ Aucune donnée trouvée pour cette année.")
             return
 
-        df = pd.DataFrame(response.data)
-        df['date'] = pd.to_datetime(df['date'])
-
-        # 2. Agrégation annuelle
-        df['slot'] = df['date'].dt.to_period('Y').apply(lambda r: r.start_time)
-        agg = df.groupby('slot').agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).reset_index()
-
         # 3. Préparer pour Supabase
         records = []
         for _, row in agg.iterrows():
@@ -0,0 +1,148 @@
+import threading
+import time
+
+
+###----------------------------------------------------------------------------------
+# File d'écriture différée (write-behind) pour les bougies reçues par WebSocket
+# La réception (thread WebSocket) ne fait que déposer la bougie en mémoire ;
+# un thread dédié regroupe les mises à jour et les écrit en un seul upsert.
+###----------------------------------------------------------------------------------
+class WriteBehindQueue:
+    """
+    File en mémoire qui fusionne les mises à jour par clé (heure d'ouverture
+    de la bougie) et ne conserve que le dernier état.
+
+    - Une bougie clôturée (closed=True) déclenche un flush immédiat.
+    - Les bougies encore ouvertes sont écrites toutes les `flush_interval` secondes.
+    - `flush_fn(records)` reçoit la liste des enregistrements triés par clé
+      et doit lever une exception en cas d'échec : les lignes sont alors
+      remises en file (sauf si un état plus récent est arrivé entre-temps).
+    """
+
+    def __init__(self, flush_fn, flush_interval=10.0, max_batch=500):
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._urgent = False
+        self._running = False
+        self._thread = None
+
+        self.stats = {
+            "received": 0,
+            "coalesced": 0,
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "rows_flushed": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Côté réception (thread WebSocket) : O(1), jamais bloquant sur la DB
+    # ------------------------------------------------------------------
+    def submit(self, key, record, closed=False):
+        with self._cond:
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+            self._pending[key] = record
+            self.stats["received"] += 1
+            self._update_depth()
+            if closed or len(self._pending) >= self.max_batch:
+                self._urgent = True
+                self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # Côté écriture (thread dédié)
+    # ------------------------------------------------------------------
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush=True, timeout=10.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Écrit immédiatement tout ce qui est en attente. Retourne le nombre de lignes écrites."""
+        with self._cond:
+            batch = self._pending
+            self._pending = {}
+            self._urgent = False
+            self._update_depth()
+
+        if not batch:
+            return 0
+
+        keys = sorted(batch)
+        records = [batch[k] for k in keys]
+        t0 = time.perf_counter()
+        try:
+            self.flush_fn(records)
+        except Exception as e:
+            self._requeue(batch)
+            self.stats["flush_errors"] += 1
+            print(f"❌ Échec du flush ({len(records)} lignes remises en file) :", e)
+            return 0
+
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        self._record_flush(len(records), elapsed_ms)
+        return len(records)
+
+    def snapshot_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+        stats["avg_flush_ms"] = stats["total_flush_ms"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            with self._cond:
+                while self._running and not self._urgent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._running:
+                    return
+
+            self.flush()
+            deadline = time.monotonic() + self.flush_interval
+
+    def _requeue(self, batch):
+        with self._cond:
+            for key, record in batch.items():
+                # Un état plus récent reçu pendant le flush est prioritaire
+                self._pending.setdefault(key, record)
+            self._update_depth()
+
+    def _record_flush(self, size, elapsed_ms):
+        with self._cond:
+            s = self.stats
+            s["flushes"] += 1
+            s["rows_flushed"] += size
+            s["last_flush_size"] = size
+            s["max_flush_size"] = max(s["max_flush_size"], size)
+            s["last_flush_ms"] = elapsed_ms
+            s["max_flush_ms"] = max(s["max_flush_ms"], elapsed_ms)
+            s["total_flush_ms"] += elapsed_ms
+
+    def _update_depth(self):
+        depth = len(self._pending)
+        self.stats["queue_depth"] = depth
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
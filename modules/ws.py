@@ -6,7 +6,10 @@ import datetime
 import time
 from zoneinfo import ZoneInfo
 import os
-from supabase import create_client, Client
+from supabase import Client
+from supabase_client import login_user, print_call_stats
+from write_behind import WriteBehindQueue
+from spool import KlineSpool, SpoolDrainer, SPOOL_DIR
 
 # Paramètres Supabase
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
@@ -14,29 +17,21 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 SUPABASE_EMAIL = os.environ.get("SUPABASE_EMAIL")
 SUPABASE_PASSWORD = os.environ.get("SUPABASE_PASSWORD")
 
+# Intervalle (secondes) d'écriture des bougies encore ouvertes
+FLUSH_INTERVAL = float(os.environ.get("WS_FLUSH_INTERVAL", "10"))
+# Journal disque des bougies (rejoué vers Supabase après une coupure)
+SPOOL_PATH = os.environ.get("WS_SPOOL_PATH", os.path.join(SPOOL_DIR, "bitcoin_prices_minits.spool"))
+
 for var in ["SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_EMAIL", "SUPABASE_PASSWORD"]:
     if not os.environ.get(var):
         print(f"[WARNING] Variable d'environnement '{var}' non définie !")
 
-# Authentification Supabase avec attachement du token
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-auth_response = supabase.auth.sign_in_with_password({
-    "email": SUPABASE_EMAIL,
-    "password": SUPABASE_PASSWORD
-})
-
-# Session avec token JWT
-if auth_response.session:
-    supabase.auth.set_session(
-        auth_response.session.access_token,
-        auth_response.session.refresh_token
-    )
-    print("Authentification réussie et session active")
-else:
+# Authentification Supabase : client partagé (session persistée, rafraîchie avant expiration)
+supabase: Client = login_user(SUPABASE_EMAIL, SUPABASE_PASSWORD)
+if supabase is None:
     print("Authentification échouée")
     exit(1)
-if auth_response.session is None:
-    print("❌ Aucun token reçu. L’authentification a échoué.")
+print("Authentification réussie et session active")
 
     
 # -----------------------------------------------------------------------------------
@@ -46,24 +41,42 @@ running = True
 ws = None
 
 # -----------------------------------------------------------------------------------
-# Fonction d'enregistrement des données dans Supabase
+# Fonctions d'enregistrement des données dans Supabase
 # -----------------------------------------------------------------------------------
 
-def save_to_supabase(timestamp, open_price, high_price, low_price, close_price, volume):
-    try:
-        date = datetime.datetime.fromtimestamp(timestamp / 1000, tz=ZoneInfo("Europe/Paris")).isoformat()
-        data = {
-            "date": date,
-            "open": round(open_price, 3),
-            "high": round(high_price, 3),
-            "low": round(low_price, 3),
-            "close": round(close_price, 3),
-            "volume": round(volume, 3)
-        }
-        response = supabase.table("bitcoin_prices_minits").upsert(data, on_conflict="date").execute()
-        print("✅ Données insérées :", response.data)
-    except Exception as e:
-        print("❌ Erreur d'insertion Supabase :", e)
+def build_record(timestamp, open_price, high_price, low_price, close_price, volume):
+    date = datetime.datetime.fromtimestamp(timestamp / 1000, tz=ZoneInfo("Europe/Paris")).isoformat()
+    return {
+        "date": date,
+        "open": round(open_price, 3),
+        "high": round(high_price, 3),
+        "low": round(low_price, 3),
+        "close": round(close_price, 3),
+        "volume": round(volume, 3)
+    }
+
+
+def save_batch_to_supabase(records):
+    """Upsert groupé : une seule requête PostgREST par lot (lève une exception en cas d'échec)."""
+    supabase.table("bitcoin_prices_minits").upsert(records, on_conflict="date").execute()
+    stats = write_queue.snapshot_stats()
+    print(f"✅ {len(records)} bougie(s) insérée(s) | dernière : {records[-1]['date']} "
+          f"| file : {stats['queue_depth']} | flush moyen : {stats['avg_flush_ms']:.0f} ms "
+          f"| spool : {drainer.lag_records()} en attente")
+
+
+def spool_candles(candles):
+    """Flush de la file : écriture disque (un fsync par lot) puis réveil du drainer."""
+    spool.append_many(candles)
+    drainer.notify()
+
+
+# Chaîne d'écriture : WebSocket → file en mémoire → spool disque → drainer → Supabase
+# Le thread WebSocket ne bloque jamais sur la base, et une panne Supabase ne perd
+# plus de bougies : elles restent dans le spool et sont rejouées au retour du service.
+spool = KlineSpool(SPOOL_PATH)
+drainer = SpoolDrainer(spool, build_record, save_batch_to_supabase)
+write_queue = WriteBehindQueue(spool_candles, flush_interval=FLUSH_INTERVAL)
 
 
 # -----------------------------------------------------------------------------------
@@ -74,14 +87,18 @@ def on_message(ws, message):
         data = json.loads(message)
         if "e" in data and data["e"] == "kline":
             candle = data["k"]
-            save_to_supabase(
-                timestamp=candle["t"],
-                open_price=float(candle["o"]),
-                high_price=float(candle["h"]),
-                low_price=float(candle["l"]),
-                close_price=float(candle["c"]),
-                volume=float(candle["v"])
+            closed = bool(candle.get("x"))
+            row = (
+                candle["t"],
+                float(candle["o"]),
+                float(candle["h"]),
+                float(candle["l"]),
+                float(candle["c"]),
+                float(candle["v"]),
+                closed
             )
+            # Bougie clôturée (x == True) : écriture immédiate, sinon à l'intervalle
+            write_queue.submit(candle["t"], row, closed=closed)
         else:
             print("Message ignoré :", data)
     except Exception as e:
@@ -133,12 +150,23 @@ def stop_websocket(signal_received=None, frame=None):
     running = False
     if ws:
         ws.close()
+    write_queue.stop(flush=True)
+    drainer.stop(drain=True)
+    spool.close()
+    print("📊 Statistiques d'écriture :", write_queue.snapshot_stats())
+    print("📊 Statistiques du spool :", drainer.stats)
+    print_call_stats()
     time.sleep(1)
     os._exit(0)
 
 # -----------------------------------------------------------------------------------
 # Lancement
 # -----------------------------------------------------------------------------------
+if drainer.lag_records():
+    print(f"⏩ {drainer.lag_records()} bougies en attente dans le spool, rattrapage en cours")
+drainer.start()
+write_queue.start()
+
 websocket_thread = threading.Thread(target=start_websocket)
 websocket_thread.daemon = True
 websocket_thread.start()